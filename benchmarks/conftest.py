@@ -0,0 +1,56 @@
+"""Benchmark configuration.
+
+The benchmarks use pytest-benchmark. Run them and save the results
+with
+
+    pytest benchmarks --benchmark-autosave
+
+Results are stored in .benchmarks, and a run can be compared with the
+last saved run, e.g. of the previous release, with
+
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+
+The stand-alone scripts in this directory are not collected.
+"""
+
+import itertools
+import os
+
+import pytest
+from click.testing import CliRunner
+
+collect_ignore = ["schema_cache.py", "yaml_loader.py"]
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    """Use a temporary user cache directory, warm across rounds."""
+    p = tmp_path_factory.getbasetemp() / "cache"
+    monkeypatch.setenv("NBIS_ADMIN_CACHE_DIR", str(p))
+    return p
+
+
+@pytest.fixture
+def runner():
+    """Base client runner."""
+    return CliRunner(mix_stderr=False)
+
+
+@pytest.fixture
+def fresh_dir(tmp_path):
+    """Return function that creates a new directory for every round."""
+    counter = itertools.count()
+
+    def make(name="project_foo"):
+        path = tmp_path / f"round{next(counter)}" / name
+        path.parent.mkdir()
+        return path
+
+    return make
+
+
+@pytest.fixture
+def chdir(monkeypatch):
+    """Return function that changes directory for the benchmark."""
+    monkeypatch.chdir(os.curdir)
+    return os.chdir
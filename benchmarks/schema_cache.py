@@ -0,0 +1,49 @@
+"""Micro-benchmark of schema loading with and without caching.
+
+Run as
+
+    python benchmarks/schema_cache.py
+
+Reports the time per call of ``get_schema`` and ``load_config``
+without cache, with the on-disk cache only (as in a fresh process),
+and with the process-level cache.
+"""
+
+import os
+import tempfile
+import timeit
+
+from nbis.config import clear_schema_cache, get_schema, load_config
+
+
+def bench(label, stmt, setup=None, number=200):
+    """Time stmt and print time per call."""
+    setup = setup or (lambda: None)
+    timer = timeit.Timer(stmt, setup=setup)
+    t = min(timer.repeat(repeat=5, number=number)) / number
+    print(f"{label:<40} {t * 1e6:10.1f} us")
+
+
+def main():
+    """Run benchmarks."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ["NBIS_ADMIN_CACHE_DIR"] = tmpdir
+
+        bench("get_schema (no cache)", lambda: get_schema(use_cache=False))
+
+        def disk_only():
+            clear_schema_cache()
+            get_schema()
+
+        get_schema()
+        bench("get_schema (disk cache)", disk_only)
+        bench("get_schema (process cache)", get_schema, number=10000)
+        bench(
+            "load_config (process cache)",
+            lambda: load_config(data={"project_name": "foo"}),
+            number=10000,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Benchmark CLI startup."""
+
+import subprocess
+import sys
+
+import pytest
+
+from nbis.cli import cli
+
+pytest.importorskip("pytest_benchmark")
+
+
+def _run(*args):
+    subprocess.run(
+        [sys.executable, "-c", "from nbis.cli import cli; cli()", *args],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def test_cold_start_help(benchmark):
+    """Fresh interpreter running nbis-admin --help."""
+    benchmark.pedantic(_run, args=("--help",), rounds=10, warmup_rounds=1)
+
+
+def test_cold_start_command_help(benchmark):
+    """Fresh interpreter running nbis-admin add --help."""
+    benchmark.pedantic(_run, args=("add", "--help"), rounds=10, warmup_rounds=1)
+
+
+def test_help(benchmark, runner):
+    """In-process nbis-admin --help."""
+    result = benchmark(runner.invoke, cli, ["--help"])
+    assert not result.exception
@@ -0,0 +1,39 @@
+"""Benchmark configuration loading and schema handling."""
+
+import pytest
+
+from nbis.config import get_schema, load_config
+
+HEADER = """project_name: foo
+docs:
+  src: docs
+samples:
+"""
+
+SAMPLE = """  - SM: sample{i}
+    fastq: data/raw/sample{i}_R1.fastq.gz
+    depth: {i}
+"""
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.mark.parametrize("nsamples", [0, 100, 10000])
+def test_load_config(benchmark, tmp_path, nsamples):
+    """Load and validate configuration files of growing size."""
+    path = tmp_path / "config.yaml"
+    path.write_text(HEADER + "".join(SAMPLE.format(i=i) for i in range(nsamples)))
+    config = benchmark(load_config, file=path)
+    assert len(config["samples"] or []) == nsamples
+
+
+def test_load_config_data(benchmark):
+    """Load and validate the default configuration, as the CLI does."""
+    benchmark(load_config, data={"project_name": "nbis-admin"})
+
+
+@pytest.mark.parametrize("example", [False, True])
+def test_dump_properties(benchmark, example):
+    """Dump configuration schema properties with comments."""
+    schema = get_schema()
+    benchmark(schema.dump_properties, example=example)
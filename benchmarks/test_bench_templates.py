@@ -0,0 +1,72 @@
+"""Benchmark template rendering and scaffolding."""
+
+import pytest
+
+from nbis import templates
+from nbis.cli import cli
+
+CONTEXT = {
+    "project_directory": "project_foo",
+    "project_name": "project_foo",
+    "python_module": "project_foo",
+    "repo_name": "project_foo",
+    "description": "Project foo",
+    "author": "John Doe",
+    "open_source_license": "MIT",
+    "version": "0.1",
+    "config_file": "project_foo.yaml",
+}
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.mark.parametrize(
+    "template",
+    [
+        "src/python_module/cli.py.j2",
+        "src/python_module/config.py.j2",
+        "src/python_module/core/snakemake.py.j2",
+    ],
+)
+def test_render_template(benchmark, template):
+    """Render a single template."""
+    benchmark(templates.render_template, template, **CONTEXT)
+
+
+def test_multi_add(benchmark, fresh_dir):
+    """Scaffold the top-level files of a project."""
+    files = ["README.md", "pyproject.toml", ".gitignore", ".pre-commit-config.yaml"]
+
+    def setup():
+        return (fresh_dir(),), {"files": files, **CONTEXT}
+
+    benchmark.pedantic(templates.multi_add, setup=setup, rounds=20)
+
+
+def test_init(benchmark, runner, fresh_dir):
+    """Initialize a full project."""
+
+    def setup():
+        return (cli, ["init", str(fresh_dir())]), {}
+
+    result = benchmark.pedantic(runner.invoke, setup=setup, rounds=20)
+    assert not result.exception
+
+
+def test_smk_add(benchmark, runner, fresh_dir, chdir):
+    """Add 100 snakemake commands to a project in one call."""
+    commands = [f"cmd{i}" for i in range(100)]
+
+    def setup():
+        project = fresh_dir()
+        config = project / "src" / "nbis-admin" / "snakemake" / "config.py"
+        config.parent.mkdir(parents=True)
+        config.touch()
+        (project / "pyproject.toml").write_text('[project]\nname = "project_foo"\n')
+        spec = project / "commands.yaml"
+        spec.write_text("".join(f"- {c}\n" for c in commands))
+        chdir(project)
+        return (cli, ["smk", "add", "--spec", str(spec)]), {}
+
+    result = benchmark.pedantic(runner.invoke, setup=setup, rounds=5)
+    assert not result.exception
@@ -0,0 +1,71 @@
+"""Benchmark of safe and round-trip configuration loading.
+
+Run as
+
+    python benchmarks/yaml_loader.py
+
+Generates configuration files from 1 KB to 10 MB, with a growing
+sample section, and reports the time to load them with
+``Config(file=...)`` in the default (safe, C-based if available) and
+round-trip modes.
+"""
+
+import os
+import tempfile
+import time
+
+from nbis.config import Config
+
+SIZES = [1 << 10, 10 << 10, 100 << 10, 1 << 20, 10 << 20]
+
+HEADER = """# Project configuration
+project_name: foo
+docs:
+  src: docs
+webexport:
+  url: null
+samples:
+"""
+
+SAMPLE = """  - SM: sample{i}
+    name: alternative name {i}
+    fastq: data/raw/sample{i}_R1.fastq.gz
+    depth: {i}
+"""
+
+
+def make_config(path, size):
+    """Write configuration file of approximately size bytes."""
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(HEADER)
+        i = 0
+        while fh.tell() < size:
+            fh.write(SAMPLE.format(i=i))
+            i += 1
+
+
+def timeit(path, roundtrip, repeat=3):
+    """Return best time of repeat loads."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        Config(file=path, roundtrip=roundtrip)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    """Run benchmarks."""
+    print(f"{'size':>10} {'safe (s)':>12} {'roundtrip (s)':>14} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in SIZES:
+            path = os.path.join(tmpdir, f"config-{size}.yaml")
+            make_config(path, size)
+            repeat = 1 if size > (1 << 20) else 3
+            fast = timeit(path, roundtrip=False, repeat=repeat)
+            slow = timeit(path, roundtrip=True, repeat=repeat)
+            print(f"{size:>10} {fast:>12.4f} {slow:>14.4f} {slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Build hook that ships precompiled templates with wheels.
+
+All jinja templates in src/nbis/templates are compiled to Python
+modules in nbis/_templates, which nbis.templates loads with a
+ModuleLoader. The modules are byte-compiled on installation.
+The package itself is not imported, since its version file may not
+exist yet when the hook runs.
+"""
+
+import os
+import shutil
+import tempfile
+
+from hatchling.builders.hooks.plugin.interface import BuildHookInterface
+from jinja2 import Environment, FileSystemLoader
+
+
+class TemplateBundleHook(BuildHookInterface):
+    """Compile templates into a bundle included in the wheel."""
+
+    PLUGIN_NAME = "custom"
+
+    def initialize(self, version, build_data):
+        if self.target_name != "wheel" or version == "editable":
+            return
+        self._tmpdir = tempfile.mkdtemp()
+        bundle = os.path.join(self._tmpdir, "_templates")
+        templates = os.path.join(self.root, "src", "nbis", "templates")
+        Environment(loader=FileSystemLoader(templates)).compile_templates(
+            bundle,
+            zip=None,
+            filter_func=lambda name: name.endswith(".j2"),
+            ignore_errors=False,
+        )
+        build_data["force_include"][bundle] = "nbis/_templates"
+
+    def finalize(self, version, build_data, artifact_path):
+        if getattr(self, "_tmpdir", None):
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
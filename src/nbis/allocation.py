@@ -0,0 +1,224 @@
+"""CPU and memory allocation of the current process.
+
+Interactive nodes are often shared, with the resources of a session
+limited by cgroups rather than by the number of CPUs in the machine.
+:func:`detect_allocation` reads the CPU quota and memory limits of the
+cgroup v2 hierarchy of the current process, and the CPUs the process
+may run on, as given by :func:`os.sched_getaffinity`.
+
+:func:`auto_size` uses the allocation to choose the number of cores,
+jobs or threads of a command such that the allocated CPUs are used
+without exceeding the memory limit. If the command has been run
+before, the peak memory of past runs, as recorded in the run history,
+limits the number of concurrent jobs.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import pathlib
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+PROC_CGROUP = "/proc/self/cgroup"
+PROC_MEMINFO = "/proc/meminfo"
+# Fraction of available memory that jobs may use
+MEMORY_FRACTION = 0.9
+# Number of recent successful runs used to estimate memory per job
+HISTORY_RUNS = 10
+
+
+@dataclass
+class Allocation:
+    """CPUs and memory available to the current process.
+
+    :param int cpus: Number of usable CPUs.
+    :param int memory: Available memory in bytes, or None if unknown.
+    :param str source: Where the limits come from, for logging.
+    """
+
+    cpus: int
+    memory: int = None
+    source: str = ""
+
+
+def _read(path):
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return fh.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_path(root=CGROUP_ROOT, proc_cgroup=PROC_CGROUP):
+    """Return cgroup v2 directory of the current process.
+
+    :return: Directory, or None if the process is not in a cgroup v2
+        hierarchy.
+    :rtype: pathlib.Path
+    """
+    text = _read(proc_cgroup)
+    if text is None:
+        return None
+    for line in text.splitlines():
+        hierarchy, _, path = line.split(":", 2)
+        if hierarchy == "0":
+            path = pathlib.Path(root) / path.lstrip("/")
+            return path if path.is_dir() else None
+    return None
+
+
+def _ancestors(path, root):
+    """Yield path and its parents up to and including root."""
+    root = pathlib.Path(root)
+    while True:
+        yield path
+        if path == root or path.parent == path:
+            return
+        path = path.parent
+
+
+def cgroup_cpu_limit(path, root=CGROUP_ROOT):
+    """Return CPU quota of a cgroup, in CPUs.
+
+    The quota is the smallest of the cpu.max quotas of the cgroup and
+    its ancestors, rounded up.
+
+    :param path: cgroup directory.
+    :return: Number of CPUs, or None if there is no quota.
+    """
+    limit = None
+    for d in _ancestors(pathlib.Path(path), root):
+        value = _read(d / "cpu.max")
+        if value is None:
+            continue
+        quota, _, period = value.partition(" ")
+        if quota == "max":
+            continue
+        cpus = max(1, math.ceil(int(quota) / int(period or 100000)))
+        limit = cpus if limit is None else min(limit, cpus)
+    return limit
+
+
+def cgroup_memory_available(path, root=CGROUP_ROOT):
+    """Return memory available to a cgroup, in bytes.
+
+    The limit is the smallest of memory.max and memory.high of the
+    cgroup and its ancestors, less the memory each of them already
+    uses.
+
+    :param path: cgroup directory.
+    :return: Available memory, or None if there is no limit.
+    """
+    available = None
+    for d in _ancestors(pathlib.Path(path), root):
+        for name in ("memory.max", "memory.high"):
+            value = _read(d / name)
+            if value is None or value == "max":
+                continue
+            free = int(value) - int(_read(d / "memory.current") or 0)
+            available = free if available is None else min(available, free)
+    return None if available is None else max(available, 0)
+
+
+def meminfo_available(proc_meminfo=PROC_MEMINFO):
+    """Return MemAvailable of /proc/meminfo in bytes, or None."""
+    text = _read(proc_meminfo)
+    for line in (text or "").splitlines():
+        if line.startswith("MemAvailable:"):
+            return int(line.split()[1]) * 1024
+    return None
+
+
+def affinity_cpus():
+    """Return number of CPUs the process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def detect_allocation(root=CGROUP_ROOT, proc_cgroup=PROC_CGROUP):
+    """Return the CPUs and memory available to the current process.
+
+    :param root: cgroup v2 mount point.
+    :param proc_cgroup: File listing the cgroups of the process.
+    :rtype: Allocation
+    """
+    cpus = affinity_cpus()
+    sources = [f"affinity {cpus}"]
+    memory = None
+    path = cgroup_path(root, proc_cgroup)
+    if path is not None:
+        quota = cgroup_cpu_limit(path, root)
+        if quota is not None:
+            sources.append(f"cgroup cpu.max {quota}")
+            cpus = min(cpus, quota)
+        memory = cgroup_memory_available(path, root)
+        if memory is not None:
+            sources.append("cgroup memory")
+    if memory is None:
+        memory = meminfo_available()
+        if memory is not None:
+            sources.append("meminfo")
+    return Allocation(cpus, memory, ", ".join(sources))
+
+
+def job_memory(command, history_path=None):
+    """Return peak memory of recent successful runs of a command.
+
+    :param str command: Command name in the run history.
+    :param history_path: Run history database; defaults to the project
+        run history.
+    :return: Peak memory in bytes, or None if the command has no
+        recorded runs.
+    """
+    # pylint: disable=import-outside-toplevel
+    import sqlite3
+
+    from . import runhistory
+
+    path = history_path or runhistory.history_path()
+    if path is None or not pathlib.Path(path).exists():
+        return None
+    try:
+        runs = runhistory.RunHistory(path).runs(command, limit=HISTORY_RUNS * 2)
+    except sqlite3.Error as e:
+        logger.debug("cannot read run history %s: %s", path, e)
+        return None
+    maxrss = [r.maxrss for r in runs if r.ok and r.maxrss][:HISTORY_RUNS]
+    return max(maxrss) * 1024 if maxrss else None
+
+
+def auto_size(kind, command=None, *, allocation=None, history_path=None):
+    """Return number of cores, jobs or threads that fits the allocation.
+
+    Cores and threads are set to the number of allocated CPUs. Jobs are
+    limited further, if the peak memory of past runs of command is
+    known, such that concurrent jobs fit in the available memory.
+
+    :param str kind: 'cores', 'jobs' or 'threads'.
+    :param str command: Command name in the run history.
+    :param Allocation allocation: Allocation; detected if None.
+    :param history_path: Run history database.
+    :rtype: int
+    """
+    allocation = allocation or detect_allocation()
+    value = allocation.cpus
+    reason = f"{allocation.cpus} cpus ({allocation.source})"
+    if kind == "jobs" and command is not None and allocation.memory is not None:
+        per_job = job_memory(command, history_path)
+        if per_job:
+            fit = max(1, int(allocation.memory * MEMORY_FRACTION // per_job))
+            if fit < value:
+                value = fit
+                reason += (
+                    f", {allocation.memory >> 20} MiB available and "
+                    f"{per_job >> 20} MiB peak per run of {command}"
+                )
+    logger.debug("auto %s: %i from %s", kind, value, reason)
+    return value
@@ -0,0 +1,59 @@
+"""Cache locations for nbis-admin.
+
+User-level caches live in ``$NBIS_ADMIN_CACHE_DIR`` if set, otherwise
+in ``$XDG_CACHE_HOME/nbis-admin`` (default ``~/.cache/nbis-admin``).
+Setting ``NBIS_ADMIN_NO_CACHE`` disables persistent caching.
+
+Project-level state, such as the last pushed webexport state, lives
+in the ``.nbis-admin`` directory in the project home.
+"""
+
+import hashlib
+import logging
+import os
+import pathlib
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = ".nbis-admin"
+CACHE_DIR_ENVVAR = "NBIS_ADMIN_CACHE_DIR"
+NO_CACHE_ENVVAR = "NBIS_ADMIN_NO_CACHE"
+
+
+def enabled():
+    """Return True if persistent caching is enabled."""
+    return not os.environ.get(NO_CACHE_ENVVAR)
+
+
+def user_cache_dir(*parts):
+    """Return user cache directory, optionally joined with parts.
+
+    The directory is not created.
+    """
+    root = os.environ.get(CACHE_DIR_ENVVAR)
+    if root is None:
+        xdg = os.environ.get("XDG_CACHE_HOME", pathlib.Path.home() / ".cache")
+        root = pathlib.Path(xdg) / "nbis-admin"
+    return pathlib.Path(root).joinpath(*parts)
+
+
+def project_cache_dir(home, *parts):
+    """Return project state directory, optionally joined with parts.
+
+    The directory is not created.
+    """
+    return pathlib.Path(home, PROJECT_DIR).joinpath(*parts)
+
+
+def file_digest(path):
+    """Return sha256 hex digest of file contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def key_digest(*parts):
+    """Return sha256 hex digest of string representations of parts."""
+    return hashlib.sha256("\0".join(str(p) for p in parts).encode()).hexdigest()
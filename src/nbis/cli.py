@@ -5,7 +5,7 @@ import os
 
 import click
 
-from nbis import decorators
+from nbis import decorators, manifest
 from nbis.env import Environment
 
 from . import __version__
@@ -23,23 +23,70 @@ cmd_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "commands")
 
 
 class NbisCLI(click.MultiCommand):
-    """NBIS CLI multicommand"""
+    """NBIS CLI multicommand
+
+    Commands are listed from the command manifest, if present, such
+    that help and shell completion do not need to import the command
+    modules. See :mod:`nbis.manifest`.
+    """
 
     module = "nbis.commands"
     cmd_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), "commands"))
 
+    @property
+    def manifest(self):
+        """Command manifest; empty if not available."""
+        return manifest.load_manifest(self.cmd_folder) or {}
+
     def list_commands(self, ctx):
-        data = []
-        for filename in os.listdir(self.cmd_folder):
-            if filename.endswith(".py") and not filename.startswith("__"):
-                data.append(filename[:-3])
-        data.sort()
-        return data
+        if self.manifest:
+            return sorted(self.manifest.keys())
+        return manifest.discover_commands(self.cmd_folder)
 
     def get_command(self, ctx, cmd_name):
-        mod = __import__(f"{self.module}.{cmd_name}", None, None, ["main"])
+        if self.manifest:
+            if cmd_name not in self.manifest:
+                return None
+            modname = self.manifest[cmd_name]["module"]
+        else:
+            modname = f"{self.module}.{cmd_name}"
+        mod = __import__(modname, None, None, ["main"])
         return mod.main
 
+    def _visible_commands(self):
+        return [
+            (name, entry)
+            for name, entry in sorted(self.manifest.items())
+            if not entry.get("hidden")
+        ]
+
+    def format_commands(self, ctx, formatter):
+        if not self.manifest:
+            super().format_commands(ctx, formatter)
+            return
+        commands = self._visible_commands()
+        if len(commands) == 0:
+            return
+        limit = formatter.width - 6 - max(len(name) for name, _ in commands)
+        rows = [(name, manifest.short_help(entry, limit)) for name, entry in commands]
+        with formatter.section("Commands"):
+            formatter.write_dl(rows)
+
+    def shell_complete(self, ctx, incomplete):
+        if not self.manifest:
+            return super().shell_complete(ctx, incomplete)
+        from click.shell_completion import (  # pylint: disable=import-outside-toplevel
+            CompletionItem,
+        )
+
+        results = [
+            CompletionItem(name, help=manifest.short_help(entry))
+            for name, entry in self._visible_commands()
+            if name.startswith(incomplete)
+        ]
+        results.extend(click.Command.shell_complete(self, ctx, incomplete))
+        return results
+
 
 @click.command(
     cls=NbisCLI,
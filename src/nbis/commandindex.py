@@ -0,0 +1,350 @@
+"""Index of command definitions in CLI modules.
+
+Commands are added to project CLI modules by appending rendered
+templates. :class:`CommandIndex` indexes the top-level functions and
+the click commands and groups defined in the command modules of a
+project, as parsed with :mod:`ast`. The index is cached and a module
+is only parsed again when its modification time or size changes.
+
+:class:`ModuleIndex` uses the indexed names of a module for conflict
+detection and collects new definitions such that many commands can be
+added with a single append to the module. Commands to add in a batch
+can be listed in a YAML file, see :func:`read_command_spec`.
+"""
+
+from __future__ import annotations
+
+import ast
+import json
+import logging
+import os
+import pathlib
+import re
+import tempfile
+from dataclasses import asdict, dataclass
+
+import click
+
+from nbis import cache
+from nbis.config import yaml_loader
+
+logger = logging.getLogger(__name__)
+
+DEF_REGEX = re.compile(r"^\s*(?:async\s+)?def\s+(\w+)\s*\(", re.MULTILINE)
+CLICK_DECORATORS = ("command", "group")
+CACHE_VERSION = 1
+
+
+@dataclass(frozen=True)
+class CommandEntry:
+    """Click command or group defined in a module.
+
+    :param str name: Command name, as used on the command line.
+    :param str function: Name of the decorated function.
+    :param str kind: 'command' or 'group'.
+    :param str parent: Name of the group the command is attached to,
+        or None for commands created with click.command/click.group.
+    :param int lineno: Line number of the function definition.
+    """
+
+    name: str
+    function: str
+    kind: str
+    parent: str | None
+    lineno: int
+
+
+def _decorator_kind(decorator):
+    """Return kind and parent of a click command decorator."""
+    func = decorator.func if isinstance(decorator, ast.Call) else decorator
+    if isinstance(func, ast.Attribute) and func.attr in CLICK_DECORATORS:
+        parent = func.value.id if isinstance(func.value, ast.Name) else None
+        if parent == "click":
+            parent = None
+        return func.attr, parent
+    if isinstance(func, ast.Name) and func.id in CLICK_DECORATORS:
+        return func.id, None
+    return None, None
+
+
+def _command_name(decorator, function):
+    """Return command name given to a click command decorator.
+
+    Defaults to the function name with underscores replaced by dashes,
+    as click does.
+    """
+    if isinstance(decorator, ast.Call):
+        for kw in decorator.keywords:
+            if kw.arg == "name" and isinstance(kw.value, ast.Constant):
+                return kw.value.value
+        if decorator.args and isinstance(decorator.args[0], ast.Constant):
+            return decorator.args[0].value
+    return function.lower().replace("_", "-")
+
+
+def parse_module(source, filename="<unknown>"):
+    """Return top-level functions and click commands defined in source.
+
+    :param str source: Python source.
+    :param str filename: File name used in messages.
+    :return: Function names and command entries.
+    :rtype: tuple[list[str], list[CommandEntry]]
+    """
+    try:
+        tree = ast.parse(source, filename=filename)
+    except SyntaxError as e:
+        logger.warning("%s; falling back to text search for definitions", e)
+        return sorted(set(DEF_REGEX.findall(source))), []
+    functions = []
+    commands = []
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        functions.append(node.name)
+        for decorator in node.decorator_list:
+            kind, parent = _decorator_kind(decorator)
+            if kind is None:
+                continue
+            name = _command_name(decorator, node.name)
+            commands.append(CommandEntry(name, node.name, kind, parent, node.lineno))
+    return functions, commands
+
+
+def defined_names(source, filename="<unknown>"):
+    """Return names of top-level functions and commands in source.
+
+    :param str source: Python source.
+    :param str filename: File name used in messages.
+    :rtype: set[str]
+    """
+    functions, commands = parse_module(source, filename)
+    return set(functions) | {c.name for c in commands}
+
+
+class CommandIndex:
+    """Index of the command modules in a directory.
+
+    Lookups by module and name are dictionary and set lookups.
+
+    :param path: Command module directory.
+    :param cache_file: Cache file name. If None, the index is not
+        cached between processes.
+    """
+
+    def __init__(self, path, cache_file=None):
+        self.path = pathlib.Path(path)
+        self.cache_file = None if cache_file is None else pathlib.Path(cache_file)
+        self.modules = {}
+        self._dirty = False
+        self._load()
+        self.refresh()
+
+    def _load(self):
+        if self.cache_file is None:
+            return
+        try:
+            with open(self.cache_file, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            logger.warning("corrupt command index %s; ignoring", self.cache_file)
+            return
+        if data.get("version") != CACHE_VERSION:
+            return
+        for module, entry in data["modules"].items():
+            entry["commands"] = [CommandEntry(**c) for c in entry["commands"]]
+            entry["names"] = set(entry["functions"]) | {
+                c.name for c in entry["commands"]
+            }
+            self.modules[module] = entry
+
+    def refresh(self):
+        """Parse modules that changed since they were indexed."""
+        seen = set()
+        if self.path.is_dir():
+            with os.scandir(self.path) as it:
+                for dirent in it:
+                    if not dirent.name.endswith(".py") or not dirent.is_file():
+                        continue
+                    module = dirent.name[:-3]
+                    seen.add(module)
+                    st = dirent.stat()
+                    cached = self.modules.get(module)
+                    if (
+                        cached is None
+                        or cached["mtime_ns"] != st.st_mtime_ns
+                        or cached["size"] != st.st_size
+                    ):
+                        self.update(module)
+        for module in set(self.modules) - seen:
+            del self.modules[module]
+            self._dirty = True
+
+    def update(self, module):
+        """Parse and index module."""
+        filename = self.path / f"{module}.py"
+        logger.debug("indexing %s", filename)
+        st = filename.stat()
+        with open(filename, encoding="utf-8") as fh:
+            functions, commands = parse_module(fh.read(), str(filename))
+        self.modules[module] = {
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "functions": functions,
+            "commands": commands,
+            "names": set(functions) | {c.name for c in commands},
+        }
+        self._dirty = True
+
+    def save(self):
+        """Write index to cache file if it changed."""
+        if self.cache_file is None or not self._dirty:
+            return
+        data = {
+            "version": CACHE_VERSION,
+            "modules": {
+                module: {
+                    "mtime_ns": entry["mtime_ns"],
+                    "size": entry["size"],
+                    "functions": entry["functions"],
+                    "commands": [asdict(c) for c in entry["commands"]],
+                }
+                for module, entry in self.modules.items()
+            },
+        }
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.cache_file.parent, delete=False, encoding="utf-8"
+        ) as fh:
+            json.dump(data, fh)
+        os.replace(fh.name, self.cache_file)
+        self._dirty = False
+
+    def __contains__(self, module):
+        return module in self.modules
+
+    def names(self, module):
+        """Return functions and command names defined in module."""
+        entry = self.modules.get(module)
+        return set() if entry is None else entry["names"]
+
+    def commands(self, module=None):
+        """Return (module, entry) pairs for commands, sorted by module."""
+        modules = sorted(self.modules) if module is None else [module]
+        return [
+            (m, c)
+            for m in modules
+            if m in self.modules
+            for c in self.modules[m]["commands"]
+        ]
+
+    def module_index(self, filename):
+        """Return :class:`ModuleIndex` for a file.
+
+        Modules in the indexed directory use the indexed names; other
+        files are parsed.
+        """
+        filename = pathlib.Path(filename)
+        if filename.parent.absolute() != self.path.absolute():
+            return ModuleIndex(filename)
+        return ModuleIndex(filename, names=self.names(filename.stem), index=self)
+
+
+def project_index(home, project_name):
+    """Return cached command index of a project's command modules.
+
+    :param home: Project home.
+    :param str project_name: Project name.
+    :rtype: CommandIndex
+    """
+    return CommandIndex(
+        pathlib.Path(home) / "src" / project_name / "commands",
+        cache_file=cache.project_cache_dir(home, "commandindex.json"),
+    )
+
+
+class ModuleIndex:
+    """Names defined in a module file, and definitions to add to it.
+
+    :param path: Module file name. The file need not exist.
+    :param names: Names defined in the module. Parsed from the file if
+        None.
+    :param CommandIndex index: Command index to update when the module
+        is written.
+    """
+
+    def __init__(self, path, names=None, index=None):
+        self.path = pathlib.Path(path)
+        if names is None:
+            try:
+                source = self.path.read_text(encoding="utf-8")
+            except FileNotFoundError:
+                source = ""
+            names = defined_names(source, str(self.path))
+        self.names = set(names)
+        self.index = index
+        self.added = []
+        self._chunks = []
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def append(self, name, text):
+        """Append definition of name, unless already defined.
+
+        :param str name: Name of the new function.
+        :param str text: Rendered definition.
+        :return: True if the definition was added.
+        """
+        if name in self.names:
+            logger.warning(
+                "Command %s already defined in %s; skipping", name, self.path
+            )
+            return False
+        self.names.add(name)
+        self.added.append(name)
+        self._chunks.append(text)
+        return True
+
+    def write(self):
+        """Append added definitions to the module.
+
+        :return: Names of added definitions.
+        :rtype: list[str]
+        """
+        if self._chunks:
+            logger.info("Adding %s to %s", ", ".join(self.added), self.path)
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write("".join(self._chunks))
+            self._chunks = []
+            if self.index is not None:
+                self.index.update(self.path.stem)
+        return self.added
+
+
+def read_command_spec(path, keys):
+    """Read YAML list of commands to add.
+
+    Items are command names or mappings with a 'command' key and
+    optionally any of keys.
+
+    :param path: YAML file name.
+    :param keys: Allowed keys in addition to 'command'.
+    :rtype: list[dict]
+    """
+    with open(path, encoding="utf-8") as fh:
+        data = yaml_loader().load(fh) or []
+    if not isinstance(data, list):
+        raise click.UsageError(f"{path}: expected a list of commands")
+    spec = []
+    for item in data:
+        if isinstance(item, str):
+            item = {"command": item}
+        if not isinstance(item, dict) or "command" not in item:
+            raise click.UsageError(f"{path}: invalid command entry {item!r}")
+        unknown = sorted(set(item) - set(keys) - {"command"})
+        if unknown:
+            raise click.UsageError(f"{path}: unknown keys {', '.join(unknown)}")
+        spec.append(item)
+    return spec
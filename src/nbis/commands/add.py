@@ -7,7 +7,6 @@ templates, such as running-slides, commands and command groups,
 
 import logging
 import pathlib
-import re
 import sys
 from datetime import date
 
@@ -15,6 +14,7 @@ import click
 
 from nbis import templates
 from nbis.cli import pass_environment
+from nbis.commandindex import project_index, read_command_spec
 from nbis.config import Config
 
 logger = logging.getLogger(__name__)
@@ -273,7 +273,7 @@ def pcommand_group(env, command_group, path, show):
 
 
 @main.command(name="command")
-@click.argument("command")
+@click.argument("commands", nargs=-1)
 @click.option(
     "--group",
     help=(
@@ -284,30 +284,88 @@ def pcommand_group(env, command_group, path, show):
 @click.option("--path", help="append template to path", type=click.Path(exists=True))
 @click.option("--show", is_flag=True, help="show rendered template")
 @click.option("--standalone", is_flag=True, help="make standalone command file")
+@click.option(
+    "--spec",
+    help=(
+        "YAML file with a list of commands to add. Items are command "
+        "names or mappings with keys command, group, path and standalone"
+    ),
+    type=click.Path(exists=True, dir_okay=False),
+)
 @pass_environment
-def pcommand(env, command, group, path, show, standalone):  # pylint: disable=too-many-arguments
-    """Render COMMAND to project CLI command group
+def pcommand(env, commands, group, path, show, standalone, spec):  # pylint: disable=too-many-arguments
+    """Render COMMANDS to project CLI command group
 
-    Add a subcommand to a command group or make standalone command
-    file.
+    Add subcommands to a command group or make standalone command
+    files. Commands can also be listed in a YAML file with --spec.
+    Every module file is read and written once, and commands that are
+    already defined in a module are skipped.
     """
-    if standalone:
-        tpl = "src/python_module/commands/command.standalone.py.j2"
-    else:
-        tpl = "src/python_module/commands/command.py.j2"
-    kw = {"command": command}
-    mod = group if group is not None else command
-    if path is None:
-        path = env.home / "src" / env.config.project_name / "commands" / f"{mod}.py"
-    else:
-        path = pathlib.Path(path)
-    t = templates.render_template(tpl, **kw)
-    if show:
-        click.echo(t)
-    else:
-        data = path.read_text(encoding="utf-8")
-        data = data + t
-        if not re.search(rf"def {command}\(", data):
-            path.write_text(data, encoding="utf-8")
+    defaults = {"group": group, "path": path, "standalone": standalone}
+    items = [{**defaults, "command": c} for c in commands]
+    if spec is not None:
+        keys = ("group", "path", "standalone")
+        items += [{**defaults, **item} for item in read_command_spec(spec, keys)]
+    if not items:
+        raise click.UsageError("no commands given")
+    index = project_index(env.home, env.config.project_name)
+    indices = {}
+    for item in items:
+        command = item["command"]
+        if item["standalone"]:
+            tpl = "src/python_module/commands/command.standalone.py.j2"
+        else:
+            tpl = "src/python_module/commands/command.py.j2"
+        t = templates.render_template(
+            tpl, command=command, python_module=env.config.project_name
+        )
+        if show:
+            click.echo(t)
+            continue
+        mod = item["group"] if item["group"] is not None else command
+        if item["path"] is None:
+            target = (
+                env.home / "src" / env.config.project_name / "commands" / f"{mod}.py"
+            )
         else:
-            logger.warning("Command %s already defined in %s; skipping", command, path)
+            target = pathlib.Path(item["path"])
+        if not item["standalone"] and not target.exists():
+            raise click.UsageError(
+                f"no such command group file {target}; add it with 'add command-group'"
+            )
+        if target not in indices:
+            indices[target] = index.module_index(target)
+        # A standalone command module defines the main entry point
+        indices[target].append("main" if item["standalone"] else command, t)
+    for module in indices.values():
+        module.write()
+    index.save()
+
+
+@main.command(name="list-commands")
+@click.argument("modules", nargs=-1)
+@pass_environment
+def list_commands(env, modules):
+    """List project CLI commands.
+
+    List the click commands and groups defined in the project command
+    modules, or in MODULES, with the function and line that defines
+    them.
+    """
+    index = project_index(env.home, env.config.project_name)
+    index.save()
+    rows = [
+        (
+            module,
+            entry.name,
+            entry.kind,
+            entry.parent or "",
+            f"{entry.function}:{entry.lineno}",
+        )
+        for module in (modules or [None])
+        for module, entry in index.commands(module)
+    ]
+    header = ("module", "command", "kind", "parent", "definition")
+    widths = [max(len(str(x)) for x in col) for col in zip(header, *rows)]
+    for row in [header, *rows]:
+        click.echo("  ".join(f"{x:<{w}}" for x, w in zip(row, widths)).rstrip())
@@ -4,14 +4,9 @@ import logging
 import sys
 
 import click
-
-try:
-    import pkg_resources
-except ImportError:
-    from importlib import resources as pkg_resources
 import toml
 
-import nbis
+from nbis import pkgdata
 from nbis.cli import pass_environment
 from nbis.config import Config, SchemaFiles, get_schema
 
@@ -76,12 +71,9 @@ def example(env, configuration):
     }
     kwargs = {}
     schema = get_schema(conf_map[configuration])
-    try:
-        schemafile = pkg_resources.resource_filename(
-            "nbis", str(getattr(SchemaFiles, conf_map[configuration]))
-        )
-    except AttributeError:
-        schemafile = pkg_resources.files(nbis) / "schemas" / conf_map[configuration]
+    schemafile = pkgdata.path(
+        "nbis", str(getattr(SchemaFiles, conf_map[configuration]))
+    )
 
     required = schema.schema.get("required", None)
     if configuration == "main":
@@ -0,0 +1,91 @@
+"""Debugging utilities.
+
+Profile the startup time of nbis-admin, or of a generated project CLI,
+to see which imports and option callbacks dominate it.
+"""
+
+import json
+import logging
+
+import click
+
+from nbis import startup
+from nbis.decorators import output_file_option
+
+__shortname__ = __name__.rsplit(".", maxsplit=1)[-1]
+
+
+logger = logging.getLogger(__name__)
+
+
+@click.group(help=__doc__, name=__shortname__)
+def main():
+    """Debugging utilities."""
+    logger.debug("Running %s subcommand.", __shortname__)
+
+
+def _format_profile(profile, sort, limit):
+    """Yield lines of a startup profile table."""
+    yield f"entry point:     {profile.entry_point} {' '.join(profile.args)}"
+    yield f"python:          {profile.python}"
+    yield f"imported:        {profile.imported:8.3f}s"
+    if profile.first_command is not None:
+        yield f"first command:   {profile.first_command:8.3f}s ({profile.command})"
+    yield f"finished:        {profile.finished:8.3f}s (exit code {profile.exit_code})"
+    yield f"total:           {profile.total:8.3f}s"
+    yield ""
+    yield f"{'self [us]':>10} {'cumulative':>10}  module"
+    for r in profile.sorted_imports(sort, limit):
+        yield f"{r.self_us:>10} {r.cumulative_us:>10}  {'  ' * r.depth}{r.module}"
+    if profile.callbacks:
+        yield ""
+        yield f"{'seconds':>10}  callback"
+        for c in sorted(profile.callbacks, key=lambda c: c.seconds, reverse=True):
+            yield f"{c.seconds:>10.6f}  {c.command} {c.param}"
+
+
+@main.command(name="startup", context_settings={"ignore_unknown_options": True})
+@click.option(
+    "--entry-point",
+    help="CLI to profile, as module:attribute",
+    default="nbis.cli:cli",
+)
+@click.option(
+    "--sort",
+    help="sort imports by",
+    type=click.Choice(["cumulative", "self", "module"]),
+    default="cumulative",
+)
+@click.option(
+    "--limit",
+    help="number of imports to show in the table; 0 shows all",
+    type=click.IntRange(0),
+    default=25,
+)
+@click.option("--json", "as_json", is_flag=True, help="output full profile as JSON")
+@output_file_option
+@click.argument("args", nargs=-1, type=click.UNPROCESSED)
+def startup_cmd(entry_point, sort, limit, as_json, output_file, args):
+    """Profile CLI startup time.
+
+    Run the CLI with ARGS, by default --help, in a fresh interpreter
+    and report import times, as with python -X importtime, time spent
+    in option callbacks, and time to the first command. Note that the
+    command is actually run. Separate ARGS with -- if they contain
+    options, e.g.
+
+        nbis-admin debug startup -- config --help
+    """
+    try:
+        profile = startup.profile_startup(entry_point, args or ("--help",))
+    except RuntimeError as e:
+        raise click.ClickException(str(e)) from e
+    if as_json:
+        text = json.dumps(profile.to_dict(), indent=2)
+    else:
+        text = "\n".join(_format_profile(profile, sort, limit))
+    if output_file is None:
+        click.echo(text)
+        return
+    with open(output_file, "w", encoding="utf-8") as fh:
+        fh.write(text + "\n")
@@ -0,0 +1,126 @@
+"""Documentation utilities.
+
+Render documentation in the directory defined by the 'docs.src'
+configuration property. Rmarkdown, quarto and markdown files are
+rendered with R, quarto and pandoc, respectively, and directories
+containing a _toc.yml file are built as jupyter books.
+
+Targets are only rendered if the target, a file it references, the
+project bibliography or the render arguments changed since the last
+successful render, or if the output is missing.
+"""
+
+import logging
+import os
+import pathlib
+
+import click
+
+from nbis import cache, render
+from nbis.cli import pass_environment
+
+__shortname__ = __name__.rsplit(".", maxsplit=1)[-1]
+
+
+logger = logging.getLogger(__name__)
+
+
+@click.group(help=__doc__, name=__shortname__)
+def main():
+    """Documentation utilities."""
+    logger.debug("Running %s subcommand.", __shortname__)
+
+
+@main.command(name="render")
+@click.argument("paths", nargs=-1, type=click.Path(exists=True))
+@click.option(
+    "--kind",
+    "kinds",
+    help="only render targets of this kind; can be repeated",
+    type=click.Choice(sorted(render.RENDERERS)),
+    multiple=True,
+)
+@click.option(
+    "--workers",
+    "-j",
+    help="number of processes; 0 uses all cores",
+    type=click.IntRange(0),
+    default=1,
+)
+@click.option(
+    "--keep-going/--no-keep-going",
+    help="keep rendering other targets when a target fails",
+    default=True,
+)
+@click.option("--force", "-f", help="render targets even if up to date", is_flag=True)
+@click.option(
+    "--explain",
+    help="show why each target was rendered or is up to date",
+    is_flag=True,
+)
+@click.option(
+    "--output-dir",
+    help="output directory. Defaults to the directory of each target",
+    type=click.Path(file_okay=False),
+)
+@click.option(
+    "--log-dir",
+    help="log directory. Defaults to .nbis-admin/logs/render",
+    type=click.Path(file_okay=False),
+)
+@pass_environment
+def render_cmd(
+    env, paths, kinds, workers, keep_going, force, explain, output_dir, log_dir
+):  # pylint: disable=too-many-arguments
+    """Render documentation.
+
+    Render targets in PATHS, or in the documentation source directory
+    if no paths are given. Directories are searched for targets. Every
+    target writes its output to a log file named after the target.
+    """
+    if not paths:
+        paths = [env.home / env.config.docs.src]
+    targets = []
+    for path in map(pathlib.Path, paths):
+        if path.is_dir():
+            targets.extend(render.discover(path, kinds=kinds or None))
+            continue
+        kind = render.SUFFIXES.get(path.suffix.lower())
+        if kind is None:
+            raise click.UsageError(f"don't know how to render {path}")
+        name = os.path.relpath(path.absolute(), env.home)
+        targets.append(render.RenderTarget(path, kind, pathlib.Path(name).as_posix()))
+    if not targets:
+        logger.info("no render targets found")
+        return
+    if log_dir is None:
+        log_dir = cache.project_cache_dir(env.home, "logs", "render")
+    logger.info("Rendering %i targets; logs in %s", len(targets), log_dir)
+    dependencies = []
+    if env.config.get("bibliography"):
+        dependencies.append(env.home / env.config.bibliography)
+    results = render.render_all(
+        targets,
+        output_dir=output_dir,
+        logdir=log_dir,
+        workers=workers,
+        keep_going=keep_going,
+        cachedir=cache.project_cache_dir(env.home, "render"),
+        force=force,
+        dependencies=dependencies,
+    )
+    if explain:
+        for r in results:
+            click.echo(f"{r.target.name}: {'; '.join(r.reasons) or r.status}")
+    width = max(len(r.target.name) for r in results)
+    click.echo(f"{'target':<{width}} {'kind':<12} {'seconds':>8}  status")
+    for r in sorted(results, key=lambda r: r.seconds, reverse=True):
+        click.echo(
+            f"{r.target.name:<{width}} {r.target.kind:<12} {r.seconds:>8.2f}  "
+            f"{r.status}"
+        )
+    failed = [r for r in results if not r.ok and not r.skipped]
+    for r in failed:
+        logger.error("%s failed; see %s", r.target.name, r.log)
+    if failed:
+        raise click.ClickException(f"{len(failed)} of {len(results)} targets failed")
@@ -18,57 +18,82 @@ The CLI can then be accessed through the PROJECT_NAME command, which
 by default is equal to the PROJECT_DIRECTORY name:
 
     PROJECT_NAME
+
+All files are generated in a staging directory before they are moved
+into place, so a failure leaves no half-built project behind. Use
+--dry-run to list the files that would be generated.
+
+Several projects can be initialized at once from a tab-separated
+manifest file with --from-manifest. The manifest has a header line
+and a project_directory column, and optionally description,
+project_name, repo_name, open_source_license and author columns;
+empty cells take the values of the corresponding options. Projects are created
+concurrently, and the status of every project is reported.
 """
 
+import csv
 import logging
 import pathlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
 import click
 
 from nbis import templates
+from nbis.decorators import dry_run_option
 
 __shortname__ = __name__.rsplit(".", maxsplit=1)[-1]
 
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_DESCRIPTION = "A short description of the project."
+LICENSES = ["MIT", "BSD-3-Clause"]
+MANIFEST_COLUMNS = [
+    "project_directory",
+    "description",
+    "project_name",
+    "repo_name",
+    "open_source_license",
+    "author",
+]
 
-@click.command(help=__doc__, name=__shortname__)
-@click.argument("project_directory", type=click.Path(exists=False))
-@click.option(
-    "--description",
-    help="short description of the project",
-    default="A short description of the project.",
-)
-@click.option(
-    "--project-name",
-    help=(
-        "project name if different from project directory. "
-        "Defaults to PROJECT_DIRECTORY."
-    ),
-)
-@click.option(
-    "--repo-name",
-    help="repo name if different from project name. Defaults to PROJECT_NAME.",
-)
-@click.option(
-    "--open-source-license",
-    help="open source licencse.",
-    type=click.Choice(["MIT", "BSD-3-Clause"]),
-    default=None,
-)
-@click.option("--author", help="author name")
-@click.pass_context
-def main(
-    ctx,
+
+@dataclass
+class InitResult:
+    """Result of a project initialization."""
+
+    project_directory: str
+    files: int = 0
+    seconds: float = 0.0
+    error: str | None = None
+
+    @property
+    def ok(self):
+        """True if the project was initialized."""
+        return self.error is None
+
+
+def project_plan(
     project_directory,
-    description,
-    project_name,
-    repo_name,
-    **kw,
-):
-    """Main init command"""
-    logger.debug("Running %s subcommand.", __shortname__)
+    *,
+    version,
+    config_file=None,
+    description=DEFAULT_DESCRIPTION,
+    project_name=None,
+    repo_name=None,
+    open_source_license=None,
+    author=None,
+):  # pylint: disable=too-many-arguments
+    """Return scaffolding plan for a project.
+
+    :param project_directory: Project directory.
+    :param str version: nbis-admin version.
+    :param config_file: Configuration file name. Defaults to
+        REPO_NAME.yaml in the project directory.
+    :rtype: nbis.templates.ScaffoldPlan
+    """
     p = pathlib.Path(project_directory).absolute()
     if project_name is None:
         project_name = p.name
@@ -81,20 +106,15 @@ def main(
         "project_name": project_name,
         "python_module": python_module,
         "description": description,
-        "version": ctx.obj.version,
-        "open_source_license": kw.get("open_source_license"),
-        "config_file": ctx.obj.config.get("config_file", p / f"{python_module}.yaml"),
-        "author": kw.get("author"),
+        "version": version,
+        "open_source_license": open_source_license,
+        "config_file": config_file or p / f"{python_module}.yaml",
+        "author": author,
     }
 
-    pdir = pathlib.Path(project_directory)
-    if not pdir.exists():
-        pdir.mkdir()
-
-    setup = pdir / "setup.cfg"
-    setup.touch()
-    templates.multi_add(
-        pdir,
+    plan = templates.ScaffoldPlan(pathlib.Path(project_directory))
+    plan.add("setup.cfg")
+    plan.add_templates(
         files=[
             "README.md",
             "pyproject.toml",
@@ -105,25 +125,180 @@ def main(
         ],
         **data,
     )
-    templates.init_py_module(
-        pdir,
+    plan.add_py_module(
         module=python_module,
         files=["__init__.py", "cli.py", "env.py", "config.py"],
         **data,
     )
-    templates.init_py_module(
-        pdir,
+    plan.add_py_module(
         module=python_module,
         submodule="schemas",
         init=False,
         files=["config.schema.yaml", "profile.schema.yaml"],
         **data,
     )
-    templates.init_py_module(pdir, module=python_module, submodule="commands", **data)
-    templates.init_py_module(
-        pdir,
+    plan.add_py_module(module=python_module, submodule="commands", **data)
+    plan.add_py_module(
         module=python_module,
         submodule="core",
-        files=["options.py", "snakemake.py", "wrappers.py"],
+        files=[
+            "allocation.py",
+            "dryrun.py",
+            "options.py",
+            "runhistory.py",
+            "snakemake.py",
+            "wrappers.py",
+        ],
         **data,
     )
+    return plan
+
+
+def read_manifest(path):
+    """Read project manifest.
+
+    :param path: Tab-separated manifest file with header line.
+    :return: Keyword arguments to :func:`project_plan`, one per project.
+    :rtype: list[dict]
+    """
+    with open(path, encoding="utf-8", newline="") as fh:
+        reader = csv.DictReader(fh, delimiter="\t")
+        columns = reader.fieldnames or []
+        unknown = sorted(set(columns) - set(MANIFEST_COLUMNS))
+        if unknown:
+            raise click.UsageError(f"{path}: unknown columns {', '.join(unknown)}")
+        if "project_directory" not in columns:
+            raise click.UsageError(f"{path}: missing column project_directory")
+        rows = []
+        seen = set()
+        for i, row in enumerate(reader, start=2):
+            row = {k: v.strip() for k, v in row.items() if v and v.strip()}
+            if not row:
+                continue
+            if "project_directory" not in row:
+                raise click.UsageError(f"{path}:{i}: missing project_directory")
+            pdir = pathlib.Path(row["project_directory"]).absolute()
+            if pdir in seen:
+                raise click.UsageError(f"{path}:{i}: duplicate project_directory")
+            seen.add(pdir)
+            if row.get("open_source_license", LICENSES[0]) not in LICENSES:
+                raise click.UsageError(
+                    f"{path}:{i}: unknown license {row['open_source_license']}"
+                )
+            rows.append(row)
+    return rows
+
+
+def init_projects(projects, *, workers=4, **kwargs):
+    """Initialize several projects concurrently.
+
+    The projects share the template environment of this process.
+    Failures are recorded in the results rather than raised.
+
+    :param list projects: Keyword arguments to :func:`project_plan`.
+    :param int workers: Number of projects to initialize concurrently.
+    :param kwargs: Keyword arguments passed to :func:`project_plan`.
+    :rtype: list[InitResult]
+    """
+
+    def init(project):
+        result = InitResult(project["project_directory"])
+        t0 = time.perf_counter()
+        try:
+            plan = project_plan(**kwargs, **project)
+            result.files = len(plan.commit(workers=1))
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error("%s: %s", result.project_directory, e)
+            result.error = str(e)
+        result.seconds = time.perf_counter() - t0
+        return result
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(init, projects))
+
+
+@click.command(help=__doc__, name=__shortname__)
+@click.argument("project_directory", type=click.Path(exists=False), required=False)
+@click.option(
+    "--description",
+    help="short description of the project",
+    default=DEFAULT_DESCRIPTION,
+)
+@click.option(
+    "--project-name",
+    help=(
+        "project name if different from project directory. "
+        "Defaults to PROJECT_DIRECTORY."
+    ),
+)
+@click.option(
+    "--repo-name",
+    help="repo name if different from project name. Defaults to PROJECT_NAME.",
+)
+@click.option(
+    "--open-source-license",
+    help="open source licencse.",
+    type=click.Choice(LICENSES),
+    default=None,
+)
+@click.option("--author", help="author name")
+@click.option(
+    "--from-manifest",
+    help="initialize all projects listed in a tab-separated manifest file",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "--workers",
+    "-j",
+    help="number of projects to initialize concurrently with --from-manifest",
+    type=click.IntRange(1),
+    default=4,
+)
+@dry_run_option
+@click.pass_context
+def main(
+    ctx,
+    project_directory,
+    from_manifest,
+    workers,
+    dry_run,
+    **kw,
+):
+    """Main init command"""
+    logger.debug("Running %s subcommand.", __shortname__)
+    if (project_directory is None) == (from_manifest is None):
+        raise click.UsageError("give either PROJECT_DIRECTORY or --from-manifest")
+    common = {
+        "version": ctx.obj.version,
+        "config_file": ctx.obj.config.get("config_file"),
+    }
+    if from_manifest is None:
+        plan = project_plan(project_directory, **common, **kw)
+        if dry_run:
+            for line in plan.describe():
+                click.echo(line)
+            return
+        plan.commit()
+        return
+
+    # Options given on the command line are defaults for all projects
+    defaults = {k: v for k, v in kw.items() if v is not None}
+    projects = [{**defaults, **row} for row in read_manifest(from_manifest)]
+    if dry_run:
+        for project in projects:
+            for line in project_plan(**common, **project).describe():
+                click.echo(line)
+        return
+    results = init_projects(projects, workers=workers, **common)
+    width = max([len(r.project_directory) for r in results] + [7])
+    click.echo(f"{'project':<{width}} {'files':>5} {'seconds':>8}  status")
+    for r in results:
+        status = "ok" if r.ok else f"failed: {r.error}"
+        click.echo(
+            f"{r.project_directory:<{width}} {r.files:>5} {r.seconds:>8.2f}  {status}"
+        )
+    failed = [r for r in results if not r.ok]
+    if failed:
+        raise click.ClickException(
+            f"{len(failed)} of {len(results)} projects failed to initialize"
+        )
@@ -0,0 +1,151 @@
+"""Query the run history.
+
+Commands run through the wrappers of nbis-admin and generated
+projects, such as snakemake, pandoc, rmarkdown and jupyter-book, are
+recorded in the project run history, .nbis-admin/runs.sqlite, or in
+the user cache directory for runs outside a project. List
+runs, find the slowest runs and see how the run time of a command
+changes over time, e.g.
+
+    nbis-admin runs trend "snakemake smk-run" --period week
+"""
+
+import datetime
+import functools
+import logging
+import time
+
+import click
+
+from nbis.runhistory import PERIODS, RunHistory, history_path
+
+__shortname__ = __name__.rsplit(".", maxsplit=1)[-1]
+
+
+logger = logging.getLogger(__name__)
+
+
+@click.group(help=__doc__, name=__shortname__)
+def main():
+    """Query the run history."""
+    logger.debug("Running %s subcommand.", __shortname__)
+
+
+def history_option(func):
+    """Add run history database and --since options.
+
+    The decorated function is called with the run history and the
+    start time of the oldest run to include.
+    """
+
+    def wrapper(db, since, **kwargs):
+        path = db or history_path()
+        if path is None:
+            raise click.ClickException("run history is disabled")
+        if since is not None:
+            since = time.time() - since * 86400
+        return func(RunHistory(path), since, **kwargs)
+
+    # Keeps the options of func, in __click_params__
+    wrapper = functools.update_wrapper(wrapper, func)
+    wrapper = click.option(
+        "--since",
+        help="only include runs from the last SINCE days",
+        type=click.FloatRange(0, min_open=True),
+    )(wrapper)
+    return click.option(
+        "--db",
+        help="run history database; defaults to the project run history",
+        type=click.Path(dir_okay=False),
+    )(wrapper)
+
+
+def _time(seconds):
+    """Return epoch seconds as local time string."""
+    return datetime.datetime.fromtimestamp(seconds).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _format_runs(runs):
+    yield f"{'started':<19} {'seconds':>10} {'exit':>4} {'maxrss [kB]':>11}  command"
+    for r in runs:
+        maxrss = "-" if r.maxrss is None else r.maxrss
+        yield (
+            f"{_time(r.started):<19} {r.seconds:>10.2f} {r.returncode:>4} "
+            f"{maxrss:>11}  {' '.join(r.args)}"
+        )
+
+
+@main.command(name="list")
+@history_option
+@click.option("--command", help="only list runs of this command")
+@click.option("--failed", is_flag=True, help="only list failed runs")
+@click.option(
+    "--limit",
+    help="number of runs to list; 0 lists all",
+    type=click.IntRange(0),
+    default=20,
+)
+def list_cmd(history, since, command, failed, limit):
+    """List recent runs, most recent first."""
+    runs = history.runs(command, since=since, failed=failed, limit=limit)
+    click.echo("\n".join(_format_runs(runs)))
+
+
+@main.command()
+@history_option
+@click.option("--command", help="only include runs of this command")
+@click.option(
+    "--limit", help="number of runs to list", type=click.IntRange(1), default=10
+)
+def slowest(history, since, command, limit):
+    """List the slowest runs."""
+    runs = history.slowest(command, since=since, limit=limit)
+    click.echo("\n".join(_format_runs(runs)))
+
+
+@main.command()
+@history_option
+def summary(history, since):
+    """Summarize runs per command.
+
+    Commands are sorted by total run time. Times are in seconds.
+    """
+    rows = history.summary(since=since)
+    width = max([len(row["command"]) for row in rows] + [len("command")])
+    click.echo(
+        f"{'command':<{width}} {'runs':>5} {'failed':>6} {'mean':>10} "
+        f"{'max':>10} {'total':>10} {'maxrss [kB]':>11}  last run"
+    )
+    for row in rows:
+        maxrss = "-" if row["maxrss"] is None else row["maxrss"]
+        click.echo(
+            f"{row['command']:<{width}} {row['runs']:>5} {row['failed']:>6} "
+            f"{row['mean']:>10.2f} {row['max']:>10.2f} {row['total']:>10.2f} "
+            f"{maxrss:>11}  {_time(row['last'])}"
+        )
+
+
+@main.command()
+@history_option
+@click.argument("command")
+@click.option(
+    "--period",
+    help="time period to aggregate runs by",
+    type=click.Choice(list(PERIODS)),
+    default="day",
+)
+def trend(history, since, command, period):
+    """Show run time of COMMAND per time period.
+
+    COMMAND is a command name as listed by the summary subcommand.
+    Times are in seconds.
+    """
+    rows = history.trend(command, period=period, since=since)
+    if not rows:
+        raise click.ClickException(f"no runs of {command}")
+    click.echo(f"{period:<10} {'runs':>5} {'mean':>10} {'min':>10} {'max':>10}")
+    for row in rows:
+        click.echo(
+            f"{row['period']:<10} {row['runs']:>5} {row['mean']:>10.2f} "
+            f"{row['min']:>10.2f} {row['max']:>10.2f}"
+        )
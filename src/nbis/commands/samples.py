@@ -0,0 +1,95 @@
+"""Sample sheet utilities.
+
+Validate sample sheets against the project sample schema. By default,
+the schema is read from
+src/PROJECT_NAME/workflow/schemas/samples.schema.yaml, which is added
+by the 'smk init' command.
+"""
+
+import logging
+import pathlib
+
+import click
+
+from nbis.cli import pass_environment
+from nbis.samples import validate_samples
+
+__shortname__ = __name__.rsplit(".", maxsplit=1)[-1]
+
+
+logger = logging.getLogger(__name__)
+
+
+@click.group(help=__doc__, name=__shortname__)
+def main():
+    """Sample sheet utilities."""
+    logger.debug("Running %s subcommand.", __shortname__)
+
+
+@main.command()
+@click.argument("sample_sheet", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--schema",
+    help="sample schema file. Defaults to the project sample schema.",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "--max-errors",
+    help="stop after this many failing rows; 0 reports all failing rows",
+    type=click.IntRange(0),
+    default=100,
+)
+@click.option(
+    "--processes",
+    "-p",
+    help=(
+        "number of processes; 0 uses all cores. Parallel validation "
+        "requires that no record spans several lines"
+    ),
+    type=click.IntRange(0),
+    default=1,
+)
+@click.option("--delimiter", help="column delimiter", default="\t")
+@click.option(
+    "--engine",
+    help=(
+        "validation engine; 'column' validates chunks of rows column-wise "
+        "and requires pandas, 'auto' uses it if available"
+    ),
+    type=click.Choice(["auto", "row", "column"]),
+    default="auto",
+)
+@pass_environment
+def validate(env, sample_sheet, schema, max_errors, processes, delimiter, engine):  # pylint: disable=too-many-arguments
+    """Validate SAMPLE_SHEET against sample schema.
+
+    Report failing rows with their line numbers.
+    """
+    if schema is None:
+        schema = (
+            pathlib.Path(env.home)
+            / "src"
+            / env.config.project_name
+            / "workflow"
+            / "schemas"
+            / "samples.schema.yaml"
+        )
+        if not schema.exists():
+            raise click.UsageError(f"no such sample schema {schema}; use --schema")
+    report = validate_samples(
+        sample_sheet,
+        schema,
+        max_errors=max_errors or None,
+        processes=processes,
+        delimiter=delimiter,
+        engine=engine,
+    )
+    for error in report.errors:
+        click.echo(f"{sample_sheet}:{error}")
+    if report.valid:
+        logger.info("%s: %i rows validated", sample_sheet, report.rows)
+        return
+    msg = f"{len(report.errors)} failing rows"
+    if report.truncated:
+        msg = f"stopped after {msg}"
+    raise click.ClickException(msg)
@@ -37,6 +37,7 @@ import logging
 import click
 
 from nbis.cli import pass_environment
+from nbis.commandindex import ModuleIndex, project_index, read_command_spec
 from nbis.templates import add_template, render_template
 
 __shortname__ = __name__.rsplit(".", maxsplit=1)[-1]
@@ -56,19 +57,26 @@ def add_group_smk_py(env, group, **kw):
     )
 
 
-def add_command_smk_py(env, group, **kw):
-    """Add snakemake python command file"""
+def add_command_smk_py(env, group, index=None, **kw):
+    """Add snakemake python command file
+
+    :param index: Index of the group module. If given, the command is
+        added to the index and the caller writes the module;
+        otherwise, the module is written immediately.
+    :return: True if the command was added, False if it is already
+        defined in the group module.
+    """
     pyfile = env.home / "src" / env.config.project_name / "commands" / f"{group}.py"
-    assert f"def {kw['command']}(" not in pyfile.read_text(), (
-        f"{kw['command']} already defined"
-    )
+    write = index is None
+    if index is None:
+        index = ModuleIndex(pyfile)
     kw["group"] = group
     command = "quarto" if kw["quarto"] else "command"
-    with open(pyfile, "a", encoding="utf-8") as fh:
-        fh.write(
-            render_template(f"src/python_module/commands/{command}.smk.py.j2", **kw)
-        )
-        fh.write("\n")
+    text = render_template(f"src/python_module/commands/{command}.smk.py.j2", **kw)
+    added = index.append(kw["command"], text + "\n")
+    if write:
+        index.write()
+    return added
 
 
 def add_command_smk(env, group, command, **kw):
@@ -215,19 +223,35 @@ def main():
     help=("Add local snakemake profile"),
 )
 @click.option("group", "--group", default="smk", help="snakemake command group name")
-@click.option("command", "--command", default="run", help="snakemake command to add")
+@click.option(
+    "commands",
+    "--command",
+    default=["run"],
+    multiple=True,
+    help="snakemake command to add; can be repeated",
+)
 @click.option(
     "quarto",
     "--quarto",
     is_flag=True,
     help="add quarto snakeamake code and command",
 )
+@click.option(
+    "--spec",
+    help=(
+        "YAML file with a list of commands to add. Items are command "
+        "names or mappings with keys command, group, quarto, test and "
+        "validation; missing keys take the values of the options"
+    ),
+    type=click.Path(exists=True, dir_okay=False),
+)
 @click.pass_context
-def add(ctx, group, **kw):
+def add(ctx, group, commands, spec, **kw):
     """Add snakefile and python helper code.
 
-    Add snakefile and possibly a command CLI. There are options to
-    add tests and validation.
+    Add snakefiles and possibly command CLIs. There are options to
+    add tests and validation. Several commands can be added at once,
+    in which case every group module is written once.
 
     """
     env = ctx.obj
@@ -239,15 +263,47 @@ def add(ctx, group, **kw):
             ctx.find_root().info_name,
         )
         return
+    defaults = {"group": group, **kw}
     if kw["quarto"]:
-        kw["command"] = "quarto"
-    add_group_smk_py(env, group, **kw)
-    add_command_smk_py(env, group, **kw)
-    command = kw.pop("command")
-    add_command_smk(env, group, command, **kw)
-    if kw["test"]:
-        add_test_config(env, group, command)
-        add_test_smk_setup(env, group, command)
+        commands = ["quarto"]
+    items = []
+    source = ctx.get_parameter_source("commands")
+    if spec is None or source is not click.core.ParameterSource.DEFAULT:
+        items += [{**defaults, "command": c} for c in commands]
+    if spec is not None:
+        keys = ("group", "quarto", "test", "validation")
+        for item in read_command_spec(spec, keys):
+            item = {**defaults, **item}
+            if item["quarto"]:
+                item["command"] = "quarto"
+            items.append(item)
+
+    index = project_index(env.home, env.config.project_name)
+    indices = {}
+    for item in items:
+        item = dict(item)
+        group = item.pop("group")
+        if group not in indices:
+            pyfile = (
+                env.home / "src" / env.config.project_name / "commands" / f"{group}.py"
+            )
+            # The group module imports test helpers if any command needs them
+            test = any(x["test"] for x in items if x["group"] == group)
+            add_group_smk_py(env, group, test=test)
+            # The group module may have just been created
+            if pyfile.exists():
+                index.update(group)
+            indices[group] = index.module_index(pyfile)
+        if not add_command_smk_py(env, group, index=indices[group], **item):
+            continue
+        command = item.pop("command")
+        add_command_smk(env, group, command, **item)
+        if item["test"]:
+            add_test_config(env, group, command)
+            add_test_smk_setup(env, group, command)
+    for module in indices.values():
+        module.write()
+    index.save()
 
 
 @main.command()
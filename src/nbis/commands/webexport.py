@@ -1,15 +1,19 @@
 """Webexport administration utilities (WIP)
 
 All contents of folder reports/webexport will be synced to the url
-defined by the 'webexport.url' configuration property.
+defined by the 'webexport.url' configuration property. The folder
+can be changed with the 'webexport.builddir' configuration property.
+Several urls can be configured, or given with --url, and are pushed
+concurrently.
 """
 
 import logging
-import subprocess
 
 import click
 
-from nbis.config import Config
+from nbis import webexport
+from nbis.cli import pass_environment
+from nbis.decorators import dry_run_option
 
 __shortname__ = __name__.rsplit(".", maxsplit=1)[-1]
 
@@ -24,26 +28,107 @@ def main():
 
 
 @main.command()
-@click.option("--backend", help="backend to use", default="rsync")
+@click.option(
+    "--backend",
+    help="backend to use; the local backend copies to a local directory",
+    type=click.Choice(sorted(webexport.BACKENDS)),
+    default="rsync",
+)
+@click.option(
+    "--incremental/--no-incremental",
+    help=(
+        "only transfer files that changed since the last push, based on a "
+        "local index of the pushed state"
+    ),
+    default=False,
+)
+@click.option(
+    "--url",
+    "urls",
+    multiple=True,
+    help="target url; can be repeated. Overrides the configured urls",
+)
+@click.option(
+    "--shard/--no-shard",
+    help=(
+        "push each directory in 'webexport.include' as a separate job to "
+        "the corresponding subdirectory of every target"
+    ),
+    default=False,
+)
+@click.option(
+    "--workers",
+    "-j",
+    help="maximum number of concurrent pushes",
+    type=click.IntRange(1),
+    default=4,
+)
+@click.option(
+    "--retries",
+    help="number of retries of a failed push",
+    type=click.IntRange(0),
+    default=2,
+)
+@click.option(
+    "--backoff",
+    help="delay in seconds before the first retry; doubled for every retry",
+    type=click.FloatRange(0),
+    default=1.0,
+)
 @click.option(
     "--rsync-options",
     multiple=True,
     help="Additional options to pass to rsync.",
     default=[],
 )
-@click.pass_context
-def sync(ctx, backend, dry_run, **kw):
-    """Initialize diary.
-
-    Add a template diary.
-    """
-    logger.info("Initializing diary.")
-    config = Config(file=f"{ctx.find_root().info_name}.yaml")
-    arguments = [backend] + kw["rsync_options"]
-    if dry_run:
-        arguments.append("-n")
-    arguments += [
-        f"{config.webexport.builddir}/",  # pylint: disable=no-member
-        f"{config.webexport.url}/",  # pylint: disable=no-member
-    ]
-    subprocess.run(arguments, check=True)
+@dry_run_option
+@pass_environment
+def sync(
+    env,
+    backend,
+    incremental,
+    urls,
+    shard,
+    workers,
+    retries,
+    backoff,
+    rsync_options,
+    dry_run,
+):  # pylint: disable=too-many-arguments
+    """Sync build directory to webexport urls."""
+    config = env.config.get("webexport") or {}
+    if not urls:
+        urls = config.get("url") or []
+        if isinstance(urls, str):
+            urls = [urls]
+    if not urls:
+        raise click.UsageError("no webexport url configured; use --url")
+    include = None
+    if shard:
+        include = config.get("include")
+        if not include:
+            raise click.UsageError("--shard requires 'webexport.include'")
+    builddir = env.home / config.get("builddir", "reports/webexport")
+    jobs = webexport.plan(env.home, builddir, urls, include=include)
+    logger.info("Syncing %s to %s in %i jobs", builddir, ", ".join(urls), len(jobs))
+    results = webexport.sync_many(
+        jobs,
+        workers=workers,
+        retries=retries,
+        backoff=backoff,
+        backend=backend,
+        options=list(rsync_options),
+        incremental=incremental,
+        dry_run=dry_run,
+    )
+    header = ("target", "files", "deleted", "bytes", "seconds")
+    click.echo("{:<40} {:>7} {:>7} {:>12} {:>8}  status".format(*header))
+    for r in results:
+        status = "ok" if r.ok else f"failed after {r.attempts} attempts"
+        click.echo(
+            f"{r.target:<40} {r.files:>7} {r.deleted:>7} {r.nbytes:>12} "
+            f"{r.seconds:>8.2f}  {status}"
+        )
+    failed = [r for r in results if not r.ok]
+    if failed:
+        raise click.ClickException(f"{len(failed)} of {len(results)} pushes failed")
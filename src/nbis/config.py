@@ -6,20 +6,18 @@ import copy
 import csv
 import json
 import logging
+import os
 import pprint
-import types
 from collections import OrderedDict
+from collections.abc import ItemsView, ValuesView
 from typing import Any, Mapping
 
 import jsonschema
-
-try:
-    import pkg_resources
-except ImportError:
-    from importlib import resources as pkg_resources
 import ruamel.yaml
 from ruamel.yaml import YAML
 
+from nbis import cache, pkgdata
+
 logger = logging.getLogger(__name__)
 
 
@@ -67,12 +65,12 @@ class Schema:
             self._validate_row = validate_bytes
         else:
             try:
-                DefaultSchemaValidator(schema)
+                validator = DefaultSchemaValidator(schema)
             except jsonschema.exceptions.SchemaError as ve:
                 logger.error(ve)
                 raise
             self._string = json.dumps(schema, sort_keys=True, separators=(",", ":"))
-            self._validate_row = DefaultSchemaValidator(schema).validate
+            self._validate_row = validator.validate
             if "type" in schema and "null" in schema["type"]:
                 self.empty_value = None
             else:
@@ -161,17 +159,98 @@ class Schema:
         return properties
 
 
-def get_schema(schema="CONFIGURATION_SCHEMA"):
-    """Get schema from file."""
+# Process-level cache of Schema objects keyed by (path, mtime, size)
+_SCHEMA_CACHE = {}
+
+
+def clear_schema_cache():
+    """Clear the process-level schema cache."""
+    _SCHEMA_CACHE.clear()
+
+
+def _schema_cache_file(path):
+    return cache.user_cache_dir("schemas", f"{cache.key_digest(path)}.json")
+
+
+def _read_schema_cache(path, stat):
+    """Read parsed schema from on-disk cache.
+
+    The cached entry is used if the file mtime and size match, or if
+    the file contents hash to the cached digest.
+    """
+    cachefile = _schema_cache_file(path)
     try:
-        schemafile = pkg_resources.resource_filename(
-            "nbis", str(getattr(SchemaFiles, schema))
-        )
-    except AttributeError:
-        schemafile = pkg_resources.files("nbis") / str(getattr(SchemaFiles, schema))
-    with open(schemafile, encoding="utf-8") as fh:
-        schema = YAML().load(fh)
-    return Schema(schema)
+        with open(cachefile, encoding="utf-8") as fh:
+            entry = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if entry.get("path") != path:
+        return None
+    if entry.get("mtime_ns") == stat.st_mtime_ns and entry.get("size") == stat.st_size:
+        return entry["schema"]
+    if entry.get("sha256") == cache.file_digest(path):
+        _write_schema_cache(path, stat, entry["schema"], entry["sha256"])
+        return entry["schema"]
+    return None
+
+
+def _write_schema_cache(path, stat, data, digest=None):
+    """Write parsed schema to on-disk cache."""
+    cachefile = _schema_cache_file(path)
+    entry = {
+        "path": path,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": digest or cache.file_digest(path),
+        "schema": data,
+    }
+    tmp = cachefile.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        cachefile.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(entry, fh)
+        os.replace(tmp, cachefile)
+    except (OSError, TypeError, ValueError) as e:
+        logger.debug("failed to write schema cache %s: %s", cachefile, e)
+        tmp.unlink(missing_ok=True)
+
+
+def read_schema(schemafile, use_cache=True):
+    """Read schema file and return a :class:`Schema`.
+
+    Parsed schemas and their validators are cached per process, keyed
+    by file path, mtime and size, such that repeated reads cost a
+    dictionary lookup. Parsed schemas are also cached on disk (see
+    :mod:`nbis.cache`), keyed by path, mtime and content hash, which
+    saves the YAML parse in new processes.
+
+    :param schemafile: Path to schema file.
+    :param bool use_cache: Use process and disk caches.
+    """
+    path = os.path.abspath(schemafile)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if use_cache and key in _SCHEMA_CACHE:
+        return _SCHEMA_CACHE[key]
+    data = None
+    persist = use_cache and cache.enabled()
+    if persist:
+        data = _read_schema_cache(path, stat)
+    if data is None:
+        with open(path, encoding="utf-8") as fh:
+            data = YAML(typ="safe").load(fh)
+        if persist:
+            _write_schema_cache(path, stat, data)
+    schema = Schema(data)
+    if use_cache:
+        _SCHEMA_CACHE[key] = schema
+    return schema
+
+
+def get_schema(schema="CONFIGURATION_SCHEMA", use_cache=True):
+    """Get schema from file."""
+    schemafile = pkgdata.path("nbis", str(getattr(SchemaFiles, schema)))
+    return read_schema(schemafile, use_cache=use_cache)
 
 
 def load_config(file=None, data=None, schema="CONFIGURATION_SCHEMA", validate=True):
@@ -183,61 +262,114 @@ def load_config(file=None, data=None, schema="CONFIGURATION_SCHEMA", validate=Tr
     return config
 
 
+def _wrap(value):
+    """Wrap dicts, and dicts in lists, in PropertyDict."""
+    if isinstance(value, PropertyDict):
+        return value
+    if isinstance(value, dict):
+        return PropertyDict(value)
+    if isinstance(value, list):
+        if any(isinstance(x, dict) and not isinstance(x, PropertyDict) for x in value):
+            return [_wrap(x) if isinstance(x, dict) else x for x in value]
+    return value
+
+
+def _asdict(value):
+    """Convert mappings and sequences to plain dicts and lists."""
+    if isinstance(value, dict):
+        return {k: _asdict(v) for k, v in dict.items(value)}
+    if isinstance(value, Mapping):
+        return {k: _asdict(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_asdict(x) for x in value]
+    return value
+
+
 class PropertyDict(OrderedDict):
-    """Simple class that allows for property access"""
+    """Simple class that allows for property access
+
+    Keys are accessible as attributes, unless they shadow a dict
+    method. Nested dicts, and dicts in lists, are wrapped in
+    PropertyDict on first access, such that construction only copies
+    the top level of the input data.
+    """
 
     def __init__(self, data=None):
         if data is None:
             data = {}
         super().__init__(data)
-        if isinstance(data, types.GeneratorType):
-            return
-        for k, v in data.items():
-            if isinstance(v, dict):
-                v = PropertyDict(v)
-            elif isinstance(v, list):
-                val = []
-                for x in v:
-                    if isinstance(x, PropertyDict):
-                        val.append(x)
-                    elif isinstance(x, dict):
-                        val.append(PropertyDict(x))
-                    else:
-                        val.append(x)
-                v = val
-            else:
-                pass
-            self[k] = v
 
-    def __setitem__(self, key, value):
-        OrderedDict.__setitem__(self, key, value)
-        if key not in dir({}):
-            try:
-                setattr(self, key, value)
-            except Exception as e:
-                print(e)
-                print(key, value)
-                raise
+    def __getitem__(self, key):
+        value = OrderedDict.__getitem__(self, key)
+        wrapped = _wrap(value)
+        if wrapped is not value:
+            OrderedDict.__setitem__(self, key, wrapped)
+        return wrapped
+
+    def __getattr__(self, key):
+        if key.startswith("__"):
+            raise AttributeError(key)
+        try:
+            return self[key]
+        except KeyError as e:
+            raise AttributeError(key) from e
+
+    def get(self, key, default=None):
+        """Return value for key if key is present, else default."""
+        if key in self:
+            return self[key]
+        return default
+
+    def items(self):
+        return ItemsView(self)
+
+    def values(self):
+        return ValuesView(self)
 
     def asdict(self):
         """Return the PropertyDict as a dict."""
-        return json.loads(json.dumps(self))
+        return _asdict(self)
+
+
+def yaml_loader(roundtrip=False):
+    """Return YAML instance for loading.
+
+    The round-trip loader preserves comments and formatting but is
+    the slowest mode in ruamel.yaml. The safe loader uses the C-based
+    parser if ruamel.yaml.clib is installed.
+
+    :param bool roundtrip: Return round-trip loader.
+    """
+    if roundtrip:
+        return YAML()
+    return YAML(typ="safe")
 
 
 class Config(PropertyDict):
-    """Class for storing configuration data."""
+    """Class for storing configuration data.
+
+    :param dict data: Configuration data.
+    :param file: Configuration file name or file object to load.
+    :param bool roundtrip: Load file with round-trip loader that
+        preserves comments. Only needed if the loaded data is to be
+        written back to file.
+    """
 
-    def __init__(self, data=None, file=None):
+    def __init__(self, data=None, file=None, roundtrip=False):
         if data is None:
             data = {}
         if file is not None:
-            fdata = self.read_from_file(file)
+            fdata = self.read_from_file(file, roundtrip=roundtrip)
             data.update(**fdata)
         super().__init__(data)
 
-    def read_from_file(self, file):
-        """Read configuration from file."""
-        yaml = YAML()
+    def read_from_file(self, file, roundtrip=False):
+        """Read configuration from file.
+
+        :param file: File name or file object.
+        :param bool roundtrip: Use round-trip loader.
+        """
+        yaml = yaml_loader(roundtrip=roundtrip)
         try:
             if isinstance(file, str):
                 with open(file, encoding="utf-8") as fh:
@@ -248,6 +380,8 @@ class Config(PropertyDict):
             logger.error(e)
             logger.info("setting data to empty dict")
             data = {}
+        if data is None:
+            data = {}
         return data
 
     @classmethod
@@ -297,4 +431,4 @@ class Config(PropertyDict):
     @property
     def is_empty(self):
         """Return True if the configuration is empty."""
-        return self.asdict() == {}
+        return len(self) == 0
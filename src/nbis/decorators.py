@@ -60,12 +60,13 @@ def config_file_option(*param_decls: str, **kwargs: t.Any) -> t.Callable[[FC], F
         value: bool,  # pylint: disable=unused-argument
     ) -> None:
         ctx.ensure_object(Environment)
-        ctx.obj.config = load_config(data={"project_name": "nbis-admin"})
         if not value or ctx.resilient_parsing:
             ctx.obj.home = pathlib.Path(os.curdir).absolute()
             config_file = ctx.obj.home / f"{ctx.obj.home.name}.yaml"
             if config_file.exists():
                 ctx.obj.config = load_config(file=config_file)
+            else:
+                ctx.obj.config = load_config(data={"project_name": "nbis-admin"})
             return
         ctx.obj.home = pathlib.Path(value).absolute().parent
         ctx.obj.config = load_config(file=value)
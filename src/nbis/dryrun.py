@@ -0,0 +1,434 @@
+"""Cached snakemake dry runs.
+
+A snakemake dry run builds the complete DAG of a workflow, which can
+take minutes for large workflows. :class:`DryRunCache` stores the job
+list of a dry run per target, together with a fingerprint of what the
+DAG depends on:
+
+- the snakefile and the workflow sources, e.g. rule files and schemas
+- the configuration files, and the sample sheets they refer to
+- the resolved snakemake profile
+- the modification times of the targets and of the outputs of the
+  jobs that would run
+
+A dry run for the same snakefile and options returns the cached job
+lists of targets whose fingerprint is unchanged, and only runs
+snakemake for the remaining targets. Changes to the workflow,
+configuration or profile invalidate all targets, whereas changed
+outputs only invalidate the targets that depend on them. Dry run
+output without jobs is only cached if snakemake reports that there is
+nothing to be done, so that output in an unexpected format, e.g. with
+--quiet, is not mistaken for an empty job list.
+
+Input files that are not produced by the workflow, other than sample
+sheets, are not fingerprinted, and neither are the outputs of a target
+that is up to date, other than the target itself. Run snakemake with
+--dry-run when such files change.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import click
+from ruamel.yaml import YAML
+
+from nbis import wrappers
+from nbis.snakemake import PROFILE_CONFIG_FILES, resolve_profile
+
+logger = logging.getLogger(__name__)
+
+DRYRUN_CACHE_ENVVAR = "SNAKEMAKE_DRYRUN_CACHE"
+DRYRUN_CACHE_VERSION = 1
+DEFAULT_CONFIGFILES = ("config/config.yaml", "config.yaml")
+WORKFLOW_SUFFIXES = (".smk", ".py")
+JOB_REGEX = re.compile(r"^(local)?(?:rule|checkpoint) (\S+):\s*$")
+FIELD_REGEX = re.compile(r"^\s+(input|output|jobid|reason|wildcards): (.*)$")
+NOTHING_TO_BE_DONE = "Nothing to be done"
+
+
+@dataclass
+class Job:
+    """Job of a snakemake dry run.
+
+    :param str rule: Rule name.
+    :param int jobid: Job id.
+    :param list output: Output files, relative to the working directory.
+    :param list input: Input files.
+    :param str reason: Reason the job would run.
+    :param str wildcards: Wildcards, as printed by snakemake.
+    :param bool local: True for local rules.
+    """
+
+    rule: str
+    jobid: int = None
+    output: list = field(default_factory=list)
+    input: list = field(default_factory=list)
+    reason: str = None
+    wildcards: str = None
+    local: bool = False
+
+
+@dataclass
+class DryRunResult:
+    """Result of a cached dry run.
+
+    :param list jobs: Jobs that would run, for all targets.
+    :param list cached: Targets whose jobs were taken from the cache.
+    :param list computed: Targets for which snakemake was run.
+    :param list output: Dry run output, if no jobs could be parsed from
+        it; the jobs of the computed targets are then unknown.
+    """
+
+    jobs: list
+    cached: list
+    computed: list
+    output: list = None
+
+
+def parse_dry_run(lines):
+    """Parse jobs from snakemake dry run output.
+
+    :param lines: Output lines.
+    :rtype: list[Job]
+    """
+    jobs = []
+    job = None
+    for line in lines:
+        line = line.rstrip("\n")
+        m = JOB_REGEX.match(line)
+        if m is not None:
+            job = Job(m.group(2), local=m.group(1) is not None)
+            jobs.append(job)
+            continue
+        m = FIELD_REGEX.match(line) if job is not None else None
+        if m is None:
+            if not line.startswith(" "):
+                job = None
+            continue
+        key, value = m.groups()
+        if key in ("input", "output"):
+            setattr(job, key, value.split(", "))
+        elif key == "jobid":
+            job.jobid = int(value)
+        else:
+            setattr(job, key, value)
+    return jobs
+
+
+def is_parsed(lines, jobs):
+    """Return True if jobs are the complete job list of dry run output.
+
+    Output without jobs is only complete if snakemake reports that
+    there is nothing to be done; otherwise, the output was not in the
+    expected format, e.g. because a profile set --quiet.
+    """
+    return bool(jobs) or any(NOTHING_TO_BE_DONE in line for line in lines)
+
+
+def format_jobs(jobs):
+    """Yield lines of a job summary, like the snakemake job stats."""
+    counts = {}
+    for job in jobs:
+        counts[job.rule] = counts.get(job.rule, 0) + 1
+    width = max([len(r) for r in counts] + [len("total")])
+    yield f"{'job':<{width}}  {'count':>5}"
+    yield f"{'-' * width}  {'-' * 5}"
+    for rule, count in counts.items():
+        yield f"{rule:<{width}}  {count:>5}"
+    yield f"{'total':<{width}}  {len(jobs):>5}"
+
+
+def _stamp(path):
+    """Return modification time and size of a file, or None."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _files(paths):
+    """Yield files, recursing into directories."""
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                for fn in sorted(files):
+                    yield Path(root) / fn
+        else:
+            yield path
+
+
+def _config_values(configfiles, overrides):
+    """Return top-level string values of configuration files."""
+    values = []
+    for configfile in configfiles:
+        try:
+            with open(configfile, encoding="utf-8") as fh:
+                config = YAML(typ="safe").load(fh)
+        except (OSError, ValueError) as e:
+            logger.debug("cannot read %s: %s", configfile, e)
+            continue
+        if isinstance(config, dict):
+            values += [v for v in config.values() if isinstance(v, str)]
+    values += [x.partition("=")[2] for x in overrides or []]
+    return values
+
+
+def split_targets(args):
+    """Split snakemake arguments into options and targets.
+
+    Arguments are parsed with the snakemake command line parser.
+
+    :param list args: Snakemake command line arguments.
+    :return: Options, targets and parsed arguments.
+    :raises ImportError: If snakemake is not installed.
+    """
+    from snakemake import cli  # pylint: disable=import-outside-toplevel
+
+    args = wrappers.split_args(args)
+    _, parsed = cli.parse_args(args)
+    targets = list(parsed.targets or [])
+    remaining = list(targets)
+    options = []
+    for arg in args:
+        if arg in remaining:
+            remaining.remove(arg)
+        else:
+            options.append(arg)
+    return options, targets, parsed
+
+
+class DryRunCache:
+    """Cache of snakemake dry run job lists.
+
+    :param cache_dir: Directory of cache files. Defaults to the
+        environment variable SNAKEMAKE_DRYRUN_CACHE, or
+        .snakemake/dryrun-cache in the working directory.
+    """
+
+    def __init__(self, cache_dir=None):
+        cache_dir = cache_dir or os.environ.get(DRYRUN_CACHE_ENVVAR)
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+
+    def _cache_file(self, workdir, key):
+        cache_dir = self.cache_dir or Path(workdir) / ".snakemake" / "dryrun-cache"
+        return cache_dir / f"{key}.json"
+
+    @staticmethod
+    def key(options):
+        """Return cache key of snakemake options, excluding targets.
+
+        Relative paths in options are resolved by snakemake from the
+        current directory, which is therefore part of the key.
+        """
+        data = json.dumps([os.getcwd(), list(options)])
+        return hashlib.sha256(data.encode()).hexdigest()[:32]
+
+    @staticmethod
+    def fingerprint(parsed, workdir, sources=()):
+        """Return stamps of the files the DAG of a workflow depends on.
+
+        :param parsed: Parsed snakemake arguments.
+        :param workdir: Working directory.
+        :param sources: Workflow source files or directories.
+        :return: Mapping from file name to modification time and size.
+        :rtype: dict
+        """
+        workdir = Path(workdir)
+        snakefile = parsed.snakefile or workdir / "Snakefile"
+        configfiles = [Path(x) for x in parsed.configfile or []]
+        configfiles += [workdir / x for x in DEFAULT_CONFIGFILES]
+        files = [Path(snakefile), *_files(sources), *configfiles]
+        for value in _config_values(configfiles, parsed.config):
+            if value and (workdir / value).is_file():
+                files.append(workdir / value)
+        if parsed.profile:
+            profile = resolve_profile(parsed.profile, workdir)
+            if profile is not None:
+                files += [profile / x for x in PROFILE_CONFIG_FILES]
+        return {str(Path(x).absolute()): _stamp(x) for x in files}
+
+    @staticmethod
+    def _target_jobs(target, jobs):
+        """Return jobs needed for target, in dry run order."""
+        if target == "":
+            return list(jobs)
+        producers = {}
+        for job in jobs:
+            for output in job.output:
+                producers[output] = job
+        start = [j for j in jobs if j.rule == target]
+        if not start and target in producers:
+            start = [producers[target]]
+        needed = set()
+        while start:
+            job = start.pop()
+            if id(job) in needed:
+                continue
+            needed.add(id(job))
+            start += [producers[x] for x in job.input if x in producers]
+        return [j for j in jobs if id(j) in needed]
+
+    @staticmethod
+    def _output_stamps(workdir, target, jobs):
+        names = {target} if target else set()
+        for job in jobs:
+            names.update(job.output)
+        return {x: _stamp(Path(workdir) / x) for x in sorted(names)}
+
+    def _load(self, cache_file):
+        try:
+            with open(cache_file, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning("corrupt dry run cache %s; ignoring", cache_file)
+            return None
+        if data.get("version") != DRYRUN_CACHE_VERSION:
+            return None
+        return data
+
+    @staticmethod
+    def _save(cache_file, data):
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", dir=cache_file.parent, delete=False, encoding="utf-8"
+            ) as fh:
+                json.dump(data, fh)
+            os.replace(fh.name, cache_file)
+        except OSError as e:
+            logger.debug("could not write dry run cache %s: %s", cache_file, e)
+
+    def dry_run(self, options=None, snakefile=None, sources=(), runner=None):
+        """Return jobs of a dry run, running snakemake only if needed.
+
+        :param options: Snakemake options and targets.
+        :param snakefile: Snakefile.
+        :param sources: Workflow source files or directories to
+            fingerprint. Defaults to the snakemake and python files next
+            to the snakefile.
+        :param runner: Function called with options and targets that
+            returns dry run output lines. Defaults to :func:`run_dry_run`.
+        :rtype: DryRunResult
+        """
+        args = wrappers.split_args(options)
+        if snakefile is not None:
+            args = ["-s", str(snakefile)] + args
+        options, targets, parsed = split_targets(args)
+        targets = targets or [""]
+        workdir = Path(parsed.directory or os.getcwd())
+        if not sources and parsed.snakefile:
+            sources = [
+                x
+                for x in Path(parsed.snakefile).parent.iterdir()
+                if x.suffix in WORKFLOW_SUFFIXES or x.name == "Snakefile"
+            ]
+        fingerprint = self.fingerprint(parsed, workdir, sources)
+        cache_file = self._cache_file(workdir, self.key(options))
+        data = self._load(cache_file)
+        if data is None or data["fingerprint"] != fingerprint:
+            data = {
+                "version": DRYRUN_CACHE_VERSION,
+                "fingerprint": fingerprint,
+                "targets": {},
+            }
+        entries = data["targets"]
+        output = None
+        stale = []
+        for target in targets:
+            entry = entries.get(target)
+            if entry is None or entry["outputs"] != self._output_stamps(
+                workdir, target, [Job(**j) for j in entry["jobs"]]
+            ):
+                stale.append(target)
+        if stale:
+            logger.info(
+                "dry run for %s", ", ".join(t or "default target" for t in stale)
+            )
+            runner = runner or run_dry_run
+            lines = runner(options, [t for t in stale if t])
+            jobs = parse_dry_run(lines)
+            if is_parsed(lines, jobs):
+                for target in stale:
+                    target_jobs = self._target_jobs(target, jobs)
+                    entries[target] = {
+                        "outputs": self._output_stamps(workdir, target, target_jobs),
+                        "jobs": [asdict(j) for j in target_jobs],
+                    }
+                self._save(cache_file, data)
+            else:
+                logger.warning("no jobs found in dry run output; not caching it")
+                output = lines
+        jobs = {}
+        for target in targets:
+            if output is not None and target in stale:
+                continue
+            for job in entries[target]["jobs"]:
+                jobs.setdefault((job["rule"], tuple(job["output"])), Job(**job))
+        cached = [t for t in targets if t not in stale]
+        return DryRunResult(list(jobs.values()), cached, stale, output)
+
+
+def run_dry_run(options, targets):
+    """Run snakemake dry run and return its output lines.
+
+    :param list options: Snakemake options, including the snakefile.
+    :param list targets: Targets.
+    :raises subprocess.CalledProcessError: If the dry run fails.
+    """
+    lines = []
+    try:
+        result = wrappers.snakemake(
+            targets=targets,
+            options=list(options) + ["--dry-run"],
+            engine="process",
+            callback=lambda stream, line: lines.append(line),
+        )
+    except Exception:
+        for line in lines:
+            wrappers.echo("stderr", line)
+        raise
+    if result is None:
+        raise click.ClickException("snakemake not installed; cannot run dry run")
+    return lines
+
+
+def cached_dry_run(options=None, snakefile=None, sources=(), cache_dir=None):
+    """Print jobs of a cached snakemake dry run.
+
+    :param options: Snakemake options and targets.
+    :param snakefile: Snakefile.
+    :param sources: Workflow source files or directories.
+    :param cache_dir: Cache directory, see :class:`DryRunCache`.
+    :rtype: DryRunResult
+    """
+    result = DryRunCache(cache_dir).dry_run(options, snakefile, sources)
+    if result.output is not None:
+        click.echo("".join(result.output), nl=False)
+    elif not result.jobs:
+        click.echo("Nothing to be done.")
+    for job in result.jobs:
+        click.echo(f"{'localrule' if job.local else 'rule'} {job.rule}:")
+        if job.output:
+            click.echo(f"    output: {', '.join(job.output)}")
+        if job.reason:
+            click.echo(f"    reason: {job.reason}")
+    if result.jobs:
+        click.echo("Job stats:")
+        click.echo("\n".join(format_jobs(result.jobs)))
+    if result.cached:
+        total = len(result.cached) + len(result.computed)
+        click.echo(f"Jobs of {len(result.cached)} of {total} targets from cache.")
+    return result
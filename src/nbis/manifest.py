@@ -0,0 +1,105 @@
+"""Command manifest for the nbis-admin CLI.
+
+The manifest maps subcommand names to their short help text and the
+module that implements them. It allows the CLI to render help and
+shell completions without importing any command module; a module is
+only imported once one of its commands is actually run.
+
+The manifest is generated from the command modules and shipped with
+the package. Regenerate it after adding or changing a command with
+
+    python -m nbis.manifest
+"""
+
+import functools
+import importlib
+import inspect
+import json
+import logging
+import os
+
+from click.utils import make_default_short_help
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+
+def discover_commands(cmd_folder):
+    """Return sorted command names found in command folder."""
+    data = []
+    for filename in os.listdir(cmd_folder):
+        if filename.endswith(".py") and not filename.startswith("__"):
+            data.append(filename[:-3])
+    data.sort()
+    return data
+
+
+def build_manifest(module, cmd_folder):
+    """Build command manifest by importing all command modules.
+
+    :param str module: Dotted name of the commands package.
+    :param str cmd_folder: Path to the commands package directory.
+    :return: Mapping from command name to manifest entry.
+    :rtype: dict
+    """
+    manifest = {}
+    for name in discover_commands(cmd_folder):
+        mod = importlib.import_module(f"{module}.{name}")
+        cmd = mod.main
+        manifest[name] = {
+            "module": mod.__name__,
+            "help": cmd.help,
+            "short_help": cmd.short_help,
+            "hidden": cmd.hidden,
+            "deprecated": cmd.deprecated,
+        }
+    return manifest
+
+
+@functools.lru_cache
+def load_manifest(cmd_folder):
+    """Load command manifest from command folder.
+
+    The manifest is read once per process. Returns None if there is
+    no manifest.
+    """
+    path = os.path.join(cmd_folder, MANIFEST_FILE)
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        logger.debug("no command manifest at %s", path)
+        return None
+
+
+def write_manifest(module, cmd_folder):
+    """Build and write command manifest to command folder."""
+    manifest = build_manifest(module, cmd_folder)
+    path = os.path.join(cmd_folder, MANIFEST_FILE)
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+        fh.write("\n")
+    return manifest
+
+
+def short_help(entry, limit=45):
+    """Return short help string for manifest entry.
+
+    Mirrors :meth:`click.Command.get_short_help_str`.
+    """
+    if entry.get("short_help"):
+        text = inspect.cleandoc(entry["short_help"])
+    elif entry.get("help"):
+        text = make_default_short_help(entry["help"], limit)
+    else:
+        text = ""
+    if entry.get("deprecated"):
+        text = f"(Deprecated) {text}"
+    return text.strip()
+
+
+if __name__ == "__main__":
+    from nbis.cli import NbisCLI
+
+    write_manifest(NbisCLI.module, NbisCLI.cmd_folder)
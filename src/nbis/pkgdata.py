@@ -0,0 +1,75 @@
+"""Access to package data files.
+
+Schemas, templates and other package data are located with
+:mod:`importlib.resources` rather than ``pkg_resources``, whose import
+scans every installed distribution.
+
+Callers that need a file system path, such as the jinja loader or the
+schema cache, use :func:`path`. When the package is imported from a
+zip file, the resource is extracted to a temporary location on first
+use. Extracted paths are cached for the lifetime of the process and
+removed at exit.
+"""
+
+import atexit
+import contextlib
+import functools
+import logging
+import pathlib
+import tempfile
+from importlib import resources
+
+logger = logging.getLogger(__name__)
+
+_extracted = contextlib.ExitStack()
+atexit.register(_extracted.close)
+
+
+def files(package="nbis", resource=""):
+    """Return traversable for a package resource.
+
+    :param str package: Package name.
+    :param str resource: Resource name, relative to the package, with
+        '/' as separator.
+    :rtype: importlib.resources.abc.Traversable
+    """
+    traversable = resources.files(package)
+    for part in resource.split("/"):
+        if part:
+            traversable = traversable.joinpath(part)
+    return traversable
+
+
+def _copy_tree(traversable, dest):
+    """Copy traversable directory to dest."""
+    dest.mkdir(parents=True, exist_ok=True)
+    for child in traversable.iterdir():
+        if child.is_dir():
+            _copy_tree(child, dest / child.name)
+        else:
+            (dest / child.name).write_bytes(child.read_bytes())
+
+
+@functools.lru_cache(maxsize=None)
+def path(package="nbis", resource=""):
+    """Return file system path of a package resource.
+
+    Resources of packages installed as zip files are extracted, once
+    per process.
+
+    :param str package: Package name.
+    :param str resource: Resource name, relative to the package, with
+        '/' as separator.
+    :rtype: pathlib.Path
+    """
+    traversable = files(package, resource)
+    if isinstance(traversable, pathlib.Path):
+        return traversable
+    logger.debug("extracting %s resource %s", package, resource)
+    if not traversable.is_dir():
+        return _extracted.enter_context(resources.as_file(traversable))
+    # as_file only supports directories from Python 3.12
+    tmpdir = _extracted.enter_context(tempfile.TemporaryDirectory())
+    dest = pathlib.Path(tmpdir) / traversable.name
+    _copy_tree(traversable, dest)
+    return dest
@@ -0,0 +1,470 @@
+"""Batch rendering of documentation.
+
+Discover render targets in a documentation source directory and render
+them concurrently with the documentation wrappers. A target is an
+Rmarkdown (.Rmd), quarto (.qmd) or markdown (.md) file, or a jupyter
+book, which is a directory containing a _toc.yml file. Files inside a
+jupyter book are rendered by the book and are not separate targets.
+
+Every target writes its output to its own log file, and a failing
+target does not stop the others unless requested.
+
+Targets are only rendered if they are out of date. A fingerprint of
+each target records the hash of the source, of the local files it
+references (images, includes, bibliography, CSL and CSS files from the
+front matter) and of additional dependencies, along with the renderer
+arguments. A target is up to date if its fingerprint matches the one
+recorded at the last successful render and its output exists. The
+check is done here, for batch rendering; the renderers in
+:mod:`wrappers` always run.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import pathlib
+import re
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from ruamel.yaml import YAMLError
+
+from nbis import cache, wrappers
+from nbis.config import yaml_loader
+
+logger = logging.getLogger(__name__)
+
+SUFFIXES = {".rmd": "rmarkdown", ".qmd": "quarto", ".md": "markdown"}
+BOOK_TOC = "_toc.yml"
+
+REFERENCE_PATTERNS = [
+    re.compile(r"!\[[^\]]*\]\(\s*<?([^)\s>]+)"),
+    re.compile(r"""(?:src|href)\s*=\s*["']([^"']+)["']"""),
+    re.compile(r"""include_graphics\(\s*["']([^"']+)["']"""),
+    re.compile(r"\{\{<\s*include\s+([^\s>]+)\s*>\}\}"),
+]
+FRONT_MATTER_KEYS = ("bibliography", "csl", "css", "include-in-header")
+
+
+# Pandoc writers by output suffix
+PANDOC_FORMATS = {".html": "html", ".pdf": "latex", ".docx": "docx"}
+
+
+def _markdown(path, output_dir=None, **kwargs):
+    path = pathlib.Path(path)
+    output = _output_path(path, output_dir)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    fmt = _output_format(path)
+    writer = "beamer" if "beamer" in fmt else PANDOC_FORMATS[output.suffix]
+    return wrappers.pandoc(path, output, writer, **kwargs)
+
+
+def _jupyter_book(path, output_dir=None, **kwargs):  # pylint: disable=unused-argument
+    return wrappers.jupyter_book(path, **kwargs)
+
+
+RENDERERS = {
+    "rmarkdown": wrappers.rmarkdown,
+    "quarto": wrappers.quarto,
+    "markdown": _markdown,
+    "jupyter_book": _jupyter_book,
+}
+
+
+@dataclass(frozen=True)
+class RenderTarget:
+    """Render target.
+
+    :param path: Target file or book directory.
+    :param str kind: Renderer name, see :data:`RENDERERS`.
+    :param str name: Target name relative to the source directory.
+    """
+
+    path: pathlib.Path
+    kind: str
+    name: str
+
+
+@dataclass
+class RenderResult:
+    """Result of rendering a target."""
+
+    target: RenderTarget
+    ok: bool = False
+    seconds: float = 0.0
+    log: pathlib.Path | None = None
+    error: str | None = None
+    skipped: bool = False
+    uptodate: bool = False
+    reasons: tuple[str, ...] = ()
+
+    @property
+    def status(self):
+        """Status string for summaries."""
+        if self.skipped:
+            return "skipped"
+        if self.uptodate:
+            return "up to date"
+        return "ok" if self.ok else "failed"
+
+
+def discover(src, kinds=None):
+    """Discover render targets below src.
+
+    Hidden directories and build directories (starting with '_') are
+    not searched.
+
+    :param src: Documentation source directory.
+    :param kinds: Only return targets of these kinds.
+    :rtype: list[RenderTarget]
+    """
+    src = pathlib.Path(src)
+    targets = []
+    for root, dirs, files in os.walk(src):
+        root = pathlib.Path(root)
+        name = root.relative_to(src).as_posix()
+        if BOOK_TOC in files:
+            if name == ".":
+                name = src.name
+            targets.append(RenderTarget(root, "jupyter_book", name))
+            dirs[:] = []
+            continue
+        dirs[:] = sorted(d for d in dirs if not d.startswith((".", "_")))
+        for fn in sorted(files):
+            kind = SUFFIXES.get(os.path.splitext(fn)[1].lower())
+            if kind is not None:
+                rel = (root / fn).relative_to(src).as_posix()
+                targets.append(RenderTarget(root / fn, kind, rel))
+    if kinds is not None:
+        targets = [t for t in targets if t.kind in kinds]
+    return targets
+
+
+def front_matter(text):
+    """Return YAML front matter of a document as a dict."""
+    m = re.match(r"---\s*\n(.*?)\n(?:---|\.\.\.)\s*(?:\n|$)", text, re.DOTALL)
+    if m is None:
+        return {}
+    try:
+        data = yaml_loader().load(m.group(1))
+    except YAMLError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _is_local(ref):
+    # Links to html pages are navigation, not dependencies
+    return not (
+        "://" in ref
+        or ref.startswith(("#", "data:", "mailto:"))
+        or "{" in ref
+        or ref.split("#")[0].endswith((".html", ".htm"))
+    )
+
+
+def references(path):
+    """Return local files referenced by a document.
+
+    References are image links, src and href attributes,
+    include_graphics calls, quarto includes and files named in the
+    front matter. Referenced files need not exist.
+
+    :param path: Document file name.
+    :rtype: list[pathlib.Path]
+    """
+    path = pathlib.Path(path)
+    text = path.read_text(encoding="utf-8", errors="replace")
+    refs = []
+    for pattern in REFERENCE_PATTERNS:
+        refs.extend(pattern.findall(text))
+    meta = front_matter(text)
+    for key in FRONT_MATTER_KEYS:
+        value = meta.get(key)
+        if isinstance(value, str):
+            refs.append(value)
+        elif isinstance(value, list):
+            refs.extend(v for v in value if isinstance(v, str))
+    refs = {ref.split("#")[0].split("?")[0] for ref in refs if _is_local(ref)}
+    return sorted(path.parent / ref for ref in refs if ref)
+
+
+def _output_format(path):
+    meta = front_matter(path.read_text(encoding="utf-8", errors="replace"))
+    return str(meta.get("output") or meta.get("format") or "html")
+
+
+def output_suffix(fmt):
+    """Return output file suffix of a front matter output format.
+
+    :param str fmt: Value of the output or format front matter key.
+    :return: '.pdf', '.docx' or '.html'.
+    """
+    if "pdf" in fmt or "beamer" in fmt:
+        return ".pdf"
+    if "word" in fmt or "docx" in fmt:
+        return ".docx"
+    return ".html"
+
+
+def _output_path(path, output_dir=None):
+    outdir = pathlib.Path(output_dir) if output_dir else path.parent
+    return outdir / f"{path.stem}{output_suffix(_output_format(path))}"
+
+
+def output_file(target, output_dir=None):
+    """Return expected output of target.
+
+    The output format is read from the front matter, defaulting to
+    html. For jupyter books, the html build directory is returned.
+    """
+    if target.kind == "jupyter_book":
+        return target.path / "_build" / "html"
+    return _output_path(target.path, output_dir)
+
+
+def _safe_name(target):
+    """Return target name as a path that stays below a directory.
+
+    Names that are absolute or go up the directory tree, such as those
+    of targets outside the project home, are flattened to the file name
+    prefixed with a digest of the target path.
+    """
+    name = pathlib.PurePosixPath(target.name)
+    if name.is_absolute() or ".." in name.parts or not name.parts:
+        key = cache.key_digest(os.path.abspath(target.path))[:12]
+        name = pathlib.PurePosixPath(f"{key}-{target.path.name}")
+    return name
+
+
+def _digest(path):
+    try:
+        return cache.file_digest(path)
+    except OSError:
+        return None
+
+
+def _walk_book(root):
+    for dirpath, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith((".", "_")))
+        for fn in sorted(files):
+            path = pathlib.Path(dirpath) / fn
+            yield path.relative_to(root).as_posix(), path
+
+
+def fingerprint(target, *, output_dir=None, dependencies=()):
+    """Return fingerprint of target.
+
+    :param RenderTarget target: Render target.
+    :param output_dir: Output directory passed to the renderer.
+    :param dependencies: Additional files the target depends on, such
+        as the project bibliography.
+    :rtype: dict
+    """
+    if target.kind == "jupyter_book":
+        # A book depends on all its files
+        source = cache.key_digest(
+            *(f"{rel}:{cache.file_digest(fn)}" for rel, fn in _walk_book(target.path))
+        )
+        refs = []
+    else:
+        source = cache.file_digest(target.path)
+        refs = references(target.path)
+    assets = {
+        str(fn): _digest(fn) for fn in refs + [pathlib.Path(d) for d in dependencies]
+    }
+    return {
+        "source": source,
+        "assets": assets,
+        "args": {
+            "kind": target.kind,
+            "output_dir": None if output_dir is None else str(output_dir),
+        },
+    }
+
+
+def explain(old, new):
+    """Return reasons why fingerprint new differs from old.
+
+    :param dict old: Recorded fingerprint, or None.
+    :param dict new: Current fingerprint.
+    :rtype: list[str]
+    """
+    if old is None:
+        return ["no previous render"]
+    reasons = []
+    if old.get("source") != new["source"]:
+        reasons.append("source changed")
+    old_assets = old.get("assets", {})
+    for fn in sorted(set(old_assets) | set(new["assets"])):
+        if fn not in old_assets:
+            reasons.append(f"new dependency {fn}")
+        elif fn not in new["assets"]:
+            reasons.append(f"dropped dependency {fn}")
+        elif old_assets[fn] != new["assets"][fn]:
+            if new["assets"][fn] is None:
+                reasons.append(f"dependency {fn} removed")
+            else:
+                reasons.append(f"dependency {fn} changed")
+    if old.get("args") != new["args"]:
+        reasons.append("renderer arguments changed")
+    return reasons
+
+
+class RenderCache:
+    """Fingerprints of the last successful renders.
+
+    Every target has its own file, so that targets rendered in
+    different processes do not write to the same file.
+
+    :param path: Cache directory.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+
+    def _file(self, target, output_dir):
+        key = cache.key_digest(os.path.abspath(target.path), output_dir)
+        return self.path / f"{key}.json"
+
+    def get(self, target, output_dir=None):
+        """Return recorded fingerprint of target, or None."""
+        try:
+            with open(self._file(target, output_dir), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, target, data, output_dir=None):
+        """Record fingerprint of target."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.path, delete=False, encoding="utf-8"
+        ) as fh:
+            json.dump(data, fh)
+        os.replace(fh.name, self._file(target, output_dir))
+
+    def check(self, target, *, output_dir=None, dependencies=()):
+        """Check if target is out of date.
+
+        :return: Current fingerprint and reasons to render; the target
+            is up to date if there are no reasons.
+        :rtype: tuple[dict, list[str]]
+        """
+        new = fingerprint(target, output_dir=output_dir, dependencies=dependencies)
+        reasons = explain(self.get(target, output_dir), new)
+        if not reasons and not output_file(target, output_dir).exists():
+            reasons.append("output missing")
+        return new, reasons
+
+
+def render_target(
+    target, *, output_dir=None, logdir=None, cachedir=None, force=False, dependencies=()
+):  # pylint: disable=too-many-arguments
+    """Render a single target, recording failures in the result.
+
+    :param RenderTarget target: Target to render.
+    :param output_dir: Output directory.
+    :param logdir: Log directory. The log file name is the target name
+        with suffix .log; names outside the source directory are
+        flattened.
+    :param cachedir: Render cache directory. If set, targets that are
+        up to date are not rendered.
+    :param bool force: Render even if up to date.
+    :param dependencies: Additional files the target depends on.
+    :rtype: RenderResult
+    """
+    result = RenderResult(target)
+    if logdir is not None:
+        name = _safe_name(target)
+        result.log = pathlib.Path(logdir) / name.with_name(f"{name.name}.log")
+    t0 = time.perf_counter()
+    render_cache = new = None
+    try:
+        if cachedir is not None:
+            render_cache = RenderCache(cachedir)
+            new, reasons = render_cache.check(
+                target, output_dir=output_dir, dependencies=dependencies
+            )
+            result.reasons = tuple(["forced"] if force else reasons)
+            if not result.reasons:
+                result.ok = result.uptodate = True
+                return result
+        RENDERERS[target.kind](
+            target.path, output_dir=output_dir, callback=None, logfile=result.log
+        )
+        result.ok = True
+    except (OSError, subprocess.CalledProcessError) as e:
+        result.error = str(e)
+        logger.error("%s: %s", target.name, e)
+    if result.ok and render_cache is not None:
+        render_cache.put(target, new, output_dir)
+    result.seconds = time.perf_counter() - t0
+    return result
+
+
+def render_all(
+    targets,
+    *,
+    output_dir=None,
+    logdir=None,
+    workers=1,
+    keep_going=True,
+    **kwargs,
+):  # pylint: disable=too-many-arguments
+    """Render targets on a process pool.
+
+    :param list targets: Render targets, see :func:`discover`.
+    :param output_dir: Output directory. Outputs keep the directory
+        structure of the targets. Jupyter books are always built in
+        their _build directory.
+    :param logdir: Log directory.
+    :param int workers: Number of processes; 0 uses all cores, 1
+        renders in this process.
+    :param bool keep_going: Keep rendering other targets when a target
+        fails. Otherwise, targets that have not started are skipped.
+    :param kwargs: Keyword arguments passed to :func:`render_target`.
+    :return: Results in target order.
+    :rtype: list[RenderResult]
+    """
+
+    def _output_dir(target):
+        if output_dir is None:
+            return None
+        return pathlib.Path(output_dir) / _safe_name(target).parent
+
+    results = {}
+    if workers == 1 or len(targets) <= 1:
+        for target in targets:
+            if not keep_going and any(not r.ok for r in results.values()):
+                results[target] = RenderResult(target, skipped=True)
+                continue
+            results[target] = render_target(
+                target, output_dir=_output_dir(target), logdir=logdir, **kwargs
+            )
+        return [results[t] for t in targets]
+    with ProcessPoolExecutor(max_workers=workers or None) as executor:
+        futures = {
+            executor.submit(
+                render_target,
+                target,
+                output_dir=_output_dir(target),
+                logdir=logdir,
+                **kwargs,
+            ): target
+            for target in targets
+        }
+        for future in as_completed(futures):
+            target = futures[future]
+            if future.cancelled():
+                results[target] = RenderResult(target, skipped=True)
+                continue
+            results[target] = future.result()
+            if not keep_going and not results[target].ok:
+                for f in futures:
+                    f.cancel()
+    return [results[t] for t in targets]
@@ -0,0 +1,368 @@
+"""Run history of wrapped commands.
+
+Every command run through :mod:`wrappers`, such as snakemake, pandoc,
+rmarkdown or jupyter-book, is recorded in a per-project SQLite
+database, by default ``.nbis-admin/runs.sqlite`` in the project home.
+The project home is the closest directory, starting from the current
+directory, that contains a ``.nbis-admin`` directory or the project
+configuration file, ``<name>.yaml`` in a directory named ``<name>``.
+Runs outside a project are recorded in ``runs.sqlite`` in the user
+cache directory. The environment variable NBIS_ADMIN_RUN_HISTORY
+overrides the database location, and disables recording if set to the
+empty string.
+
+The database is opened in WAL mode and each run is inserted in its own
+short transaction, so that concurrent processes can record runs
+without blocking each other for long. Failures to record a run are
+logged and otherwise ignored.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import pathlib
+import re
+import shlex
+import socket
+import sqlite3
+from dataclasses import astuple, dataclass, fields
+
+logger = logging.getLogger(__name__)
+
+RUN_HISTORY_ENVVAR = "NBIS_ADMIN_RUN_HISTORY"
+CACHE_DIR_ENVVAR = "NBIS_ADMIN_CACHE_DIR"
+PROJECT_DIR = ".nbis-admin"
+HISTORY_FILE = "runs.sqlite"
+SCHEMA_VERSION = 1
+BUSY_TIMEOUT = 30.0
+PERIODS = {"day": "%Y-%m-%d", "week": "%Y-W%W", "month": "%Y-%m"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    command TEXT NOT NULL,
+    args TEXT NOT NULL,
+    profile TEXT,
+    cores TEXT,
+    jobs TEXT,
+    threads TEXT,
+    started REAL NOT NULL,
+    finished REAL NOT NULL,
+    seconds REAL NOT NULL,
+    returncode INTEGER NOT NULL,
+    maxrss INTEGER,
+    cwd TEXT,
+    host TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_command_started ON runs (command, started);
+"""
+
+# Options recorded in separate columns, by column
+RUN_OPTIONS = {
+    "profile": ("--profile",),
+    "cores": ("--cores", "-c"),
+    "jobs": ("--jobs", "-j"),
+    "threads": ("--threads", "-t"),
+}
+SUBCOMMAND_REGEX = re.compile(r"^[a-z][a-z-]*$")
+
+
+@dataclass
+class RunRecord:  # pylint: disable=too-many-instance-attributes
+    """Recorded command run.
+
+    :param str command: Command name, see :func:`command_name`.
+    :param list args: Command arguments.
+    :param str profile: Snakemake profile, if given.
+    :param str cores: Number of cores, if given.
+    :param str jobs: Number of jobs, if given.
+    :param str threads: Number of threads, if given.
+    :param float started: Start time, in seconds since the epoch.
+    :param float finished: End time, in seconds since the epoch.
+    :param float seconds: Wall time.
+    :param int returncode: Exit code.
+    :param int maxrss: Peak resident set size in kilobytes, or None.
+    :param str cwd: Working directory.
+    :param str host: Host name.
+    :param int id: Row id; None for records not yet stored.
+    """
+
+    command: str
+    args: list
+    profile: str = None
+    cores: str = None
+    jobs: str = None
+    threads: str = None
+    started: float = 0.0
+    finished: float = 0.0
+    seconds: float = 0.0
+    returncode: int = 0
+    maxrss: int = None
+    cwd: str = None
+    host: str = None
+    id: int = None
+
+    @property
+    def ok(self):
+        """True if the command succeeded."""
+        return self.returncode == 0
+
+
+def command_name(args):
+    """Return name under which runs of a command are aggregated.
+
+    The name is the program name, followed by the snakefile name for
+    snakemake, or by the subcommand for programs such as quarto or
+    jupyter-book.
+
+    :param list args: Command arguments.
+    """
+    name = os.path.basename(args[0]) if args else ""
+    if name == "snakemake":
+        for i, arg in enumerate(args):
+            if arg in ("-s", "--snakefile") and i + 1 < len(args):
+                return f"{name} {pathlib.Path(args[i + 1]).stem}"
+            if arg.startswith("--snakefile="):
+                return f"{name} {pathlib.Path(arg.split('=', 1)[1]).stem}"
+        return name
+    if len(args) > 1 and SUBCOMMAND_REGEX.match(args[1]):
+        return f"{name} {args[1]}"
+    return name
+
+
+def run_options(args):
+    """Return profile, cores, jobs and threads of a snakemake command.
+
+    Options are only extracted from snakemake arguments; the values
+    are None for other commands.
+
+    :param list args: Command arguments.
+    :rtype: dict
+    """
+    values = dict.fromkeys(RUN_OPTIONS)
+    if not args or os.path.basename(args[0]) != "snakemake":
+        return values
+    for i, arg in enumerate(args):
+        for key, names in RUN_OPTIONS.items():
+            for name in names:
+                if arg == name:
+                    value = args[i + 1] if i + 1 < len(args) else None
+                elif name.startswith("--") and arg.startswith(f"{name}="):
+                    value = arg.split("=", 1)[1]
+                elif not name.startswith("--") and arg.startswith(name):
+                    value = arg[len(name) :]
+                else:
+                    continue
+                if value is not None and not value.startswith("-"):
+                    values[key] = value
+    return values
+
+
+def _is_project_home(path):
+    return (path / PROJECT_DIR).is_dir() or (path / f"{path.name}.yaml").is_file()
+
+
+def _user_history_path():
+    # Same location as nbis.cache.user_cache_dir, which generated
+    # projects cannot import
+    root = os.environ.get(CACHE_DIR_ENVVAR)
+    if root is None:
+        xdg = os.environ.get("XDG_CACHE_HOME", pathlib.Path.home() / ".cache")
+        root = pathlib.Path(xdg) / "nbis-admin"
+    return pathlib.Path(root) / HISTORY_FILE
+
+
+def history_path(home=None):
+    """Return run history database file name.
+
+    :param home: Project home. If None, the closest directory with a
+        .nbis-admin directory or project configuration file, starting
+        from the current directory; outside a project, the database
+        in the user cache directory is used.
+    :return: Database file name, or None if runs are not recorded.
+    :rtype: pathlib.Path
+    """
+    path = os.environ.get(RUN_HISTORY_ENVVAR)
+    if path is not None:
+        return pathlib.Path(path) if path else None
+    if home is None:
+        cwd = pathlib.Path.cwd()
+        home = next((d for d in [cwd, *cwd.parents] if _is_project_home(d)), None)
+        if home is None:
+            return _user_history_path()
+    return pathlib.Path(home) / PROJECT_DIR / HISTORY_FILE
+
+
+class RunHistory:
+    """SQLite store of command runs.
+
+    :param path: Database file name. The database is created on first
+        use.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+
+    def connect(self):
+        """Return connection, creating the database if needed."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        con = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        con.row_factory = sqlite3.Row
+        if con.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(SCHEMA)
+            con.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    def add(self, record):
+        """Insert run record.
+
+        :param RunRecord record: Run to record.
+        :return: Row id of the record.
+        """
+        values = astuple(record)[:-1]
+        values = (values[0], shlex.join(values[1]), *values[2:])
+        columns = [f.name for f in fields(RunRecord)][:-1]
+        con = self.connect()
+        try:
+            cursor = con.execute(
+                f"INSERT INTO runs ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                values,
+            )
+            return cursor.lastrowid
+        finally:
+            con.close()
+
+    @staticmethod
+    def _record(row):
+        data = dict(row)
+        data["args"] = shlex.split(data["args"])
+        return RunRecord(**data)
+
+    def _select(self, sql, params=()):
+        if not self.path.exists():
+            return []
+        con = self.connect()
+        try:
+            return con.execute(sql, params).fetchall()
+        finally:
+            con.close()
+
+    @staticmethod
+    def _where(command=None, since=None, failed=False):
+        clauses, params = [], []
+        if command is not None:
+            clauses.append("command = ?")
+            params.append(command)
+        if since is not None:
+            clauses.append("started >= ?")
+            params.append(since)
+        if failed:
+            clauses.append("returncode != 0")
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def runs(self, command=None, *, since=None, failed=False, limit=None):
+        """Return runs, most recent first.
+
+        :param str command: Only return runs of command.
+        :param float since: Only return runs started after this time.
+        :param bool failed: Only return failed runs.
+        :param int limit: Maximum number of runs.
+        :rtype: list[RunRecord]
+        """
+        where, params = self._where(command, since, failed)
+        sql = f"SELECT * FROM runs{where} ORDER BY started DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [self._record(row) for row in self._select(sql, params)]
+
+    def slowest(self, command=None, *, since=None, limit=10):
+        """Return the slowest runs, slowest first.
+
+        :param str command: Only return runs of command.
+        :param float since: Only return runs started after this time.
+        :param int limit: Maximum number of runs.
+        :rtype: list[RunRecord]
+        """
+        where, params = self._where(command, since)
+        sql = f"SELECT * FROM runs{where} ORDER BY seconds DESC LIMIT {int(limit)}"
+        return [self._record(row) for row in self._select(sql, params)]
+
+    def summary(self, *, since=None):
+        """Return run statistics per command.
+
+        :param float since: Only include runs started after this time.
+        :return: Rows with command, runs, failed, mean, max and total
+            wall time, peak memory and time of the last run, sorted
+            by total wall time.
+        :rtype: list[dict]
+        """
+        where, params = self._where(since=since)
+        sql = (
+            "SELECT command, COUNT(*) AS runs, "
+            "SUM(returncode != 0) AS failed, AVG(seconds) AS mean, "
+            "MAX(seconds) AS max, SUM(seconds) AS total, "
+            "MAX(maxrss) AS maxrss, MAX(started) AS last "
+            f"FROM runs{where} GROUP BY command ORDER BY total DESC"
+        )
+        return [dict(row) for row in self._select(sql, params)]
+
+    def trend(self, command, *, period="day", since=None):
+        """Return wall time statistics of a command per time period.
+
+        :param str command: Command name.
+        :param str period: 'day', 'week' or 'month'.
+        :param float since: Only include runs started after this time.
+        :return: Rows with period, runs, mean, min and max wall time,
+            oldest period first.
+        :rtype: list[dict]
+        """
+        where, params = self._where(command, since)
+        sql = (
+            f"SELECT strftime('{PERIODS[period]}', started, 'unixepoch', "
+            "'localtime') AS period, COUNT(*) AS runs, AVG(seconds) AS mean, "
+            "MIN(seconds) AS min, MAX(seconds) AS max "
+            f"FROM runs{where} GROUP BY period ORDER BY period"
+        )
+        return [dict(row) for row in self._select(sql, params)]
+
+
+def record_run(args, started, finished, returncode, maxrss=None, path=None):
+    """Record a command run in the project run history.
+
+    Errors are logged and ignored, so that recording never makes a
+    command fail.
+
+    :param list args: Command arguments.
+    :param float started: Start time, in seconds since the epoch.
+    :param float finished: End time, in seconds since the epoch.
+    :param int returncode: Exit code.
+    :param int maxrss: Peak resident set size in kilobytes.
+    :param path: Database file name; defaults to :func:`history_path`.
+    :return: Stored record, or None if the run was not recorded.
+    """
+    try:
+        path = path or history_path()
+        if path is None:
+            return None
+        args = [str(x) for x in args]
+        record = RunRecord(
+            command_name(args),
+            args,
+            started=started,
+            finished=finished,
+            seconds=finished - started,
+            returncode=returncode,
+            maxrss=maxrss,
+            cwd=os.getcwd(),
+            host=socket.gethostname(),
+            **run_options(args),
+        )
+        record.id = RunHistory(path).add(record)
+    except (sqlite3.Error, OSError) as e:
+        logger.debug("could not record run in %s: %s", path, e)
+        return None
+    return record
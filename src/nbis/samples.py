@@ -0,0 +1,616 @@
+"""Sample sheet validation.
+
+Validate tabular sample sheets, such as resources/samples.tsv, row
+by row against a sample schema with :meth:`nbis.config.Schema.validate`.
+Rows are streamed from file, so memory use is bounded by the chunk
+size, and validation stops once a configurable number of failing rows
+has been found. Large files can be split across processes.
+
+Cell values are read as strings. Empty cells are treated as missing
+values and are omitted from the validated row. Values in columns whose
+schema does not allow strings are converted to integers, numbers or
+booleans if the schema allows it. Blank lines are skipped.
+
+If pandas is installed, chunks of rows are by default validated
+column-wise by a :class:`CompiledSchema`, which translates the subset
+of JSON Schema used by sample schemas (type, required, enum, pattern,
+length and range constraints, properties, patternProperties and
+additionalProperties) to pandas operations. Constructs that cannot be
+compiled fall back to jsonschema, per distinct cell value or per row.
+Error messages are always produced by jsonschema for the failing rows.
+"""
+
+from __future__ import annotations
+
+import csv
+import importlib.util
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+import jsonschema
+
+from nbis.config import DefaultSchemaValidator, Schema, read_schema
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNKSIZE = 10000
+
+
+@dataclass(frozen=True)
+class SampleError:
+    """Failing row in a sample sheet.
+
+    :param int line: Line number in file (the header is line 1).
+    :param str message: Validation error message.
+    """
+
+    line: int
+    message: str
+
+    def __str__(self):
+        return f"line {self.line}: {self.message}"
+
+
+@dataclass
+class SampleReport:
+    """Result of sample sheet validation."""
+
+    rows: int = 0
+    errors: list[SampleError] = field(default_factory=list)
+    truncated: bool = False
+
+    @property
+    def valid(self):
+        """Return True if no row failed validation."""
+        return len(self.errors) == 0
+
+
+def _types(subschema):
+    value = subschema.get("type")
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return {value}
+    return set(value)
+
+
+def _intersect(a, b):
+    """Intersect JSONSchema type sets, where integer is a number."""
+
+    def allows(t, types):
+        return t in types or (t == "integer" and "number" in types)
+
+    return {t for t in a | b if allows(t, a) and allows(t, b)}
+
+
+def column_types(schema, columns):
+    """Return allowed value types for columns.
+
+    A column is governed by its entry in ``properties`` and by all
+    matching ``patternProperties``. The allowed types of a column is
+    the intersection of the types of its subschemas, or None if no
+    subschema sets a type.
+
+    :param dict schema: JSONSchema dictionary.
+    :param list columns: Column names.
+    :rtype: dict
+    """
+    properties = schema.get("properties", {})
+    patterns = schema.get("patternProperties", {})
+    result = {}
+    for col in columns:
+        subschemas = []
+        if col in properties:
+            subschemas.append(properties[col])
+        for pattern, subschema in patterns.items():
+            if re.search(pattern, col):
+                subschemas.append(subschema)
+        allowed = None
+        for subschema in subschemas:
+            types = _types(subschema) if isinstance(subschema, dict) else None
+            if types is None:
+                continue
+            allowed = types if allowed is None else _intersect(allowed, types)
+        result[col] = allowed
+    return result
+
+
+def coerce(value: str, types: set | None) -> Any:
+    """Convert string value to a type allowed by types.
+
+    Strings are kept if types is None or allows strings. Values that
+    cannot be converted are returned unchanged.
+    """
+    if types is None or "string" in types:
+        return value
+    if "integer" in types or "number" in types:
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    if "number" in types:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    if "boolean" in types and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    return value
+
+
+def make_row(header, values, types):
+    """Make a row dictionary from header and cell values.
+
+    Empty cells are omitted.
+    """
+    return {
+        col: coerce(value, types[col])
+        for col, value in zip(header, values)
+        if value != ""
+    }
+
+
+def format_error(error: jsonschema.exceptions.ValidationError) -> str:
+    """Format validation error message, prefixed by column if any."""
+    if error.path:
+        return f"{'/'.join(str(p) for p in error.path)}: {error.message}"
+    return error.message
+
+
+def iter_rows(path, *, delimiter="\t") -> Iterator[tuple[int, list[str]]]:
+    """Iterate over data rows in sample sheet.
+
+    The first row yielded is the header.
+
+    :return: Iterator of tuples (line number, cell values).
+    """
+    with open(path, encoding="utf-8", newline="") as fh:
+        reader = csv.reader(fh, delimiter=delimiter)
+        line = 1
+        for values in reader:
+            yield line, values
+            line = reader.line_num + 1
+
+
+def iter_chunks(
+    path, *, chunksize=DEFAULT_CHUNKSIZE, delimiter="\t"
+) -> Iterator[tuple[list[str], list[tuple[int, list[str]]]]]:
+    """Iterate over chunks of data rows in sample sheet.
+
+    :return: Iterator of tuples (header, rows), where rows is a list of
+        at most chunksize tuples (line number, cell values).
+    """
+    rows = iter_rows(path, delimiter=delimiter)
+    try:
+        _, header = next(rows)
+    except StopIteration:
+        return
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunksize:
+            yield header, chunk
+            chunk = []
+    if chunk:
+        yield header, chunk
+
+
+# Keywords that are compiled to column operations. Other validation
+# keywords in a property subschema are checked by jsonschema per
+# distinct value; other top-level keywords disable compilation.
+COLUMN_KEYWORDS = {
+    "type",
+    "enum",
+    "pattern",
+    "minLength",
+    "maxLength",
+    "minimum",
+    "maximum",
+    "exclusiveMinimum",
+    "exclusiveMaximum",
+}
+OBJECT_KEYWORDS = {
+    "type",
+    "properties",
+    "patternProperties",
+    "additionalProperties",
+    "required",
+}
+# Schema is validated without format checker, so format is an annotation
+ANNOTATIONS = {"format"}
+
+
+def _validation_keywords(subschema):
+    return set(subschema) & set(DefaultSchemaValidator.VALIDATORS) - ANNOTATIONS
+
+
+class CompiledSchema:
+    """Sample schema compiled to column-wise pandas checks.
+
+    :param schema: :class:`nbis.config.Schema`.
+    """
+
+    def __init__(self, schema: Schema) -> None:
+        self._schema = schema
+        self._dict = schema.asdict() or {}
+        keywords = _validation_keywords(self._dict)
+        self.compiled = keywords <= OBJECT_KEYWORDS and "$ref" not in repr(schema)
+        if not self.compiled:
+            logger.debug(
+                "cannot compile keywords %s; validating per row",
+                keywords - OBJECT_KEYWORDS,
+            )
+
+    def _subschemas(self, col):
+        """Return subschemas that apply to column."""
+        properties = self._dict.get("properties", {})
+        patterns = self._dict.get("patternProperties", {})
+        subschemas = []
+        if col in properties:
+            subschemas.append(properties[col])
+        for pattern, subschema in patterns.items():
+            if re.search(pattern, col):
+                subschemas.append(subschema)
+        additional = self._dict.get("additionalProperties", True)
+        if not subschemas and additional is not True:
+            subschemas.append(additional)
+        return subschemas
+
+    def failing(self, header, rows):
+        """Return boolean mask of failing rows.
+
+        :param list header: Column names.
+        :param list rows: Lists of cell values.
+        :rtype: pandas.Series
+        """
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+
+        n = len(header)
+        data = pd.DataFrame(
+            [(values + [""] * n)[:n] for values in rows],
+            columns=range(n),
+            dtype=object,
+        )
+        if not self.compiled or len(set(header)) < n:
+            types = column_types(self._dict, header)
+            return pd.Series(
+                [
+                    not self._schema_is_valid(make_row(header, values, types))
+                    for values in rows
+                ],
+                index=data.index,
+            )
+        failed = pd.Series(False, index=data.index)
+        if "type" in self._dict and "object" not in _types(self._dict):
+            return ~failed
+        for name in self._dict.get("required", []):
+            if name not in header:
+                return ~failed
+        types = column_types(self._dict, header)
+        for i, col in enumerate(header):
+            raw = data[i]
+            present = raw != ""
+            if col in self._dict.get("required", []):
+                failed |= ~present
+            if not present.any():
+                continue
+            failed |= self._failing_column(raw, present, types[col], col)
+        return failed
+
+    def _schema_is_valid(self, row):
+        try:
+            self._schema.validate(row)
+        except jsonschema.exceptions.ValidationError:
+            return False
+        return True
+
+    def _failing_column(self, raw, present, types, col):
+        """Return mask of rows whose value in column fails."""
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+
+        failed = pd.Series(False, index=raw.index)
+        subschemas = self._subschemas(col)
+        if not subschemas:
+            return failed
+        values = raw[present]
+        if types is None or "string" in types:
+            kind = pd.Series("str", index=values.index)
+            coerced = values
+        else:
+            mapping = {v: coerce(v, types) for v in values.unique()}
+            coerced = values.map(mapping)
+            kind = coerced.map(lambda v: type(v).__name__)
+        is_str = kind == "str"
+        is_num = kind.isin(["int", "float"])
+        for subschema in subschemas:
+            if subschema is True:
+                continue
+            if subschema is False:
+                failed[values.index] = True
+                continue
+            bad = self._failing_values(subschema, coerced, kind, is_str, is_num)
+            failed[bad.index[bad]] = True
+        return failed
+
+    def _failing_values(self, subschema, coerced, kind, is_str, is_num):
+        """Return mask of values that fail subschema."""
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+
+        bad = pd.Series(False, index=coerced.index)
+        keywords = _validation_keywords(subschema)
+        if keywords - COLUMN_KEYWORDS:
+            validator = DefaultSchemaValidator(subschema)
+            mapping = {}
+            for v in coerced:
+                key = (type(v), v)
+                if key not in mapping:
+                    mapping[key] = not validator.is_valid(v)
+            return pd.Series(
+                [mapping[(type(v), v)] for v in coerced], index=coerced.index
+            )
+        if "type" in subschema:
+            allowed = _types(subschema)
+            ok = pd.Series(False, index=coerced.index)
+            if "string" in allowed:
+                ok |= is_str
+            if "boolean" in allowed:
+                ok |= kind == "bool"
+            if "number" in allowed:
+                ok |= is_num
+            if "integer" in allowed:
+                ok |= kind == "int"
+                floats = kind == "float"
+                if floats.any():
+                    ok[floats] |= coerced[floats].map(float.is_integer).astype(bool)
+            bad |= ~ok
+        strings = coerced[is_str]
+        if "enum" in subschema:
+            members = subschema["enum"]
+            bad[is_str] |= ~strings.isin([m for m in members if isinstance(m, str)])
+            other = ~is_str
+            if other.any():
+                validator = DefaultSchemaValidator({"enum": members})
+                bad[other] |= (
+                    coerced[other].map(lambda v: not validator.is_valid(v)).astype(bool)
+                )
+        if "pattern" in subschema:
+            bad[is_str] |= ~strings.str.contains(subschema["pattern"], regex=True)
+        if "minLength" in subschema:
+            bad[is_str] |= strings.str.len() < subschema["minLength"]
+        if "maxLength" in subschema:
+            bad[is_str] |= strings.str.len() > subschema["maxLength"]
+        numbers = coerced[is_num].astype(object)
+        if "minimum" in subschema:
+            bad[is_num] |= (numbers < subschema["minimum"]).astype(bool)
+        if "maximum" in subschema:
+            bad[is_num] |= (numbers > subschema["maximum"]).astype(bool)
+        if "exclusiveMinimum" in subschema:
+            bad[is_num] |= (numbers <= subschema["exclusiveMinimum"]).astype(bool)
+        if "exclusiveMaximum" in subschema:
+            bad[is_num] |= (numbers >= subschema["exclusiveMaximum"]).astype(bool)
+        return bad
+
+
+def resolve_engine(engine="auto"):
+    """Resolve validation engine name.
+
+    :param str engine: One of "auto", "row" or "column". "auto"
+        resolves to "column" if pandas is installed, else to "row".
+    """
+    has_pandas = importlib.util.find_spec("pandas") is not None
+    if engine == "auto":
+        return "column" if has_pandas else "row"
+    if engine == "column" and not has_pandas:
+        raise ImportError("column validation engine requires pandas")
+    if engine not in ("row", "column"):
+        raise ValueError(f"no such validation engine {engine}")
+    return engine
+
+
+def _add_error(schema, header, types, line, values, report, max_errors):
+    """Validate row and add error to report if it fails.
+
+    Returns False once max_errors has been reached.
+    """
+    try:
+        schema.validate(make_row(header, values, types))
+    except jsonschema.exceptions.ValidationError as e:
+        report.errors.append(SampleError(line, format_error(e)))
+        if max_errors is not None and len(report.errors) >= max_errors:
+            report.truncated = True
+            return False
+    else:
+        logger.warning("line %i: compiled schema rejected a valid row", line)
+    return True
+
+
+def _validate_rows(
+    schema, header, rows, report, max_errors, engine="row", chunksize=None
+):  # pylint: disable=too-many-arguments
+    """Validate rows, adding errors to report.
+
+    Returns False once max_errors has been reached.
+    """
+    types = column_types(schema.asdict(), header)
+    if engine == "row":
+        for line, values in rows:
+            if not values:
+                continue
+            report.rows += 1
+            try:
+                schema.validate(make_row(header, values, types))
+            except jsonschema.exceptions.ValidationError as e:
+                report.errors.append(SampleError(line, format_error(e)))
+                if max_errors is not None and len(report.errors) >= max_errors:
+                    report.truncated = True
+                    return False
+        return True
+
+    compiled = CompiledSchema(schema)
+    chunksize = chunksize or DEFAULT_CHUNKSIZE
+
+    def flush(chunk):
+        mask = compiled.failing(header, [values for _, values in chunk])
+        for (line, values), failed in zip(chunk, mask):
+            report.rows += 1
+            if failed and not _add_error(
+                schema, header, types, line, values, report, max_errors
+            ):
+                return False
+        return True
+
+    chunk = []
+    for line, values in rows:
+        if not values:
+            continue
+        chunk.append((line, values))
+        if len(chunk) >= chunksize:
+            if not flush(chunk):
+                return False
+            chunk = []
+    if chunk:
+        return flush(chunk)
+    return True
+
+
+def _split(path, nparts):
+    """Split file into byte ranges aligned to line starts.
+
+    Returns header line and list of (start, end) offsets of the data
+    section.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as fh:
+        header = fh.readline()
+        data_start = fh.tell()
+        offsets = [data_start]
+        for i in range(1, nparts):
+            pos = data_start + (size - data_start) * i // nparts
+            if pos <= offsets[-1]:
+                continue
+            fh.seek(pos - 1)
+            fh.readline()
+            pos = fh.tell()
+            if pos >= size:
+                break
+            if pos > offsets[-1]:
+                offsets.append(pos)
+        offsets.append(size)
+    return header, list(zip(offsets[:-1], offsets[1:]))
+
+
+def _validate_range(
+    path, start, end, schema_dict, delimiter, max_errors, engine, chunksize
+):  # pylint: disable=too-many-arguments
+    """Validate rows in byte range of file.
+
+    Returns number of lines in range and report with line numbers
+    relative to the start of the range.
+    """
+    schema = Schema(schema_dict)
+    report = SampleReport()
+    with open(path, "rb") as fh:
+        header = next(csv.reader([fh.readline().decode("utf-8")], delimiter=delimiter))
+        fh.seek(start)
+        nlines = 0
+
+        def lines():
+            nonlocal nlines
+            while fh.tell() < end:
+                line = fh.readline()
+                if not line:
+                    break
+                nlines += 1
+                yield nlines, line.decode("utf-8")
+
+        def rows():
+            for lineno, line in lines():
+                yield lineno, next(csv.reader([line], delimiter=delimiter))
+
+        _validate_rows(schema, header, rows(), report, max_errors, engine, chunksize)
+        # Count remaining lines so line numbers in later ranges are correct
+        while fh.tell() < end:
+            buf = fh.read(min(1 << 20, end - fh.tell()))
+            if not buf:
+                break
+            nlines += buf.count(b"\n")
+    return nlines, report
+
+
+def validate_samples(
+    path,
+    schema,
+    *,
+    max_errors=None,
+    processes=1,
+    delimiter="\t",
+    engine="auto",
+    chunksize=DEFAULT_CHUNKSIZE,
+) -> SampleReport:
+    """Validate sample sheet against schema.
+
+    :param path: Sample sheet file name.
+    :param schema: :class:`nbis.config.Schema` or schema file name.
+    :param int max_errors: Stop after this many failing rows. Validate
+        all rows if None.
+    :param int processes: Number of processes. If larger than one, the
+        file is split in byte ranges that are validated in parallel.
+        This requires that records do not span several lines.
+    :param str delimiter: Column delimiter.
+    :param str engine: Validation engine; "row" validates each row with
+        jsonschema, "column" validates chunks of rows with a
+        :class:`CompiledSchema`. See :func:`resolve_engine`.
+    :param int chunksize: Number of rows per chunk in column engine.
+    :rtype: SampleReport
+    """
+    engine = resolve_engine(engine)
+    if not isinstance(schema, Schema):
+        schema = read_schema(schema)
+    if processes is None or processes < 1:
+        processes = os.cpu_count() or 1
+    if processes == 1:
+        report = SampleReport()
+        rows = iter_rows(path, delimiter=delimiter)
+        try:
+            _, header = next(rows)
+        except StopIteration:
+            return report
+        _validate_rows(schema, header, rows, report, max_errors, engine, chunksize)
+        return report
+
+    _, ranges = _split(path, processes)
+    report = SampleReport()
+    schema_dict = schema.asdict()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [
+            executor.submit(
+                _validate_range,
+                path,
+                start,
+                end,
+                schema_dict,
+                delimiter,
+                max_errors,
+                engine,
+                chunksize,
+            )
+            for start, end in ranges
+        ]
+        offset = 1
+        for future in futures:
+            nlines, part = future.result()
+            report.rows += part.rows
+            report.truncated = report.truncated or part.truncated
+            report.errors.extend(
+                SampleError(e.line + offset, e.message) for e in part.errors
+            )
+            offset += nlines
+    if max_errors is not None and len(report.errors) >= max_errors:
+        report.truncated = True
+        del report.errors[max_errors:]
+    logger.debug("validated %i rows in %i ranges", report.rows, len(ranges))
+    return report
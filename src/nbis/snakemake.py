@@ -1,17 +1,37 @@
 """Snakemake utilities"""
 
+import copy
+import dataclasses
+import json
 import logging
-import re
+import os
+import tempfile
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Callable
 
 import click
+import jsonschema
+import ruamel.yaml
 from click.decorators import FC
+from ruamel.yaml import YAML
 
+from nbis import allocation
+from nbis.config import get_schema
 from nbis.env import Environment
 
 logger = logging.getLogger(__name__)
 
+DOCSTRING_MAX_BYTES = 64 * 1024
+HELP_CACHE_ENVVAR = "SNAKEMAKE_HELP_CACHE"
+HELP_CACHE_VERSION = 1
+
+_DOCSTRINGS = {}
+_HELP_CACHES = {}
+
+PROFILE_CONFIG_FILES = ("config.v8+.yaml", "config.yaml")
+_PROFILES = {}
+
 
 def snakemake_argument_list() -> Callable[[FC], FC]:
     """Add snakemake argument list."""
@@ -32,10 +52,197 @@ def get_profile(uri, config):
     return uri
 
 
+class ProfileError(Exception):
+    """Raised when a snakemake profile cannot be loaded or is invalid."""
+
+
+@dataclass(frozen=True)
+class Profile:
+    """Snakemake profile.
+
+    :param str name: Profile name.
+    :param Path path: Profile directory.
+    :param Path configfile: Profile configuration file, or None for a
+        profile directory without one.
+    :param dict config: Profile configuration.
+    """
+
+    name: str
+    path: Path
+    configfile: Path
+    config: dict
+
+
+def profile_dirs():
+    """Return directories in which snakemake looks up named profiles."""
+    config_home = os.environ.get("XDG_CONFIG_HOME") or Path.home() / ".config"
+    config_dirs = os.environ.get("XDG_CONFIG_DIRS") or "/etc/xdg"
+    return [Path(config_home) / "snakemake"] + [
+        Path(d) / "snakemake" for d in config_dirs.split(os.pathsep) if d
+    ]
+
+
+def resolve_profile(uri, home=None):
+    """Return profile directory for a profile path or name.
+
+    Relative paths are looked up in home and the current directory,
+    and names in the snakemake profile directories.
+
+    :param str uri: Profile path or name.
+    :param home: Project home.
+    :return: Absolute profile directory, or None if not found.
+    """
+    uri = Path(uri)
+    candidates = [uri]
+    if home is not None and not uri.is_absolute():
+        candidates.insert(0, Path(home) / uri)
+    candidates += [d / uri for d in profile_dirs()]
+    for path in candidates:
+        if path.is_dir():
+            return path.absolute()
+    return None
+
+
+def _read_profile(name, path, configfile):
+    """Read and validate profile; return the profile or the error."""
+    try:
+        with open(configfile, encoding="utf-8") as fh:
+            config = YAML(typ="safe").load(fh) or {}
+        if not isinstance(config, dict):
+            raise ProfileError(f"profile {name}: {configfile} is not a mapping")
+        get_schema("SNAKEMAKE_PROFILE_SCHEMA").validate(copy.deepcopy(config))
+    except ProfileError as e:
+        return e
+    except ruamel.yaml.YAMLError as e:
+        return ProfileError(f"profile {name}: {configfile}: {e}")
+    except jsonschema.ValidationError as e:
+        where = ".".join(str(x) for x in e.absolute_path) or "config"
+        return ProfileError(f"profile {name}: {configfile}: {where}: {e.message}")
+    return Profile(name, Path(path), configfile, config)
+
+
+def load_profile(name, path):
+    """Load and validate profile against the profile schema.
+
+    Profiles, and errors, are cached by configuration file name,
+    modification time and size, so a profile is only parsed and
+    validated once per process. A directory without a configuration file is
+    accepted, with a warning, and passed to snakemake as is.
+
+    :param str name: Profile name.
+    :param path: Profile directory.
+    :rtype: Profile
+    :raises ProfileError: If the configuration is not valid.
+    """
+    for filename in PROFILE_CONFIG_FILES:
+        configfile = Path(path) / filename
+        try:
+            st = configfile.stat()
+        except FileNotFoundError:
+            continue
+        break
+    else:
+        logger.warning("profile %s: no config.yaml in %s", name, path)
+        return Profile(name, Path(path), None, {})
+    key = str(configfile)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _PROFILES.get(key)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, _read_profile(name, path, configfile))
+        _PROFILES[key] = cached
+    if isinstance(cached[1], ProfileError):
+        raise cached[1]
+    return dataclasses.replace(cached[1], name=name)
+
+
+class ProfileRegistry:
+    """Registry of the profiles in the 'snakemake_profiles' configuration.
+
+    All configured profiles are resolved, loaded and validated on
+    first use, so that a broken profile is reported before snakemake
+    is launched.
+
+    :param dict profiles: Mapping from profile name to path or name.
+    :param home: Project home, used to resolve relative paths.
+    """
+
+    def __init__(self, profiles=None, home=None):
+        self.profiles = dict(profiles or {})
+        self.home = home
+        self._loaded = None
+
+    @classmethod
+    def from_config(cls, config, home=None):
+        """Make registry from configuration."""
+        try:
+            profiles = config["snakemake_profiles"]
+        except (KeyError, TypeError):
+            profiles = None
+        return cls(profiles, home)
+
+    def _load(self, name, uri):
+        path = resolve_profile(uri, self.home)
+        if path is None:
+            return ProfileError(f"profile {name}: no such profile directory {uri}")
+        try:
+            return load_profile(name, path)
+        except ProfileError as e:
+            return e
+
+    def load(self):
+        """Load all configured profiles.
+
+        :return: Mapping from profile name to profile, or to the error
+            raised while loading it.
+        :rtype: dict
+        """
+        if self._loaded is None:
+            self._loaded = {
+                name: self._load(name, uri) for name, uri in self.profiles.items()
+            }
+        return self._loaded
+
+    def errors(self):
+        """Return errors of configured profiles, by profile name."""
+        return {k: v for k, v in self.load().items() if isinstance(v, ProfileError)}
+
+    def get(self, name):
+        """Return profile.
+
+        Names that are not configured are resolved as profile paths or
+        snakemake profile names.
+
+        :param str name: Profile name.
+        :return: Profile, or None if an unconfigured name cannot be
+            resolved.
+        :raises ProfileError: If the profile is configured but missing,
+            or invalid.
+        """
+        loaded = self.load()
+        if name in loaded:
+            result = loaded[name]
+        else:
+            path = resolve_profile(name, self.home)
+            if path is None:
+                return None
+            result = load_profile(name, path)
+        if isinstance(result, ProfileError):
+            raise result
+        return result
+
+
 def profile_option(
     default: str = "local", expose_value: bool = True
 ) -> Callable[[FC], FC]:
-    """Add profile option with callback."""
+    """Add profile option with callback.
+
+    The profile is looked up in the configured snakemake_profiles, and
+    otherwise resolved as a profile path or name, see
+    :func:`resolve_profile`. Profiles that cannot be resolved or are
+    invalid are usage errors, and errors in other configured profiles
+    are logged, so that snakemake is not launched with a broken
+    profile.
+    """
 
     def profile_callback(
         ctx: click.core.Context,  # pylint: disable=unused-argument
@@ -51,7 +258,22 @@ def profile_option(
             return []
         if value is None:
             value = default
-        return ["--profile", get_profile(value, env.config)]
+        registry = ProfileRegistry.from_config(env.config, getattr(env, "home", None))
+        for name, error in registry.errors().items():
+            if name != value:
+                logger.warning("%s", error)
+        try:
+            profile = registry.get(value)
+        except ProfileError as e:
+            raise click.BadParameter(str(e), ctx=ctx, param=param) from e
+        if profile is None:
+            raise click.BadParameter(
+                f"no such profile {value}; add it to snakemake_profiles in the "
+                "configuration or use --no-profile",
+                ctx=ctx,
+                param=param,
+            )
+        return ["--profile", str(profile.path)]
 
     return click.option(
         "--profile",
@@ -76,6 +298,20 @@ def no_profile_option() -> Callable[[FC], FC]:
     )
 
 
+def cached_dry_run_option() -> Callable[[FC], FC]:
+    """Add cached dry run option."""
+
+    return click.option(
+        "--cached-dry-run",
+        is_flag=True,
+        default=False,
+        help=(
+            "list the jobs that would run, reusing earlier dry runs if the "
+            "workflow, configuration, profile and outputs are unchanged"
+        ),
+    )
+
+
 def verbose_option(expose_value: bool = False) -> Callable[[FC], FC]:
     """Add verbose option with callback."""
 
@@ -105,8 +341,50 @@ def verbose_option(expose_value: bool = False) -> Callable[[FC], FC]:
     )
 
 
-def cores_option(default=None) -> Callable[[FC], FC]:
-    """Add cores option."""
+class AutoInt(click.ParamType):
+    """Integer, or 'auto' to size from the CPU and memory allocation.
+
+    :param int minimum: Smallest accepted integer.
+    """
+
+    name = "integer|auto"
+
+    def __init__(self, minimum=None):
+        self.minimum = minimum
+
+    def convert(self, value, param, ctx):
+        if value is None or value == "auto":
+            return value
+        if not isinstance(value, int):
+            try:
+                value = int(value)
+            except ValueError:
+                return self.fail(f"{value!r} is not an integer or 'auto'", param, ctx)
+        if self.minimum is not None and value < self.minimum:
+            return self.fail(
+                f"{value} is smaller than the minimum {self.minimum}", param, ctx
+            )
+        return value
+
+
+def auto_size(ctx: click.core.Context, kind: str, command: str = None) -> int:
+    """Return automatic number of cores, jobs or threads.
+
+    See :func:`allocation.auto_size`. Peak memory of past runs is
+    looked up for command, which defaults to the snakemake command
+    name of the workflow GROUP-COMMAND.smk of the invoked command.
+    """
+    if command is None and ctx.parent is not None and ctx.parent.info_name:
+        command = f"snakemake {ctx.parent.info_name}-{ctx.info_name}"
+    return allocation.auto_size(kind, command)
+
+
+def cores_option(default=None, command=None) -> Callable[[FC], FC]:
+    """Add cores option.
+
+    The value 'auto' sizes cores from the CPU and memory allocation,
+    see :func:`auto_size`, which is called with command.
+    """
 
     def cores_callback(
         ctx: click.core.Context,  # pylint: disable=unused-argument
@@ -116,23 +394,28 @@ def cores_option(default=None) -> Callable[[FC], FC]:
         """Cores callback."""
         if value is None:
             return []
+        if value == "auto":
+            value = auto_size(ctx, "cores", command)
         if value < 1:
-            logging.error("Cores must be greater than 0")
-            raise ValueError("Cores must be greater than 0")
+            raise click.BadParameter("cores must be greater than 0")
         return ["--cores", str(value)]
 
     return click.option(
         "-c",
         "--cores",
-        help="number of cores",
+        help="number of cores, or 'auto' to use the allocated CPUs",
         default=default,
         callback=cores_callback,
-        type=int,
+        type=AutoInt(minimum=1),
     )
 
 
-def jobs_option(default=None) -> Callable[[FC], FC]:
-    """Add jobs option."""
+def jobs_option(default=None, command=None) -> Callable[[FC], FC]:
+    """Add jobs option.
+
+    The value 'auto' sizes jobs from the CPU and memory allocation,
+    see :func:`auto_size`, which is called with command.
+    """
 
     def jobs_callback(
         ctx: click.core.Context,  # pylint: disable=unused-argument
@@ -142,23 +425,28 @@ def jobs_option(default=None) -> Callable[[FC], FC]:
         """Jobs callback."""
         if value is None:
             return []
+        if value == "auto":
+            value = auto_size(ctx, "jobs", command)
         if value < 1:
-            logging.error("Jobs must be greater than 0")
-            raise ValueError("Jobs must be greater than 0")
+            raise click.BadParameter("jobs must be greater than 0")
         return ["--jobs", str(value)]
 
     return click.option(
         "-j",
         "--jobs",
-        help="number of jobs",
+        help="number of jobs, or 'auto' to use the allocated CPUs",
         default=default,
         callback=jobs_callback,
-        type=int,
+        type=AutoInt(minimum=1),
     )
 
 
-def threads_option(default=None) -> Callable[[FC], FC]:
-    """Add threads option."""
+def threads_option(default=None, command=None) -> Callable[[FC], FC]:
+    """Add threads option.
+
+    The value 'auto' sizes threads from the CPU and memory allocation,
+    see :func:`auto_size`, which is called with command.
+    """
 
     def threads_callback(
         ctx: click.core.Context,  # pylint: disable=unused-argument
@@ -168,20 +456,19 @@ def threads_option(default=None) -> Callable[[FC], FC]:
         """Threads callback."""
         if value is None:
             return []
+        if value == "auto":
+            value = auto_size(ctx, "threads", command)
         if value < 1:
-            logging.error("Threads must be greater than 0")
-            raise ValueError("Threads must be greater than 0")
+            raise click.BadParameter("threads must be greater than 0")
         return ["--threads", str(value)]
 
     return click.option(
         "-t",
         "--threads",
-        help="number of threads",
+        help="number of threads, or 'auto' to use the allocated CPUs",
         default=default,
         callback=threads_callback,
-        type=click.IntRange(
-            1,
-        ),
+        type=AutoInt(minimum=1),
     )
 
 
@@ -326,14 +613,104 @@ def report_option(
     return func
 
 
-def format_snakemake_help(smkfile, *, default=None):
+def read_docstring(smkfile, max_bytes=DOCSTRING_MAX_BYTES):
+    """Return leading docstring of a snakemake file.
+
+    The file is read line by line and reading stops at the closing
+    triple quotes, or after max_bytes characters if the docstring is
+    not terminated, so the rest of the workflow is never read.
+
+    :param smkfile: Snakemake file.
+    :param int max_bytes: Maximum docstring size.
+    :return: Docstring, or None if the file does not start with one.
+    """
+    with open(smkfile, encoding="utf-8") as fh:
+        if fh.read(3) != '"""':
+            return None
+        lines = []
+        size = 0
+        for line in fh:
+            end = line.find('"""')
+            if end >= 0:
+                lines.append(line[:end])
+                break
+            lines.append(line)
+            size += len(line)
+            if size > max_bytes:
+                logger.warning("unterminated docstring in %s", smkfile)
+                break
+        return "".join(lines)
+
+
+def _load_help_cache(cache_file):
+    """Return persisted docstrings, keyed by snakemake file name."""
+    try:
+        with open(cache_file, encoding="utf-8") as fh:
+            data = json.load(fh)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logger.warning("corrupt help cache %s; ignoring", cache_file)
+        return {}
+    if data.get("version") != HELP_CACHE_VERSION:
+        return {}
+    return data["entries"]
+
+
+def _save_help_cache(cache_file, entries):
+    """Atomically write docstrings to cache file."""
+    cache_file = Path(cache_file)
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=cache_file.parent, delete=False, encoding="utf-8"
+        ) as fh:
+            json.dump({"version": HELP_CACHE_VERSION, "entries": entries}, fh)
+        os.replace(fh.name, cache_file)
+    except OSError as e:
+        logger.debug("could not write help cache %s: %s", cache_file, e)
+
+
+def snakefile_docstring(smkfile, cache_file=None):
+    """Return leading docstring of a snakemake file, with caching.
+
+    Docstrings are memoised by file name, modification time and size.
+    If cache_file, or the environment variable SNAKEMAKE_HELP_CACHE,
+    is set, docstrings are also persisted there, so that later
+    processes only stat the snakemake file.
+
+    :param smkfile: Snakemake file.
+    :param cache_file: Persistent help cache file.
+    :return: Docstring, or None if the file does not start with one.
+    """
+    key = str(Path(smkfile).absolute())
+    st = os.stat(key)
+    stamp = [st.st_mtime_ns, st.st_size]
+    entry = _DOCSTRINGS.get(key)
+    cache_file = cache_file or os.environ.get(HELP_CACHE_ENVVAR)
+    persisted = None
+    if cache_file:
+        if cache_file not in _HELP_CACHES:
+            _HELP_CACHES[cache_file] = _load_help_cache(cache_file)
+        persisted = _HELP_CACHES[cache_file]
+        if entry is None or entry["stamp"] != stamp:
+            entry = persisted.get(key)
+    if entry is None or entry["stamp"] != stamp:
+        entry = {"stamp": stamp, "docstring": read_docstring(key)}
+    _DOCSTRINGS[key] = entry
+    if persisted is not None and persisted.get(key) != entry:
+        persisted[key] = entry
+        _save_help_cache(cache_file, persisted)
+    return entry["docstring"]
+
+
+def format_snakemake_help(smkfile, *, default=None, cache_file=None):
     """Return docstring from snakemake file.
 
-    Provided that a document starts with triple quotes,
-    the document is read and split on that delimiter. This
-    will produce a list where the first entry is the empty
-    string, so the function returns the second entry in the
-    list.
+    Provided that a document starts with triple quotes, the text up
+    to the closing triple quotes is split into a title, the first
+    line, and a body. The docstring is cached, see
+    :func:`snakefile_docstring`.
 
     Use in command function:
 
@@ -342,13 +719,8 @@ def format_snakemake_help(smkfile, *, default=None):
             help=format_snakemake_help(config.SNAKEMAKE_ROOT / smkfile)
         )
     """
-    with open(smkfile, encoding="utf-8") as fh:
-        file_contents = "".join(fh.readlines())
-    text = default
-    if re.match('^"""', file_contents):
-        m = re.split('"""', file_contents)
-        text = m[1]
-    else:
+    text = snakefile_docstring(smkfile, cache_file=cache_file)
+    if text is None:
         if default is None:
             return None, None
         text = default
@@ -0,0 +1,243 @@
+"""Startup time profiling.
+
+Profile the startup of a click CLI, such as nbis-admin or a generated
+project CLI, by running it in a fresh interpreter with ``-X
+importtime``. The profile records the import time of every module,
+the time spent in click parameter callbacks, such as the config file
+and profile options, and the time from process start to the first
+(non-group) command being invoked.
+
+Profiles can be serialized to JSON, so that startup times of releases
+can be compared.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+
+logger = logging.getLogger(__name__)
+
+IMPORTTIME_REGEX = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|( +)(\S+)")
+
+# Runs in the profiled interpreter. Kept free of nbis imports so that
+# only the imports of the entry point are measured.
+RUNNER = """
+import json
+import sys
+import time
+
+report, entry_point, *args = sys.argv[1:]
+modname, _, attr = entry_point.partition(":")
+# __import__, unlike importlib.import_module, is timed by -X importtime
+__import__(modname)
+module = sys.modules[modname]
+imported = time.time()
+
+import click
+
+callbacks = []
+invoked = []
+process_value = click.core.Parameter.process_value
+command_invoke = click.core.Command.invoke
+
+
+def timed_process_value(self, ctx, value):
+    t0 = time.perf_counter()
+    try:
+        return process_value(self, ctx, value)
+    finally:
+        if self.callback is not None:
+            seconds = time.perf_counter() - t0
+            callbacks.append([ctx.command_path, self.name, seconds])
+
+
+def timed_invoke(self, ctx):
+    if not invoked and not isinstance(self, click.core.MultiCommand):
+        invoked.append([ctx.command_path, time.time()])
+    return command_invoke(self, ctx)
+
+
+click.core.Parameter.process_value = timed_process_value
+click.core.Command.invoke = timed_invoke
+try:
+    getattr(module, attr or "main")(args, prog_name=modname.split(".")[0])
+    exit_code = 0
+except SystemExit as e:
+    exit_code = e.code if isinstance(e.code, int) else int(e.code is not None)
+finished = time.time()
+with open(report, "w", encoding="utf-8") as fh:
+    json.dump(
+        {
+            "imported": imported,
+            "invoked": invoked[0] if invoked else None,
+            "finished": finished,
+            "callbacks": callbacks,
+            "exit_code": exit_code,
+        },
+        fh,
+    )
+"""
+
+
+@dataclass
+class ImportRecord:
+    """Import time of a module, as reported by -X importtime.
+
+    :param str module: Module name.
+    :param int self_us: Time spent importing the module itself, in
+        microseconds.
+    :param int cumulative_us: Time including nested imports.
+    :param int depth: Nesting level; 0 for top-level imports.
+    """
+
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+@dataclass
+class CallbackRecord:
+    """Time spent processing a click parameter with a callback.
+
+    :param str command: Command path.
+    :param str param: Parameter name.
+    :param float seconds: Time spent.
+    """
+
+    command: str
+    param: str
+    seconds: float
+
+
+@dataclass
+class StartupProfile:  # pylint: disable=too-many-instance-attributes
+    """Startup profile of a CLI invocation.
+
+    Times are in seconds from process start.
+
+    :param str entry_point: Profiled entry point, as module:attribute.
+    :param list args: Command line arguments.
+    :param str python: Python version.
+    :param float imported: Time until the entry point was imported.
+    :param float first_command: Time until the first non-group command
+        was invoked, or None if no command was invoked, as with --help.
+    :param str command: Command path of the first invoked command.
+    :param float finished: Time until the CLI returned.
+    :param float total: Wall time of the process.
+    :param int exit_code: Exit code of the CLI.
+    """
+
+    entry_point: str
+    args: list
+    python: str = field(default_factory=lambda: sys.version.split()[0])
+    imported: float = 0.0
+    first_command: float | None = None
+    command: str | None = None
+    finished: float = 0.0
+    total: float = 0.0
+    exit_code: int = 0
+    imports: list[ImportRecord] = field(default_factory=list)
+    callbacks: list[CallbackRecord] = field(default_factory=list)
+
+    def to_dict(self):
+        """Return profile as a JSON serializable dictionary."""
+        return asdict(self)
+
+    def sorted_imports(self, key="cumulative", limit=None):
+        """Return imports sorted by key.
+
+        :param str key: 'cumulative', 'self' or 'module'.
+        :param int limit: Maximum number of imports to return.
+        """
+        if key == "module":
+            imports = sorted(self.imports, key=lambda r: r.module)
+        else:
+            imports = sorted(
+                self.imports, key=lambda r: getattr(r, f"{key}_us"), reverse=True
+            )
+        return imports[:limit] if limit else imports
+
+
+def parse_importtime(text):
+    """Parse -X importtime output.
+
+    Lines that are not import time records are ignored.
+
+    :param str text: Standard error of the profiled interpreter.
+    :rtype: list[ImportRecord]
+    """
+    records = []
+    for line in text.splitlines():
+        m = IMPORTTIME_REGEX.match(line)
+        if m is None:
+            continue
+        self_us, cumulative_us, indent, module = m.groups()
+        records.append(
+            ImportRecord(
+                module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2
+            )
+        )
+    return records
+
+
+def profile_startup(entry_point="nbis.cli:cli", args=("--help",), env=None):
+    """Profile startup of a click CLI in a fresh interpreter.
+
+    The CLI is actually run with args, so commands with side effects
+    will have them.
+
+    :param str entry_point: CLI object, as module:attribute.
+    :param args: Command line arguments.
+    :param dict env: Environment variables; defaults to os.environ.
+    :rtype: StartupProfile
+    """
+    args = list(args)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        report = os.path.join(tmpdir, "report.json")
+        cmd = [sys.executable, "-X", "importtime", "-c", RUNNER, report, entry_point]
+        logger.debug("profiling %s %s", entry_point, " ".join(args))
+        started = time.time()
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            cmd + args,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            env=env,
+            check=False,
+        )
+        total = time.perf_counter() - t0
+        if not os.path.exists(report):
+            errors = [
+                line
+                for line in proc.stderr.splitlines()
+                if not line.startswith("import time:")
+            ]
+            raise RuntimeError(
+                f"failed to profile {entry_point}:\n" + "\n".join(errors[-20:])
+            )
+        with open(report, encoding="utf-8") as fh:
+            data = json.load(fh)
+    profile = StartupProfile(
+        entry_point=entry_point,
+        args=args,
+        imported=data["imported"] - started,
+        finished=data["finished"] - started,
+        total=total,
+        exit_code=data["exit_code"],
+        imports=parse_importtime(proc.stderr),
+        callbacks=[CallbackRecord(*x) for x in data["callbacks"]],
+    )
+    if data["invoked"] is not None:
+        profile.command, invoked = data["invoked"]
+        profile.first_command = invoked - started
+    return profile
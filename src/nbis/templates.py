@@ -1,23 +1,102 @@
-"""Module to render templates to files"""
+"""Module to render templates to files
 
+Compiled templates are cached in the user cache directory (see
+:mod:`nbis.cache`), so template source is only parsed when it changes.
+Wheels additionally ship a bundle of precompiled templates, built by
+the package build hook. The bundle is a directory of Python modules,
+one per template, which is byte-compiled on installation and loaded
+with a :class:`jinja2.ModuleLoader`, such that templates are not
+compiled at all. A bundle can be built in a source tree with
+
+    python -m nbis.templates
+
+but must then be rebuilt, or removed, whenever a template changes.
+"""
+
+import compileall
+import functools
 import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
 
-try:
-    import pkg_resources
-except ImportError:
-    from importlib import resources as pkg_resources
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import (
+    ChoiceLoader,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    ModuleLoader,
+)
+
+from nbis import cache, pkgdata
 
 logger = logging.getLogger(__name__)
 
-try:
-    template_path = pkg_resources.resource_filename("nbis", "templates")
-except AttributeError:
-    template_path = pkg_resources.files("nbis") / "templates"
+template_path = pkgdata.path("nbis", "templates")
+
+TEMPLATE_BUNDLE = Path(__file__).parent / "_templates"
+
+
+def is_template(name):
+    """Return True if name is a template, as opposed to a static file."""
+    return name.endswith(".j2")
+
+
+def make_environment(bundle=TEMPLATE_BUNDLE, use_cache=True):
+    """Make template environment.
+
+    :param bundle: Precompiled template bundle. Templates are loaded
+        from the bundle if it exists, and from the template directory
+        otherwise.
+    :param bool use_cache: Use persistent bytecode cache.
+    :rtype: jinja2.Environment
+    """
+    loader = FileSystemLoader(template_path)
+    if bundle is not None and Path(bundle).exists():
+        logger.debug("loading precompiled templates from %s", bundle)
+        loader = ChoiceLoader([ModuleLoader(str(bundle)), loader])
+    bytecode_cache = None
+    if use_cache and cache.enabled():
+        path = cache.user_cache_dir("jinja")
+        path.mkdir(parents=True, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(str(path))
+    return Environment(loader=loader, bytecode_cache=bytecode_cache)
+
+
+@functools.lru_cache(maxsize=None)
+def get_environment():
+    """Return the shared template environment, creating it on first use."""
+    return make_environment()
+
+
+def compile_bundle(target=TEMPLATE_BUNDLE):
+    """Precompile all templates to a bundle directory.
+
+    Templates are compiled to Python modules which are in turn
+    byte-compiled. A zip archive would be smaller, but modules cannot
+    be byte-compiled inside a zip archive, which makes it slower to
+    load than the bytecode cache.
+
+    :param target: Output directory.
+    """
+    environment = make_environment(bundle=None, use_cache=False)
+    environment.compile_templates(
+        str(target), zip=None, filter_func=is_template, ignore_errors=False
+    )
+    compileall.compile_dir(str(target), quiet=1)
+    return target
+
+
+def __getattr__(name):
+    # The environment is created lazily, so that importing this module
+    # does not touch the cache directory
+    if name == "env":
+        return get_environment()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-file_loader = FileSystemLoader(template_path)
-env = Environment(loader=file_loader)
 
 INDIVIDUAL_TEMPLATES = {
     "pyproject.toml": "pyproject.toml.j2",
@@ -42,7 +121,7 @@ def add_template(filename, template, **kwargs):
         if not filename.parent.exists():
             filename.parent.mkdir(exist_ok=True, parents=True)
         with open(filename, "w", encoding="utf-8") as fh:
-            template = env.get_template(template)
+            template = get_environment().get_template(template)
             fh.write(template.render(**kwargs))
             fh.write("\n")
     except FileNotFoundError:
@@ -52,42 +131,178 @@ def add_template(filename, template, **kwargs):
 
 def render_template(template, **kw):
     """Generic function to render template"""
-    template = env.get_template(template)
+    template = get_environment().get_template(template)
     return template.render(**kw)
 
 
+@dataclass
+class PlannedFile:
+    """File in a scaffolding plan.
+
+    :param Path path: File name relative to the plan root.
+    :param str template: Template name, or None for an empty file.
+    :param dict context: Template context.
+    """
+
+    path: Path
+    template: str | None = None
+    context: dict = field(default_factory=dict)
+
+    def render(self):
+        """Return file contents."""
+        if self.template is None:
+            return ""
+        return render_template(self.template, **self.context) + "\n"
+
+
+class ScaffoldPlan:
+    """Plan of files to generate in a directory.
+
+    Files are collected with :meth:`add`, :meth:`add_templates` and
+    :meth:`add_py_module`, and generated with :meth:`commit`. Files
+    are rendered concurrently to a staging directory. If the root does
+    not exist, the staging directory is created next to the root and
+    renamed to the root in one atomic operation. Otherwise, it is a
+    hidden .nbis-staging-* directory inside the root, and files are
+    moved into place one by one with atomic replaces. Either way, a
+    failure while rendering leaves the root untouched.
+
+    Files that already exist are skipped, as are python modules whose
+    directory exists.
+
+    :param root: Root directory.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.files = {}
+        self.dirs = set()
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        return iter(self.files.values())
+
+    def _exists(self, path):
+        return (self.root / path).exists() or path in self.files
+
+    def add(self, path, template=None, **context):
+        """Add file to plan.
+
+        :param path: File name relative to the root.
+        :param str template: Template name, or None for an empty file.
+        :param context: Template context.
+        """
+        path = Path(path)
+        if self._exists(path):
+            logger.warning("%s already exists; skipping", self.root / path)
+            return
+        self.files[path] = PlannedFile(path, template, context)
+
+    def add_templates(self, *, subdir=None, files=None, **kwargs):
+        """Add templates to plan; see :func:`multi_add`."""
+        for f in files or []:
+            path = Path(subdir) / f if subdir else Path(f)
+            self.add(path, f"{path.as_posix()}.j2", **kwargs)
+
+    def add_py_module(self, *, module, submodule=None, files=None, init=True, **kwargs):
+        """Add python module to plan; see :func:`init_py_module`."""
+        if submodule is not None:
+            module = Path(module) / submodule
+        module_dir = Path("src") / module
+        if (self.root / module_dir).exists() or any(
+            module_dir in p.parents for p in self.files
+        ):
+            logger.info("%s exists; skipping", module)
+            return
+        self.dirs.add(module_dir)
+        files = list(files or [])
+        if init and "__init__.py" not in files:
+            self.add(module_dir / "__init__.py")
+        for f in files:
+            tpl = Path(submodule) / f if submodule else Path(f)
+            self.add(module_dir / f, f"src/python_module/{tpl.as_posix()}.j2", **kwargs)
+
+    def describe(self):
+        """Return lines describing the plan."""
+        lines = []
+        for planned in sorted(self.files.values(), key=lambda x: x.path):
+            source = planned.template or "empty file"
+            lines.append(f"{self.root / planned.path} <- {source}")
+        return lines
+
+    def _stage(self, staging, workers):
+        def write(planned):
+            target = staging / planned.path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(planned.render(), encoding="utf-8")
+
+        for d in self.dirs:
+            (staging / d).mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Consume results to propagate exceptions
+            list(executor.map(write, self.files.values()))
+
+    def commit(self, dry_run=False, workers=None):
+        """Generate files.
+
+        :param bool dry_run: Only log the plan.
+        :param int workers: Number of render threads.
+        :return: Generated files.
+        :rtype: list[Path]
+        """
+        written = [self.root / p for p in self.files]
+        if dry_run:
+            for line in self.describe():
+                logger.info("would install %s", line)
+            return written
+        new_root = not self.root.exists()
+        if new_root:
+            parent = self.root.absolute().parent
+            parent.mkdir(parents=True, exist_ok=True)
+            staging = Path(tempfile.mkdtemp(prefix=f".{self.root.name}.", dir=parent))
+            # mkdtemp creates a private directory, but the staging
+            # directory becomes the root
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(staging, 0o777 & ~umask)
+        else:
+            staging = Path(tempfile.mkdtemp(prefix=".nbis-staging-", dir=self.root))
+        try:
+            self._stage(staging, workers)
+            if new_root:
+                os.rename(staging, self.root)
+            else:
+                for d in self.dirs:
+                    (self.root / d).mkdir(parents=True, exist_ok=True)
+                for path in self.files:
+                    logger.info("Installing %s", self.root / path)
+                    (self.root / path).parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(staging / path, self.root / path)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return written
+
+
 def multi_add(pdir, *, subdir=None, files=None, **kwargs):
     """Add multiple templates to directory"""
-    if subdir is not None:
-        pdir = pdir / subdir
-    logger.info("Adding %s to %s", files, pdir)
-    if not pdir.exists():
-        pdir.mkdir(exist_ok=True, parents=True)
-    for f in files:
-        print(pdir, f, subdir)
-        tpl = Path(subdir) / f if subdir else f
-        add_template(pdir / f, f"{tpl}.j2", **kwargs)
+    logger.info("Adding %s to %s", files, pdir if subdir is None else pdir / subdir)
+    plan = ScaffoldPlan(pdir)
+    plan.add_templates(subdir=subdir, files=files, **kwargs)
+    plan.commit()
 
 
 def init_py_module(pdir, *, module, submodule=None, files=None, init=True, **kwargs):
     """Initialize python module directory"""
-    if submodule is not None:
-        module = Path(module) / submodule
-    module_dir = pdir / "src" / module
     logger.info("Initializing %s in %s", module, pdir)
-    if module_dir.exists():
-        logger.info("%s exists; skipping", module)
-        return
-    module_dir.mkdir(exist_ok=True, parents=True)
-    if init:
-        if files is None or "__init__.py" not in files:
-            module_init = module_dir / "__init__.py"
-            module_init.touch()
-    if files is not None:
-        for f in files:
-            tpl = Path(submodule) / f if submodule else f
-            add_template(
-                module_dir / f,
-                f"src/python_module/{tpl}.j2",
-                **kwargs,
-            )
+    plan = ScaffoldPlan(pdir)
+    plan.add_py_module(
+        module=module, submodule=submodule, files=files, init=init, **kwargs
+    )
+    plan.commit()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("wrote %s", compile_bundle())
@@ -0,0 +1,404 @@
+"""Webexport synchronization.
+
+Push the contents of a build directory to a webexport target. A
+target is either an rsync destination or, with the local backend, a
+local directory.
+
+In incremental mode, a local index records path, size, mtime and
+content hash of every file as of the last successful push. The delta
+to the next push is computed from the index and a stat of the local
+tree, so the remote is never scanned, and only changed and deleted
+files are transferred. A full push transfers the whole tree, and
+records it in the index, if given, so that a later incremental push
+starts from the pushed state.
+
+Several targets, and optionally one shard per included directory, can
+be pushed concurrently with :func:`sync_many`. Each push is an
+independent job with its own index, and failed jobs are retried with
+exponential backoff.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import pathlib
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from nbis import cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Delta:
+    """Difference between local tree and last pushed state.
+
+    :param list changed: New or modified files, relative to root.
+    :param list deleted: Files removed since the last push.
+    :param dict entries: Index entries for the current local tree.
+    """
+
+    changed: list[str] = field(default_factory=list)
+    deleted: list[str] = field(default_factory=list)
+    entries: dict = field(default_factory=dict)
+
+    @property
+    def nbytes(self):
+        """Number of bytes in changed files."""
+        return sum(self.entries[f]["size"] for f in self.changed)
+
+    def __bool__(self):
+        return bool(self.changed or self.deleted)
+
+
+@dataclass
+class SyncResult:
+    """Result of a push to a webexport target.
+
+    In full mode, files and nbytes count the whole local tree.
+    """
+
+    target: str
+    files: int = 0
+    deleted: int = 0
+    nbytes: int = 0
+    seconds: float = 0.0
+    attempts: int = 1
+    error: str | None = None
+
+    @property
+    def ok(self):
+        """True if the push succeeded."""
+        return self.error is None
+
+
+@dataclass
+class SyncJob:
+    """A push of a source directory to a target.
+
+    :param source: Source directory.
+    :param str target: Target url or directory.
+    :param index: Index file name, used in incremental mode.
+    """
+
+    source: pathlib.Path
+    target: str
+    index: pathlib.Path | None = None
+
+
+def walk(root):
+    """Yield (relative path, stat) for all files below root."""
+    stack = [pathlib.Path(root)]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(pathlib.Path(entry.path))
+                elif entry.is_file():
+                    rel = os.path.relpath(entry.path, root)
+                    yield rel.replace(os.sep, "/"), entry.stat()
+
+
+class SyncIndex:
+    """Index of the last pushed state of a build directory.
+
+    :param path: Index file name.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.entries = {}
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                self.entries = json.load(fh)
+        except FileNotFoundError:
+            logger.debug("no sync index at %s", self.path)
+        except ValueError:
+            logger.warning("corrupt sync index %s; ignoring", self.path)
+
+    def delta(self, root) -> Delta:
+        """Compute delta between local tree at root and the index.
+
+        Files whose size and mtime match the index are assumed
+        unchanged. Other files are hashed, so touched but unmodified
+        files are not transferred.
+        """
+        delta = Delta()
+        for rel, st in walk(root):
+            old = self.entries.get(rel)
+            if (
+                old is not None
+                and old["size"] == st.st_size
+                and old["mtime_ns"] == st.st_mtime_ns
+            ):
+                delta.entries[rel] = old
+                continue
+            digest = cache.file_digest(os.path.join(root, rel))
+            delta.entries[rel] = {
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "sha256": digest,
+            }
+            if old is None or old["sha256"] != digest:
+                delta.changed.append(rel)
+        delta.deleted = sorted(set(self.entries) - set(delta.entries))
+        delta.changed.sort()
+        return delta
+
+    def save(self, entries):
+        """Save entries as the last pushed state."""
+        self.entries = entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.path.parent, delete=False, encoding="utf-8"
+        ) as fh:
+            json.dump(entries, fh)
+        os.replace(fh.name, self.path)
+
+
+class Backend:
+    """Webexport backend base class.
+
+    :param list options: Additional backend options.
+    """
+
+    name = None
+
+    def __init__(self, options=None):
+        self.options = list(options or [])
+
+    def push(self, src, dest, files=None, deleted=(), dry_run=False):
+        """Push files from src to dest.
+
+        :param src: Source directory.
+        :param str dest: Target url or directory.
+        :param list files: Files, relative to src, to transfer. All
+            files are transferred if None.
+        :param list deleted: Files, relative to dest, to delete.
+        :param bool dry_run: Only log what would be done.
+        """
+        raise NotImplementedError
+
+
+class RsyncBackend(Backend):
+    """Push with rsync.
+
+    Incremental pushes pass the changed and deleted files to rsync
+    with --files-from, such that rsync does not scan the full tree.
+    """
+
+    name = "rsync"
+
+    def push(self, src, dest, files=None, deleted=(), dry_run=False):
+        args = ["rsync"] + self.options
+        if dry_run:
+            args.append("-n")
+        if files is None:
+            args += [f"{src}/", f"{dest}/"]
+            logger.debug("running %s", " ".join(args))
+            subprocess.run(args, check=True)
+            return
+        filelist = list(files) + list(deleted)
+        if not filelist:
+            return
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as fh:
+            fh.write("\n".join(filelist) + "\n")
+            fh.flush()
+            args += [
+                "--archive",
+                f"--files-from={fh.name}",
+                "--delete-missing-args",
+                f"{src}/",
+                f"{dest}/",
+            ]
+            logger.debug("running %s", " ".join(args))
+            subprocess.run(args, check=True)
+
+
+class LocalBackend(Backend):
+    """Copy to a local directory."""
+
+    name = "local"
+
+    def push(self, src, dest, files=None, deleted=(), dry_run=False):
+        src = pathlib.Path(src)
+        dest = pathlib.Path(dest)
+        if files is None:
+            files = [rel for rel, _ in walk(src)]
+        for rel in files:
+            logger.debug("copy %s to %s", src / rel, dest / rel)
+            if dry_run:
+                continue
+            (dest / rel).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(src / rel, dest / rel)
+        for rel in deleted:
+            logger.debug("delete %s", dest / rel)
+            if not dry_run:
+                (dest / rel).unlink(missing_ok=True)
+
+
+BACKENDS = {cls.name: cls for cls in (RsyncBackend, LocalBackend)}
+
+
+def index_file(home, builddir, url):
+    """Return index file name for a build directory and target."""
+    key = cache.key_digest(os.path.abspath(builddir), url)
+    return cache.project_cache_dir(home, "webexport", f"{key}.json")
+
+
+def sync(
+    builddir,
+    url,
+    *,
+    backend="rsync",
+    options=None,
+    incremental=False,
+    index=None,
+    dry_run=False,
+):  # pylint: disable=too-many-arguments
+    """Push build directory to webexport target.
+
+    :param builddir: Build directory.
+    :param str url: Target url or directory.
+    :param str backend: Backend name, see :data:`BACKENDS`.
+    :param list options: Additional backend options.
+    :param bool incremental: Only transfer files that changed since
+        the last push.
+    :param index: Index file name. Required if incremental; in full
+        mode, the index is updated if given.
+    :param bool dry_run: Only log what would be done.
+    :rtype: SyncResult
+    """
+    impl = BACKENDS[backend](options)
+    result = SyncResult(target=url)
+    t0 = time.perf_counter()
+    sync_index = None if index is None else SyncIndex(index)
+    if not incremental:
+        # Totals come from the scan of the tree before the push
+        if sync_index is None:
+            entries = {rel: {"size": st.st_size} for rel, st in walk(builddir)}
+        else:
+            entries = sync_index.delta(builddir).entries
+        impl.push(builddir, url, dry_run=dry_run)
+        if sync_index is not None and not dry_run:
+            sync_index.save(entries)
+        result.files = len(entries)
+        result.nbytes = sum(e["size"] for e in entries.values())
+        result.seconds = time.perf_counter() - t0
+        return result
+    delta = sync_index.delta(builddir)
+    logger.info(
+        "%s: %i changed and %i deleted files",
+        url,
+        len(delta.changed),
+        len(delta.deleted),
+    )
+    if delta:
+        impl.push(
+            builddir, url, files=delta.changed, deleted=delta.deleted, dry_run=dry_run
+        )
+    if not dry_run:
+        sync_index.save(delta.entries)
+    result.files = len(delta.changed)
+    result.deleted = len(delta.deleted)
+    result.nbytes = delta.nbytes
+    result.seconds = time.perf_counter() - t0
+    return result
+
+
+def plan(home, builddir, urls, include=None):
+    """Return sync jobs for targets.
+
+    :param home: Project home, where indices are stored.
+    :param builddir: Build directory.
+    :param list urls: Target urls or directories.
+    :param list include: Directories, relative to builddir. If given,
+        each directory is pushed to the corresponding subdirectory of
+        every target as a separate shard.
+    :rtype: list[SyncJob]
+    """
+    builddir = pathlib.Path(builddir)
+    shards = include or [None]
+    jobs = []
+    for url in urls:
+        for shard in shards:
+            source, target = builddir, url
+            if shard is not None:
+                shard = shard.strip("/")
+                source = builddir / shard
+                target = f"{url.rstrip('/')}/{shard}"
+            jobs.append(SyncJob(source, target, index_file(home, source, target)))
+    return jobs
+
+
+def sync_retry(job, *, retries=2, backoff=1.0, **kwargs):
+    """Push job, retrying failed attempts with exponential backoff.
+
+    Failures are recorded in the result rather than raised.
+
+    :param SyncJob job: Job to push.
+    :param int retries: Number of retries after the first attempt.
+    :param float backoff: Delay in seconds before the first retry. The
+        delay doubles for every subsequent retry.
+    :param kwargs: Keyword arguments passed to :func:`sync`.
+    :rtype: SyncResult
+    """
+    t0 = time.perf_counter()
+    attempt = 1
+    while True:
+        try:
+            result = sync(job.source, job.target, index=job.index, **kwargs)
+        except (OSError, subprocess.CalledProcessError) as e:
+            if attempt > retries:
+                logger.error(
+                    "%s: giving up after %i attempts: %s", job.target, attempt, e
+                )
+                return SyncResult(
+                    target=job.target,
+                    seconds=time.perf_counter() - t0,
+                    attempts=attempt,
+                    error=str(e),
+                )
+            delay = backoff * 2 ** (attempt - 1)
+            logger.warning(
+                "%s: attempt %i failed: %s; retrying in %.1fs",
+                job.target,
+                attempt,
+                e,
+                delay,
+            )
+            time.sleep(delay)
+            attempt += 1
+            continue
+        result.attempts = attempt
+        result.seconds = time.perf_counter() - t0
+        return result
+
+
+def sync_many(jobs, *, workers=4, retries=2, backoff=1.0, **kwargs):
+    """Push jobs concurrently.
+
+    Pushes are I/O bound, so a bounded thread pool is used.
+
+    :param list jobs: Jobs, see :func:`plan`.
+    :param int workers: Maximum number of concurrent pushes.
+    :param int retries: Number of retries per job.
+    :param float backoff: Initial retry delay in seconds.
+    :param kwargs: Keyword arguments passed to :func:`sync`.
+    :return: Results in job order.
+    :rtype: list[SyncResult]
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as pool:
+        futures = [
+            pool.submit(sync_retry, job, retries=retries, backoff=backoff, **kwargs)
+            for job in jobs
+        ]
+        return [f.result() for f in futures]
@@ -1,14 +1,38 @@
-"""Command wrappers"""
+"""Command wrappers
+
+Commands are run without a shell from an argument list. Output is
+streamed line by line, to the terminal by default, or to a callback,
+and can be teed to a rotating log file. Every run returns a
+:class:`RunResult` with exit code, wall time and peak memory usage.
+
+Snakemake can alternatively be run in the current process, see
+:class:`SnakemakeSession`.
+
+Runs are recorded in the project run history, see :mod:`runhistory`.
+"""
 
 import logging
+import logging.handlers
 import os
+import queue
+import shlex
 import shutil
 import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
 
 import pypandoc
 
 logger = logging.getLogger(__name__)
 
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+SNAKEMAKE_ENGINE_ENVVAR = "SNAKEMAKE_ENGINE"
+# Snakemake major version whose API internals SnakemakeSession uses
+SNAKEMAKE_API_MAJOR = 9
+
 
 class Wrapper:  # pylint: disable=too-few-public-methods
     """Documentation wrapper base class."""
@@ -21,64 +45,530 @@ class Wrapper:  # pylint: disable=too-few-public-methods
         raise NotImplementedError
 
 
-def snakemake(*, targets=None, options=None, snakefile=None):
-    """Run snakemake workflows."""
-    if isinstance(options, list):
-        options = " ".join(options)
-    cmdlist = [
-        "snakemake",
-        f"{'-s ' + str(snakefile) if snakefile else ''}",
-        f"{str(options) or ''}",
-        f"{str(targets) or ''}",
-    ]
-    cmd = " ".join(cmdlist)
+@dataclass
+class RunResult:
+    """Result of a command run.
+
+    :param list args: Command arguments.
+    :param int returncode: Exit code.
+    :param float seconds: Wall time.
+    :param int maxrss: Peak resident set size of the command in
+        kilobytes, or None if not available on this platform.
+    """
+
+    args: list
+    returncode: int
+    seconds: float
+    maxrss: int = None
+
+    @property
+    def ok(self):
+        """True if the command succeeded."""
+        return self.returncode == 0
+
+
+def split_args(args):
+    """Return argument list from None, a string or a sequence.
+
+    Strings are split with shell syntax, such that options given as
+    one string keep working.
+    """
+    if args is None:
+        return []
+    if isinstance(args, str):
+        return shlex.split(args)
+    return [str(x) for x in args]
+
+
+def _reader(name, pipe, lines):
+    """Put lines from pipe on queue, followed by None at EOF.
+
+    The None is queued even if reading fails, so that the consumer
+    never waits for a stream that is gone.
+    """
+    try:
+        with pipe:
+            for line in iter(pipe.readline, ""):
+                lines.put((name, line))
+    finally:
+        lines.put((name, None))
+
+
+def _wait(proc):
+    """Wait for process and return peak resident set size.
+
+    os.wait4 reports the resource usage of this child only, as opposed
+    to getrusage(RUSAGE_CHILDREN), which reports the maximum over all
+    children of the process.
+    """
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return None
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    maxrss = rusage.ru_maxrss
+    if sys.platform == "darwin":
+        maxrss //= 1024
+    return maxrss
+
+
+def _log_handler(logfile):
+    """Return rotating file handler for command output."""
+    os.makedirs(os.path.dirname(os.path.abspath(logfile)), exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(
+        logfile, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT
+    )
+    handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    return handler
+
+
+class Process:
+    """Running command whose output can be iterated line by line.
+
+    Iteration yields (stream, line) tuples, where stream is 'stdout' or
+    'stderr' and line includes the trailing newline. Once iteration is
+    exhausted, the process has exited and :attr:`result` is set.
+
+    :param args: Command arguments.
+    :param logfile: If set, tee output to this rotating log file.
+    :param kwargs: Keyword arguments passed to :class:`subprocess.Popen`.
+        Output is decoded as UTF-8 by default, replacing invalid bytes.
+    """
+
+    def __init__(self, args, *, logfile=None, **kwargs):
+        self.args = split_args(args)
+        self.logfile = logfile
+        self.result = None
+        logger.debug("running %s", shlex.join(self.args))
+        self._t0 = time.perf_counter()
+        kwargs.setdefault("encoding", "utf-8")
+        kwargs.setdefault("errors", "replace")
+        self._proc = subprocess.Popen(  # pylint: disable=consider-using-with
+            self.args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=1,
+            **kwargs,
+        )
+
+    def __iter__(self):
+        lines = queue.Queue()
+        threads = [
+            threading.Thread(target=_reader, args=(name, pipe, lines), daemon=True)
+            for name, pipe in (
+                ("stdout", self._proc.stdout),
+                ("stderr", self._proc.stderr),
+            )
+        ]
+        for t in threads:
+            t.start()
+        handler = _log_handler(self.logfile) if self.logfile else None
+        try:
+            open_streams = len(threads)
+            while open_streams:
+                name, line = lines.get()
+                if line is None:
+                    open_streams -= 1
+                    continue
+                if handler is not None:
+                    handler.handle(
+                        logging.makeLogRecord({"name": name, "msg": line.rstrip("\n")})
+                    )
+                yield name, line
+        except GeneratorExit:
+            self._proc.kill()
+            self._proc.wait()
+            raise
+        finally:
+            if handler is not None:
+                handler.close()
+        for t in threads:
+            t.join()
+        maxrss = _wait(self._proc)
+        self.result = RunResult(
+            self.args,
+            self._proc.returncode,
+            time.perf_counter() - self._t0,
+            maxrss,
+        )
+
+
+def echo(stream, line):
+    """Default output callback; write line to the terminal."""
+    out = sys.stdout if stream == "stdout" else sys.stderr
+    out.write(line)
+    out.flush()
+
+
+def _record(result, started):
+    """Record run result in the project run history."""
+    # pylint: disable=import-outside-toplevel
+    from . import runhistory
+
+    runhistory.record_run(
+        result.args, started, time.time(), result.returncode, result.maxrss
+    )
+
+
+def run(args, *, callback=echo, logfile=None, check=True, **kwargs):
+    """Run command, streaming output line by line.
+
+    :param args: Command arguments; a string is split with shell syntax.
+    :param callback: Function called with (stream, line) for every
+        output line. None discards output.
+    :param logfile: If set, tee output to this rotating log file.
+    :param bool check: Raise CalledProcessError on non-zero exit code.
+    :param kwargs: Keyword arguments passed to :class:`subprocess.Popen`.
+    :rtype: RunResult
+    """
+    started = time.time()
+    proc = Process(args, logfile=logfile, **kwargs)
+    for stream, line in proc:
+        if callback is not None:
+            callback(stream, line)
+    result = proc.result
+    _record(result, started)
+    logger.debug(
+        "%s exited with %i in %.2fs, peak rss %s kB",
+        shlex.join(result.args),
+        result.returncode,
+        result.seconds,
+        result.maxrss,
+    )
+    if check and not result.ok:
+        logger.error("%s failed", shlex.join(result.args))
+        raise subprocess.CalledProcessError(result.returncode, result.args)
+    return result
+
+
+class _SessionApi:
+    """Stand-in for snakemake.api.SnakemakeApi that reuses workflows."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.session.api, name)
+
+    def workflow(self, **kwargs):
+        """Return cached workflow API for settings."""
+        return self.session.workflow(**kwargs)
+
+
+def snakemake_api_supported():
+    """Return True if the installed snakemake works with the api engine.
+
+    :class:`SnakemakeSession` relies on internals of the snakemake
+    :data:`SNAKEMAKE_API_MAJOR` API, which are checked for.
+
+    :raises ImportError: If snakemake is not installed.
+    """
+    # pylint: disable=import-outside-toplevel
+    import dataclasses
+
+    from snakemake import __version__, api, cli
+
+    if __version__.split(".", 1)[0] != str(SNAKEMAKE_API_MAJOR):
+        return False
+    if not all(hasattr(cli, x) for x in ("SnakemakeApi", "parse_args", "args_to_api")):
+        return False
+    try:
+        fields = {
+            f.name
+            for cls in (api.SnakemakeApi, api.WorkflowApi)
+            for f in dataclasses.fields(cls)
+        }
+    except TypeError:
+        return False
+    return {"_workflow_api", "_workflow_store", "_workdir_handler"} <= fields
+
+
+class SnakemakeSession:
+    """Run snakemake through its Python API in the current process.
+
+    Arguments are parsed and translated to API calls by the snakemake
+    command line parser, so options behave as with the snakemake
+    executable. Workflows parsed for dry runs are kept, and reused by
+    later dry runs with the same settings as long as the snakefiles,
+    including included files, and configuration files are unchanged.
+    Other runs always parse the workflow anew.
+
+    Dry runs temporarily replace snakemake.cli.SnakemakeApi, and runs
+    change the working directory, so runs of all sessions are
+    serialized by a lock. Only snakemake versions for which
+    :func:`snakemake_api_supported` is true are supported.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.api = None
+        self._api_key = None
+        self._workflows = {}
+
+    def _make_api(self, output_settings):
+        from snakemake.api import (  # pylint: disable=import-outside-toplevel
+            SnakemakeApi,
+        )
+
+        key = repr(output_settings)
+        if self.api is None or key != self._api_key:
+            self.close()
+            self.api = SnakemakeApi(output_settings)
+            self.api.__enter__()  # pylint: disable=unnecessary-dunder-call
+            self._api_key = key
+        return _SessionApi(self)
+
+    @staticmethod
+    def _stamp(workflow_api):
+        """Return modification times of workflow sources."""
+        # pylint: disable=protected-access
+        workflow = workflow_api._workflow_store
+        if workflow is None:
+            return None
+        stamp = [
+            (f.get_path_or_uri(secret_free=True), f.mtime()) for f in workflow.included
+        ]
+        for fn in workflow_api.config_settings.configfiles or []:
+            try:
+                stamp.append((str(fn), os.stat(fn).st_mtime_ns))
+            except OSError:
+                stamp.append((str(fn), None))
+        return stamp
+
+    def workflow(self, **kwargs):
+        """Return workflow API for settings, reusing a cached one.
+
+        :param kwargs: Keyword arguments of
+            snakemake.api.SnakemakeApi.workflow.
+        """
+        key = repr(sorted(kwargs.items()))
+        cached = self._workflows.get(key)
+        if cached is not None:
+            workflow_api, stamp = cached
+            if stamp is not None and stamp == self._stamp(workflow_api):
+                logger.debug("reusing parsed workflow %s", workflow_api.snakefile)
+                # pylint: disable=protected-access
+                workflow_api._workdir_handler.change_to()
+                return workflow_api
+            self._teardown(workflow_api)
+        workflow_api = self.api.workflow(**kwargs)
+        self._workflows[key] = (workflow_api, None)
+        return workflow_api
+
+    @staticmethod
+    def _teardown(workflow_api):
+        # pylint: disable=protected-access
+        if workflow_api._workflow_store is not None:
+            workflow_api._workflow_store.tear_down()
+
+    def run(self, args):
+        """Run snakemake with command line arguments.
+
+        :param list args: Snakemake command line arguments.
+        :return: True if snakemake succeeded.
+        """
+        from snakemake import cli  # pylint: disable=import-outside-toplevel
+
+        with self._lock:
+            parser, parsed = cli.parse_args(split_args(args))
+            return self._run(cli, parser, parsed)
+
+    def _run(self, cli, parser, parsed):
+        cwd = os.getcwd()
+        try:
+            if not parsed.dryrun:
+                return bool(cli.args_to_api(parsed, parser))
+            api_class = cli.SnakemakeApi
+            cli.SnakemakeApi = self._make_api
+            try:
+                return bool(cli.args_to_api(parsed, parser))
+            finally:
+                cli.SnakemakeApi = api_class
+                for key, (workflow_api, stamp) in list(self._workflows.items()):
+                    if stamp is None:
+                        self._workflows[key] = (workflow_api, self._stamp(workflow_api))
+        finally:
+            os.chdir(cwd)
+
+    def close(self):
+        """Tear down cached workflows."""
+        for workflow_api, _ in self._workflows.values():
+            self._teardown(workflow_api)
+        self._workflows = {}
+        if self.api is not None:
+            # Cached workflows are already torn down
+            self.api._workflow_api = None  # pylint: disable=protected-access
+            self.api.__exit__(None, None, None)
+            self.api = None
+
+
+_SESSION = None
+
+
+def snakemake_session():
+    """Return the snakemake session of this process."""
+    global _SESSION  # pylint: disable=global-statement
+    if _SESSION is None:
+        _SESSION = SnakemakeSession()
+    return _SESSION
+
+
+def snakemake(*, targets=None, options=None, snakefile=None, engine=None, **kwargs):
+    """Run snakemake workflows.
+
+    :param targets: Targets, as a list or a string.
+    :param options: Snakemake options, as a list or a string.
+    :param snakefile: Snakefile.
+    :param str engine: 'process' runs the snakemake executable, and
+        'api' runs snakemake in the current process with
+        :class:`SnakemakeSession`. Defaults to the SNAKEMAKE_ENGINE
+        environment variable, or 'process'.
+    :param kwargs: Keyword arguments passed to :func:`run`. The api
+        engine, which writes output directly to the terminal, only
+        accepts check. If the installed snakemake is not supported by
+        the api engine, the process engine is used.
+    :return: Run result, or None if snakemake is not installed.
+    :raises TypeError: If the api engine is given other keyword
+        arguments than check.
+    """
+    args = ["snakemake"]
+    if snakefile:
+        args += ["-s", str(snakefile)]
+    args += split_args(options) + split_args(targets)
+    engine = engine or os.environ.get(SNAKEMAKE_ENGINE_ENVVAR, "process")
+    if engine not in ("process", "api"):
+        raise ValueError(f"unknown snakemake engine {engine!r}")
+    if engine == "api":
+        unsupported = sorted(set(kwargs) - {"check"})
+        if unsupported:
+            raise TypeError(
+                f"snakemake engine 'api' does not support {', '.join(unsupported)}"
+            )
+        try:
+            if not snakemake_api_supported():
+                logger.warning(
+                    "snakemake engine 'api' requires snakemake %i; "
+                    "running the snakemake executable",
+                    SNAKEMAKE_API_MAJOR,
+                )
+                return snakemake(
+                    targets=targets,
+                    options=options,
+                    snakefile=snakefile,
+                    engine="process",
+                    **kwargs,
+                )
+            session = snakemake_session()
+            started = time.time()
+            t0 = time.perf_counter()
+            ok = session.run(args[1:])
+        except ImportError:
+            logger.info("snakemake not installed; cannot run command:")
+            logger.info("  %s", shlex.join(args))
+            return None
+        result = RunResult(args, 0 if ok else 1, time.perf_counter() - t0)
+        _record(result, started)
+        if kwargs.get("check", True) and not result.ok:
+            raise subprocess.CalledProcessError(result.returncode, result.args)
+        return result
     if shutil.which("snakemake") is None:
         logger.info("snakemake not installed; cannot run command:")
-        logger.info("  %s", cmd)
-        return
+        logger.info("  %s", shlex.join(args))
+        return None
+    return run(args, **kwargs)
 
-    try:
-        logger.debug("running %s", cmd)
-        subprocess.run(cmd, check=True, shell=True)
-    except subprocess.CalledProcessError:
-        logger.error("%s failed", cmd)
-        raise
+
+def _rstring(value):
+    """Return value as a double-quoted R string."""
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{value}"'
 
 
-def rmarkdown(path, output_dir=None):
+def rmarkdown(path, output_dir=None, **kwargs):
     """Render Rmarkdown files"""
-    render_args = [f'"{str(path)}"']
+    render_args = [_rstring(path)]
     if output_dir is not None:
-        render_args += [f'output_dir="{str(output_dir)}"']
+        render_args += [f"output_dir={_rstring(output_dir)}"]
     render = ",".join(render_args)
-    cmdlist = [
-        "R",
-        "-e",
-        f"'library(rmarkdown); rmarkdown::render({str(render)})'",
-    ]
-    cmd = " ".join(cmdlist)
-    try:
-        subprocess.run(cmd, shell=True, check=True)
-    except subprocess.CalledProcessError:
-        logger.error("%s failed", cmd)
-        raise
+    args = ["R", "-e", f"library(rmarkdown); rmarkdown::render({render})"]
+    return run(args, **kwargs)
 
 
-def jupyter_book(path, output_format="html"):
+def quarto(path, output_dir=None, **kwargs):
+    """Render quarto documents"""
+    args = ["quarto", "render", str(path)]
+    if output_dir is not None:
+        args += ["--output-dir", str(output_dir)]
+    return run(args, **kwargs)
+
+
+def jupyter_book(path, output_format="html", **kwargs):
     """Build jupyter book"""
-    reportdir = f"_build/{output_format}/reports"
-    cmdlist = ["jupyter-book", "build", "-W", "-n", "--keep-going", path]
-    cmd = " ".join(cmdlist)
+    reportdir = os.path.join(path, "_build", output_format, "reports")
+    args = ["jupyter-book", "build", "-W", "-n", "--keep-going", str(path)]
     try:
-        subprocess.run(cmd, shell=True, check=True)
+        return run(args, **kwargs)
     except subprocess.CalledProcessError:
-        logger.error("%s failed", cmd)
-        if os.path.exists(reportdir):
+        if os.path.isdir(reportdir):
             logger.info("Error occured; showing saved reports")
-            subprocess.run(["cat", f"{reportdir}/*"], check=True)
+            for fn in sorted(os.listdir(reportdir)):
+                with open(os.path.join(reportdir, fn), encoding="utf-8") as fh:
+                    logger.info("%s:\n%s", fn, fh.read())
         raise
 
 
-def pandoc(path, output, output_format="html", **kwargs):
-    """Convert single markdown files"""
-    output = pypandoc.convert_file(path, outputfile=output, to=output_format, **kwargs)
+def pandoc(  # pylint: disable=too-many-arguments
+    path,
+    output,
+    output_format="html",
+    *,
+    input_format=None,
+    extra_args=(),
+    to=None,
+    format=None,  # noqa: A002 pylint: disable=redefined-builtin
+    filters=None,
+    sandbox=False,
+    cworkdir=None,
+    verify_format=True,  # pylint: disable=unused-argument
+    sort_files=True,  # pylint: disable=unused-argument
+    **kwargs,
+):
+    """Convert single markdown files
+
+    The keyword arguments of :func:`pypandoc.convert_file`, which this
+    function used to call, are accepted and mapped onto pandoc
+    arguments; verify_format and sort_files have no effect.
+
+    :param path: Input file.
+    :param output: Output file.
+    :param str output_format: Output format.
+    :param str input_format: Input format; by default inferred from
+        the file extension.
+    :param extra_args: Additional pandoc arguments.
+    :param str to: Output format; overrides output_format.
+    :param str format: Input format; same as input_format.
+    :param filters: Pandoc filters; lua filters end with .lua.
+    :param bool sandbox: Run pandoc in sandbox mode.
+    :param cworkdir: Working directory of pandoc.
+    :param kwargs: Keyword arguments passed to :func:`run`.
+    """
+    input_format = input_format or format
+    args = [pypandoc.get_pandoc_path(), str(path), "-o", str(output)]
+    args += ["-t", to or output_format]
+    if input_format is not None:
+        args += ["-f", input_format]
+    args += split_args(extra_args)
+    for f in split_args(filters):
+        args.append(f"--lua-filter={f}" if f.endswith(".lua") else f"--filter={f}")
+    if sandbox:
+        args.append("--sandbox")
+    if cworkdir is not None:
+        kwargs.setdefault("cwd", cworkdir)
+    return run(args, **kwargs)
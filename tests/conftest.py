@@ -12,6 +12,22 @@ def pytest_configure():
     pytest.project = os.path.dirname(pytest.dname)
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    """Monkeypatch user cache directory to a temporary directory."""
+    p = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv("NBIS_ADMIN_CACHE_DIR", str(p))
+    return p
+
+
+@pytest.fixture(autouse=True)
+def run_history(tmp_path_factory, monkeypatch):
+    """Monkeypatch run history database to a temporary file."""
+    p = tmp_path_factory.mktemp("runs") / "runs.sqlite"
+    monkeypatch.setenv("NBIS_ADMIN_RUN_HISTORY", str(p))
+    return p
+
+
 @pytest.fixture(autouse=False)
 def cd_tmp_path(tmp_path, monkeypatch):
     """Monkeypatch change directory to tmp_path."""
@@ -1,6 +1,9 @@
 """Test commands."""
 
+import os
+
 from nbis.cli import cli
+from nbis.commandindex import CommandIndex, defined_names
 
 
 def test_add_template(runner):
@@ -14,3 +17,98 @@ def test_add_tool(runner):
     result = runner.invoke(cli, ["add", "tool", "snakemake", "--show"])
     print(result.stdout)
     assert not result.exception
+
+
+def test_defined_names():
+    """Test indexing of functions and command names."""
+    source = (
+        "import click\n"
+        "@main.command(name='list')\n"
+        "def list_cmd():\n"
+        "    def nested():\n"
+        "        pass\n"
+        "async def run():\n"
+        "    '''def fake():'''\n"
+    )
+    assert defined_names(source) == {"list", "list_cmd", "run"}
+    assert defined_names("def broken(:\ndef ok():\n") == {"broken", "ok"}
+
+
+def test_add_commands(runner, project_foo):
+    """Test adding several commands to a group in one pass"""
+    (project_foo / "project_foo.yaml").write_text("project_name: project_foo\n")
+    commands = project_foo / "src" / "project_foo" / "commands"
+    result = runner.invoke(cli, ["add", "command-group", "grp"])
+    assert not result.exception
+    grp = commands / "grp.py"
+    spec = project_foo / "commands.yaml"
+    spec.write_text(
+        "- command: c\n  group: grp\n"
+        "- command: solo\n  standalone: true\n"
+        "- command: a\n  group: grp\n"
+    )
+    result = runner.invoke(cli, ["add", "command", "a", "b", "--group", "grp"])
+    assert not result.exception
+    result = runner.invoke(cli, ["add", "command", "--spec", str(spec)])
+    assert not result.exception
+    text = grp.read_text()
+    assert [text.count(f"def {c}(") for c in "abc"] == [1, 1, 1]
+    solo = (commands / "solo.py").read_text()
+    assert "def main(" in solo
+    result = runner.invoke(cli, ["add", "command", "solo", "--standalone"])
+    assert (commands / "solo.py").read_text() == solo
+    result = runner.invoke(cli, ["add", "command", "missing", "--group", "nogroup"])
+    assert "no such command group file" in result.stderr
+    spec.write_text("- command: d\n  grp: grp\n")
+    result = runner.invoke(cli, ["add", "command", "--spec", str(spec)])
+    assert "unknown keys grp" in result.stderr
+
+
+def test_command_index(tmp_path):
+    """Test command index parsing and cache invalidation."""
+    commands = tmp_path / "commands"
+    commands.mkdir()
+    grp = commands / "grp.py"
+    grp.write_text(
+        "@click.group(name='grp')\n"
+        "def main():\n    pass\n"
+        "@main.command(name='x')\n"
+        "@click.option('--y')\n"
+        "def do_x(y):\n    pass\n"
+        "@main.command()\n"
+        "def run_all():\n    pass\n"
+    )
+    cache_file = tmp_path / "index.json"
+    index = CommandIndex(commands, cache_file=cache_file)
+    index.save()
+    entries = {c.name: c for _, c in index.commands("grp")}
+    assert sorted(entries) == ["grp", "run-all", "x"]
+    assert entries["x"].function == "do_x" and entries["x"].parent == "main"
+    assert entries["grp"].kind == "group" and entries["grp"].parent is None
+    assert {"x", "do_x", "main"} <= index.names("grp")
+    mtime = cache_file.stat().st_mtime_ns
+    index = CommandIndex(commands, cache_file=cache_file)
+    index.save()
+    assert cache_file.stat().st_mtime_ns == mtime
+    with open(grp, "a", encoding="utf-8") as fh:
+        fh.write("@main.command()\ndef z():\n    pass\n")
+    st = grp.stat()
+    os.utime(grp, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert "z" in CommandIndex(commands, cache_file=cache_file).names("grp")
+    grp.unlink()
+    assert "grp" not in CommandIndex(commands, cache_file=cache_file)
+
+
+def test_list_commands(runner, project_foo):
+    """Test listing project commands"""
+    (project_foo / "project_foo.yaml").write_text("project_name: project_foo\n")
+    result = runner.invoke(cli, ["add", "command-group", "grp"])
+    assert not result.exception
+    result = runner.invoke(cli, ["add", "command", "a_b", "--group", "grp"])
+    assert not result.exception
+    result = runner.invoke(cli, ["add", "list-commands", "grp"])
+    assert not result.exception
+    lines = result.stdout.splitlines()
+    assert lines[0].split() == ["module", "command", "kind", "parent", "definition"]
+    assert any(line.split()[:4] == ["grp", "a-b", "command", "main"] for line in lines)
+    assert (project_foo / ".nbis-admin" / "commandindex.json").exists()
@@ -0,0 +1,36 @@
+"""Test allocation detection."""
+
+from nbis import allocation
+
+
+def test_detect_allocation(tmp_path, monkeypatch):
+    """Test reading limits from a cgroup v2 hierarchy."""
+    root = tmp_path / "cgroup"
+    session = root / "user.slice" / "session"
+    session.mkdir(parents=True)
+    (root / "user.slice" / "cpu.max").write_text("250000 100000\n")
+    (root / "user.slice" / "memory.max").write_text(f"{4 << 30}\n")
+    (root / "user.slice" / "memory.current").write_text(f"{1 << 30}\n")
+    (session / "cpu.max").write_text("max 100000\n")
+    (session / "memory.max").write_text("max\n")
+    (session / "memory.high").write_text(f"{2 << 30}\n")
+    (session / "memory.current").write_text(f"{512 << 20}\n")
+    proc_cgroup = tmp_path / "cgroup.txt"
+    proc_cgroup.write_text("1:cpu:/\n0::/user.slice/session\n")
+    monkeypatch.setattr(allocation, "affinity_cpus", lambda: 8)
+    alloc = allocation.detect_allocation(root, proc_cgroup)
+    assert alloc.cpus == 3
+    assert alloc.memory == (2 << 30) - (512 << 20)
+    monkeypatch.setattr(allocation, "affinity_cpus", lambda: 2)
+    assert allocation.detect_allocation(root, proc_cgroup).cpus == 2
+
+
+def test_detect_allocation_no_cgroup(tmp_path, monkeypatch):
+    """Test fallback to meminfo outside a cgroup v2 hierarchy."""
+    meminfo = tmp_path / "meminfo"
+    meminfo.write_text("MemTotal: 100 kB\nMemAvailable:   2048 kB\n")
+    assert allocation.meminfo_available(meminfo) == 2 << 20
+    monkeypatch.setattr(allocation, "meminfo_available", lambda: 2 << 20)
+    alloc = allocation.detect_allocation(tmp_path, tmp_path / "missing")
+    assert alloc.memory == 2 << 20
+    assert alloc.cpus == allocation.affinity_cpus()
@@ -2,8 +2,11 @@
 
 import logging
 import re
+import subprocess
+import sys
 
-from nbis.cli import cli
+from nbis import manifest
+from nbis.cli import NbisCLI, cli
 
 
 def test_cli(runner):
@@ -36,3 +39,35 @@ def test_cli_debug(runner, caplog):
     assert not result.exception
     assert caplog.records[0].levelname == "DEBUG"
     assert re.search(r"title:", result.output) is not None
+
+
+def test_command_manifest_up_to_date():
+    """Test that the shipped command manifest matches the commands."""
+    assert manifest.load_manifest(NbisCLI.cmd_folder) == manifest.build_manifest(
+        NbisCLI.module, NbisCLI.cmd_folder
+    )
+
+
+def test_cli_help_is_lazy():
+    """Test that help does not import command modules."""
+    code = (
+        "import sys\n"
+        "from nbis.cli import cli\n"
+        "try:\n"
+        "    cli(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print([m for m in sys.modules if m.startswith('nbis.commands.')])\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert re.search(r"\s+add\s+Add template to a project.", result.stdout)
+    assert result.stdout.strip().endswith("[]")
+
+
+def test_cli_unknown_command(runner):
+    """Test unknown command."""
+    result = runner.invoke(cli, ["foo"])
+    assert result.exit_code == 2
+    assert "No such command 'foo'" in result.stderr
@@ -1,11 +1,14 @@
 """Test configuration."""
 
+import copy
+import pickle
 import re
+from collections import OrderedDict
 
 import pytest
 
 from nbis.cli import cli
-from nbis.config import Config, PropertyDict
+from nbis.config import Config, PropertyDict, get_schema, load_config
 
 
 @pytest.fixture(name="data")
@@ -29,3 +32,90 @@ def test_config_init(runner, pyproject):
     assert not result.exception
     p = out / "project_foo.yaml"
     assert re.search(r"project_name: project_foo", p.read_text())
+
+
+def test_default_config_validates(runner, pyproject):
+    """Test that a generated default configuration is valid."""
+    result = runner.invoke(cli, ["config", "init"])
+    assert not result.exception
+    config = load_config(file=str(pyproject / "project_foo.yaml"))
+    assert config.webexport.include is None  # pylint: disable=no-member
+    schema = get_schema()
+    schema.validate(Config.from_schema(schema))
+
+
+def test_config_read_modes(tmp_path):
+    """Test that safe and round-trip loaders give same configuration."""
+    p = tmp_path / "config.yaml"
+    p.write_text(
+        "# comment\nproject_name: foo\ndocs:\n  src: docs\n"
+        "samples:\n  - SM: a\n  - SM: b\n"
+    )
+    fast = Config(file=str(p))
+    roundtrip = Config(file=str(p), roundtrip=True)
+    assert fast.asdict() == roundtrip.asdict()
+    assert fast.samples[1].SM == "b"  # pylint: disable=no-member
+    data = roundtrip.read_from_file(str(p), roundtrip=True)
+    assert "comment" in str(data.ca.comment)
+
+
+def test_config_empty_file(tmp_path):
+    """Test reading empty configuration file."""
+    p = tmp_path / "config.yaml"
+    p.touch()
+    assert Config(file=str(p)).is_empty
+
+
+class TestPropertyDict:
+    """Test PropertyDict."""
+
+    @pytest.fixture(name="pdict")
+    def fpdict(self):
+        """PropertyDict fixture."""
+        return PropertyDict(
+            {"a": {"b": {"c": 1}}, "items": [{"x": 1}, 2], "keys": "value"}
+        )
+
+    def test_lazy_wrapping(self, pdict):
+        """Test that nested dicts are wrapped on first access."""
+        assert type(OrderedDict.__getitem__(pdict, "a")) is dict
+        assert isinstance(pdict.a, PropertyDict)
+        assert pdict.a is pdict["a"]
+        assert isinstance(OrderedDict.__getitem__(pdict, "a"), PropertyDict)
+        assert type(OrderedDict.__getitem__(pdict.a, "b")) is dict
+        assert pdict.a.b.c == 1
+
+    def test_list_wrapping(self, pdict):
+        """Test that dicts in lists are wrapped."""
+        assert isinstance(pdict["items"][0], PropertyDict)
+        assert pdict["items"][0].x == 1
+        assert pdict["items"][1] == 2
+
+    def test_attributes(self, pdict):
+        """Test attribute access."""
+        assert callable(pdict.keys)
+        assert pdict["keys"] == "value"
+        assert pdict.get("a").b.c == 1
+        assert pdict.get("missing", 0) == 0
+        with pytest.raises(AttributeError):
+            _ = pdict.missing
+
+    def test_items(self, pdict):
+        """Test that items and values wrap nested dicts."""
+        for _, v in pdict.items():
+            if isinstance(v, dict):
+                assert isinstance(v, PropertyDict)
+        assert isinstance(list(pdict.values())[0], PropertyDict)
+
+    def test_asdict(self, pdict):
+        """Test conversion to dict."""
+        _ = pdict.a.b
+        d = pdict.asdict()
+        assert d == {"a": {"b": {"c": 1}}, "items": [{"x": 1}, 2], "keys": "value"}
+        assert type(d["a"]) is dict
+        assert type(d["items"][0]) is dict
+
+    def test_copy(self, pdict):
+        """Test copying and pickling."""
+        assert copy.deepcopy(pdict).asdict() == pdict.asdict()
+        assert pickle.loads(pickle.dumps(pdict)).asdict() == pdict.asdict()
@@ -0,0 +1,114 @@
+"""Test cached snakemake dry runs."""
+
+import pytest
+
+from nbis import dryrun
+
+OUTPUT = """Building DAG of jobs...
+[Sun Oct 18 15:48:37 2026]
+rule c:
+    output: c.txt
+    jobid: 3
+    reason: Missing output files: c.txt
+    resources: tmpdir=/tmp
+[Sun Oct 18 15:48:37 2026]
+rule a:
+    output: a.txt
+    jobid: 2
+    reason: Missing output files: a.txt
+[Sun Oct 18 15:48:37 2026]
+rule b:
+    input: a.txt
+    output: b.txt
+    jobid: 1
+    reason: Missing output files: b.txt; Input files updated by another job: a.txt
+[Sun Oct 18 15:48:37 2026]
+localrule all:
+    input: b.txt, c.txt
+    jobid: 0
+    reason: Input files updated by another job: c.txt, b.txt
+Job stats:
+job      count
+"""
+
+SNAKEFILE = """rule all:
+    input: "b.txt", "c.txt"
+rule a:
+    output: "a.txt"
+rule b:
+    input: "a.txt"
+    output: "b.txt"
+rule c:
+    output: "c.txt"
+"""
+
+
+def test_parse_dry_run():
+    """Test parsing jobs from dry run output."""
+    jobs = dryrun.parse_dry_run(OUTPUT.splitlines(keepends=True))
+    assert [j.rule for j in jobs] == ["c", "a", "b", "all"]
+    assert jobs[2].input == ["a.txt"]
+    assert jobs[2].output == ["b.txt"]
+    assert jobs[3].local and jobs[3].jobid == 0
+    assert list(dryrun.format_jobs(jobs))[-1] == "total      4"
+
+
+def test_dry_run_cache(tmp_path, monkeypatch):
+    """Test dry run cache hits and invalidation."""
+    pytest.importorskip("snakemake.cli")
+    monkeypatch.chdir(tmp_path)
+    smkfile = tmp_path / "Snakefile"
+    smkfile.write_text(SNAKEFILE)
+    calls = []
+
+    def runner(options, targets):
+        calls.append(targets)
+        return OUTPUT.splitlines(keepends=True)
+
+    cache = dryrun.DryRunCache(tmp_path / "cache")
+
+    def dry_run(*targets):
+        return cache.dry_run(["-c1", *targets], smkfile, runner=runner)
+
+    result = dry_run("b.txt", "c.txt")
+    assert result.computed == ["b.txt", "c.txt"]
+    assert [j.rule for j in result.jobs] == ["a", "b", "c"]
+    result = dry_run("b.txt", "c.txt")
+    assert result.cached == ["b.txt", "c.txt"]
+    assert [j.rule for j in result.jobs] == ["a", "b", "c"]
+    assert len(calls) == 1
+    # Only the target whose output changed is run again
+    (tmp_path / "c.txt").touch()
+    result = dry_run("b.txt", "c.txt")
+    assert result.cached == ["b.txt"]
+    assert calls[-1] == ["c.txt"]
+    # Configuration changes invalidate all targets
+    (tmp_path / "config.yaml").write_text("samples: samples.tsv\n")
+    assert dry_run("b.txt", "c.txt").computed == ["b.txt", "c.txt"]
+    assert dry_run("b.txt").cached == ["b.txt"]
+    # ... as do changes to sample sheets referred to by the configuration
+    (tmp_path / "samples.tsv").write_text("SM\n")
+    assert dry_run("b.txt").computed == ["b.txt"]
+    smkfile.write_text(SNAKEFILE + "\n")
+    assert dry_run("b.txt").computed == ["b.txt"]
+    assert len(calls) == 5
+
+
+def test_dry_run_unparsed(tmp_path, monkeypatch):
+    """Test that output without jobs is only cached if nothing is to be done."""
+    pytest.importorskip("snakemake.cli")
+    monkeypatch.chdir(tmp_path)
+    smkfile = tmp_path / "Snakefile"
+    smkfile.write_text(SNAKEFILE)
+    output = ["Building DAG of jobs...\n"]
+    cache = dryrun.DryRunCache(tmp_path / "cache")
+
+    def dry_run():
+        return cache.dry_run(["-c1", "b.txt"], smkfile, runner=lambda *args: output)
+
+    result = dry_run()
+    assert result.jobs == [] and result.output == output
+    assert dry_run().computed == ["b.txt"]
+    output.append("Nothing to be done (all requested files are present).\n")
+    assert dry_run().output is None
+    assert dry_run().cached == ["b.txt"]
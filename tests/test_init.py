@@ -1,5 +1,9 @@
 """Test initialization of project."""
 
+import os
+import pathlib
+
+from nbis import templates
 from nbis.cli import cli
 
 expected = [
@@ -14,7 +18,10 @@ expected = [
     "project_foo/src/project_foo/cli.py",
     "project_foo/src/project_foo/config.py",
     "project_foo/src/project_foo/core/__init__.py",
+    "project_foo/src/project_foo/core/allocation.py",
+    "project_foo/src/project_foo/core/dryrun.py",
     "project_foo/src/project_foo/core/options.py",
+    "project_foo/src/project_foo/core/runhistory.py",
     "project_foo/src/project_foo/core/snakemake.py",
     "project_foo/src/project_foo/core/wrappers.py",
     "project_foo/src/project_foo/commands/__init__.py",
@@ -49,3 +56,128 @@ def test_init_curdir(runner, project_foo):
     assert not result.exception
     files = [str(p.relative_to(out.parent)) for p in out.rglob("*") if p.is_file()]
     assert sorted(files) == sorted(expected)
+
+
+def test_init_dry_run(runner, tmp_path):
+    """Test that dry run lists the plan without generating files."""
+    out = tmp_path / "project_foo"
+    result = runner.invoke(cli, ["init", str(out), "--dry-run"])
+    assert not result.exception
+    assert not out.exists()
+    lines = result.output.splitlines()
+    assert len(lines) == len(expected)
+    assert f"{out / 'pyproject.toml'} <- pyproject.toml.j2" in lines
+
+
+def test_init_failure(runner, tmp_path, monkeypatch):
+    """Test that a failing template leaves no partial project."""
+
+    def render(self):
+        if self.path.name == "cli.py":
+            raise RuntimeError("template error")
+        return ""
+
+    monkeypatch.setattr(templates.PlannedFile, "render", render)
+    out = tmp_path / "project_foo"
+    result = runner.invoke(cli, ["init", str(out)])
+    assert isinstance(result.exception, RuntimeError)
+    assert list(tmp_path.iterdir()) == []
+    out.mkdir()
+    (out / "README.md").write_text("readme")
+    result = runner.invoke(cli, ["init", str(out)])
+    assert isinstance(result.exception, RuntimeError)
+    assert [p.name for p in tmp_path.iterdir()] == ["project_foo"]
+    assert [p.name for p in out.iterdir()] == ["README.md"]
+
+
+def test_scaffold_plan(tmp_path, monkeypatch):
+    """Test that existing files and modules are skipped."""
+    staging = []
+    mkdtemp = templates.tempfile.mkdtemp
+    monkeypatch.setattr(
+        templates.tempfile,
+        "mkdtemp",
+        lambda **kw: staging.append(mkdtemp(**kw)) or staging[-1],
+    )
+    (tmp_path / "README.md").write_text("readme")
+    (tmp_path / "src" / "foo" / "core").mkdir(parents=True)
+    plan = templates.ScaffoldPlan(tmp_path)
+    plan.add_templates(files=["README.md", ".gitignore"], project_name="foo")
+    plan.add_py_module(module="foo", submodule="core", files=["options.py"])
+    plan.add_py_module(module="foo", submodule="commands")
+    assert sorted(p.path.as_posix() for p in plan) == [
+        ".gitignore",
+        "src/foo/commands/__init__.py",
+    ]
+    plan.commit()
+    assert (tmp_path / "README.md").read_text() == "readme"
+    assert (tmp_path / "src" / "foo" / "commands" / "__init__.py").read_text() == ""
+    assert not list(tmp_path.parent.glob(f".{tmp_path.name}.*"))
+    # An existing root is staged inside the root
+    assert [pathlib.Path(x).parent for x in staging] == [tmp_path]
+    assert not list(tmp_path.glob(".nbis-staging-*"))
+
+
+def test_scaffold_plan_permissions(tmp_path):
+    """Test that a new root does not inherit staging permissions."""
+    plan = templates.ScaffoldPlan(tmp_path / "foo")
+    plan.add("setup.cfg")
+    plan.commit()
+    umask = os.umask(0)
+    os.umask(umask)
+    assert (tmp_path / "foo").stat().st_mode & 0o777 == 0o777 & ~umask
+
+
+def test_init_from_manifest(runner, cd_tmp_path):
+    """Test initialization of several projects from a manifest."""
+    manifest = cd_tmp_path / "projects.tsv"
+    manifest.write_text(
+        "project_directory\tproject_name\tauthor\n"
+        "project_foo\t\t\n"
+        "project_bar\tbar\tJane Doe\n"
+        "\t\t\n"
+        "existing\t\t\n"
+    )
+    (cd_tmp_path / "existing" / "src" / "existing").mkdir(parents=True)
+    (cd_tmp_path / "existing" / "README.md").write_text("readme")
+    args = ["init", "--from-manifest", str(manifest), "--author", "John Doe"]
+    result = runner.invoke(cli, args)
+    assert not result.exception
+    out = cd_tmp_path / "project_foo"
+    files = [str(p.relative_to(out.parent)) for p in out.rglob("*") if p.is_file()]
+    assert sorted(files) == sorted(expected)
+    assert (
+        "Jane Doe"
+        in (cd_tmp_path / "project_bar" / "src" / "bar" / "cli.py").read_text()
+    )
+    assert "John Doe" in (out / "src" / "project_foo" / "cli.py").read_text()
+    lines = result.output.splitlines()
+    assert lines[1].startswith("project_foo") and lines[1].endswith("ok")
+    assert len(lines) == 4
+
+
+def test_init_from_manifest_errors(runner, cd_tmp_path, monkeypatch):
+    """Test manifest validation and failing projects."""
+    manifest = cd_tmp_path / "projects.tsv"
+    manifest.write_text("project_directory\tlicense\nfoo\tMIT\n")
+    result = runner.invoke(cli, ["init", "--from-manifest", str(manifest)])
+    assert "unknown columns license" in result.stderr
+    manifest.write_text("project_directory\nfoo\n./foo\n")
+    result = runner.invoke(cli, ["init", "--from-manifest", str(manifest)])
+    assert "duplicate project_directory" in result.stderr
+    result = runner.invoke(cli, ["init", "foo", "--from-manifest", str(manifest)])
+    assert "either PROJECT_DIRECTORY or --from-manifest" in result.stderr
+
+    def commit(self, **kwargs):
+        if self.root.name == "bar":
+            raise OSError("disk full")
+        return original(self, **kwargs)
+
+    original = templates.ScaffoldPlan.commit
+    monkeypatch.setattr(templates.ScaffoldPlan, "commit", commit)
+    manifest.write_text("project_directory\nfoo\nbar\n")
+    result = runner.invoke(cli, ["init", "--from-manifest", str(manifest)])
+    assert result.exit_code == 1
+    assert "1 of 2 projects failed" in result.stderr
+    assert "failed: disk full" in result.output
+    assert (cd_tmp_path / "foo" / "pyproject.toml").exists()
@@ -0,0 +1,29 @@
+"""Test package data access."""
+
+import sys
+import zipfile
+
+from nbis import pkgdata
+
+
+def test_path():
+    """Test resolving package resources on the file system."""
+    schema = pkgdata.path("nbis", "schemas/config.schema.yaml")
+    assert schema.is_file()
+    assert pkgdata.path("nbis", "templates").is_dir()
+
+
+def test_path_zip(tmp_path, monkeypatch):
+    """Test extracting resources of a zip installed package."""
+    archive = tmp_path / "zpkg.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("zpkg/__init__.py", "")
+        zf.writestr("zpkg/data/schema.yaml", "type: object\n")
+        zf.writestr("zpkg/data/sub/a.txt", "a")
+    monkeypatch.syspath_prepend(str(archive))
+    monkeypatch.delitem(sys.modules, "zpkg", raising=False)
+    schema = pkgdata.path("zpkg", "data/schema.yaml")
+    assert schema.read_text() == "type: object\n"
+    assert pkgdata.path("zpkg", "data/schema.yaml") == schema
+    data = pkgdata.path("zpkg", "data")
+    assert (data / "sub" / "a.txt").read_text() == "a"
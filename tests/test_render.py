@@ -0,0 +1,207 @@
+"""Test batch rendering of documentation."""
+
+import sys
+
+import pytest
+
+from nbis import render, wrappers
+from nbis.cli import cli
+
+RENDER = """
+import os, sys
+print("rendering", sys.argv[1])
+if "bad" in sys.argv[1]:
+    sys.exit(1)
+os.makedirs(os.path.dirname(sys.argv[2]), exist_ok=True)
+with open(sys.argv[2], "w") as fh:
+    fh.write("output")
+"""
+
+
+def fake_render(path, output_dir=None, **kwargs):
+    """Fake renderer that fails for files named bad.*"""
+    kind = "jupyter_book" if path.is_dir() else "markdown"
+    output = render.output_file(render.RenderTarget(path, kind, ""), output_dir)
+    if kind == "jupyter_book":
+        output = output / "index.html"
+    args = [sys.executable, "-c", RENDER, str(path), str(output)]
+    return wrappers.run(args, **kwargs)
+
+
+@pytest.fixture(name="docs")
+def fdocs(tmp_path, monkeypatch):
+    """Documentation source fixture."""
+    for kind in render.RENDERERS:
+        monkeypatch.setitem(render.RENDERERS, kind, fake_render)
+    p = tmp_path / "docs"
+    for fn in [
+        "index.md",
+        "slides/bad.Rmd",
+        "slides/talk.qmd",
+        "book/_toc.yml",
+        "book/intro.md",
+        "_build/index.md",
+        ".hidden/notes.md",
+        "data.csv",
+    ]:
+        (p / fn).parent.mkdir(parents=True, exist_ok=True)
+        (p / fn).write_text("")
+    return p
+
+
+def test_discover(docs):
+    """Test render target discovery."""
+    targets = render.discover(docs)
+    assert [(t.name, t.kind) for t in targets] == [
+        ("index.md", "markdown"),
+        ("book", "jupyter_book"),
+        ("slides/bad.Rmd", "rmarkdown"),
+        ("slides/talk.qmd", "quarto"),
+    ]
+    assert [t.name for t in render.discover(docs, kinds=["quarto"])] == [
+        "slides/talk.qmd"
+    ]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_render_all(docs, tmp_path, workers):
+    """Test that a failing target does not stop the others."""
+    targets = render.discover(docs)
+    results = render.render_all(targets, logdir=tmp_path / "logs", workers=workers)
+    assert [r.status for r in results] == ["ok", "ok", "failed", "ok"]
+    for r in results:
+        assert "rendering" in r.log.read_text()
+    assert (tmp_path / "logs" / "slides" / "talk.qmd.log").exists()
+
+
+def test_render_all_no_keep_going(docs):
+    """Test that targets after a failure are skipped."""
+    targets = render.discover(docs, kinds=["rmarkdown", "quarto"])
+    results = render.render_all(targets, keep_going=False)
+    assert [r.status for r in results] == ["failed", "skipped"]
+
+
+def test_docs_render_command(runner, project_foo, docs):
+    """Test docs render command."""
+    (project_foo / "project_foo.yaml").write_text(
+        f"project_name: project_foo\ndocs:\n  src: {docs}\n"
+    )
+    result = runner.invoke(cli, ["docs", "render", "-j", "2"])
+    assert result.exit_code == 1
+    assert "1 of 4 targets failed" in result.stderr
+    assert "slides/talk.qmd" in result.output
+    logs = project_foo / ".nbis-admin" / "logs" / "render"
+    assert (logs / "slides" / "bad.Rmd.log").exists()
+    result = runner.invoke(cli, ["docs", "render", "-f", str(docs / "index.md")])
+    assert not result.exception
+    # Targets outside the project home log inside the log directory
+    assert "../docs/index.md" in result.output
+    assert len(list(logs.glob("*-index.md.log"))) == 1
+    assert not (logs.parent / "docs").exists()
+    result = runner.invoke(cli, ["docs", "render", "--explain", "--kind", "quarto"])
+    assert "slides/talk.qmd: up to date" in result.output
+    result = runner.invoke(cli, ["docs", "render", "--explain", "--force"])
+    assert "slides/talk.qmd: forced" in result.output
+
+
+def test_references(tmp_path):
+    """Test discovery of files referenced by a document."""
+    p = tmp_path / "slides.Rmd"
+    p.write_text(
+        "---\n"
+        "title: Slides\n"
+        "bibliography: [refs.bib, more.bib]\n"
+        "csl: https://example.org/apa.csl\n"
+        "css: style.css\n"
+        "---\n"
+        "![plot](figures/plot.png){width=50%}\n"
+        '<img src="figures/logo.svg"> <a href="other.html">other</a>\n'
+        "```{r}\n"
+        'knitr::include_graphics("figures/diagram.png")\n'
+        "```\n"
+        "[link](https://example.org) [anchor](#top)\n"
+    )
+    assert [x.relative_to(tmp_path).as_posix() for x in render.references(p)] == [
+        "figures/diagram.png",
+        "figures/logo.svg",
+        "figures/plot.png",
+        "more.bib",
+        "refs.bib",
+        "style.css",
+    ]
+
+
+def test_output_file(tmp_path):
+    """Test expected output file from front matter."""
+    p = tmp_path / "doc.Rmd"
+    p.write_text("---\noutput: pdf_document\n---\n")
+    target = render.RenderTarget(p, "rmarkdown", "doc.Rmd")
+    assert render.output_file(target) == tmp_path / "doc.pdf"
+    p.write_text("# No front matter\n")
+    assert render.output_file(target, tmp_path / "out") == tmp_path / "out/doc.html"
+
+
+def test_markdown_output(tmp_path, monkeypatch):
+    """Test that markdown targets are converted to the expected output."""
+    calls = []
+    monkeypatch.setattr(wrappers, "pandoc", lambda *args, **kw: calls.append(args))
+    p = tmp_path / "doc.md"
+    for fmt, writer in [("pdf", "latex"), ("beamer", "beamer"), ("docx", "docx")]:
+        p.write_text(f"---\nformat: {fmt}\n---\n")
+        target = render.RenderTarget(p, "markdown", "doc.md")
+        render.RENDERERS["markdown"](p, output_dir=tmp_path / "out")
+        assert calls[-1] == (p, render.output_file(target, tmp_path / "out"), writer)
+    assert calls[-1][1] == tmp_path / "out" / "doc.docx"
+    assert render.output_suffix("beamer_presentation") == ".pdf"
+
+
+def test_render_uptodate(docs, tmp_path):
+    """Test that unchanged targets are not rendered again."""
+    cachedir = tmp_path / "cache"
+    bib = tmp_path / "refs.bib"
+    bib.write_text("@article{a}")
+    (docs / "index.md").write_text("![fig](fig.png)\n")
+    (docs / "fig.png").write_bytes(b"png")
+    targets = render.discover(docs, kinds=["markdown", "jupyter_book"])
+    kwargs = {"cachedir": cachedir, "dependencies": [bib]}
+
+    def reasons(**kw):
+        return {
+            r.target.name: r.reasons for r in render.render_all(targets, **kwargs, **kw)
+        }
+
+    assert reasons() == {
+        "index.md": ("no previous render",),
+        "book": ("no previous render",),
+    }
+    assert reasons() == {"index.md": (), "book": ()}
+    assert reasons(force=True) == {"index.md": ("forced",), "book": ("forced",)}
+
+    (docs / "fig.png").write_bytes(b"png changed")
+    (docs / "book" / "intro.md").write_text("# Intro")
+    assert reasons() == {
+        "index.md": (f"dependency {docs / 'fig.png'} changed",),
+        "book": ("source changed",),
+    }
+    bib.write_text("@article{b}")
+    (docs / "index.html").unlink()
+    assert reasons() == {
+        "index.md": (f"dependency {bib} changed",),
+        "book": (f"dependency {bib} changed",),
+    }
+    (docs / "index.html").unlink()
+    assert reasons() == {"index.md": ("output missing",), "book": ()}
+    (docs / "index.md").write_text("# Changed\n")
+    assert reasons() == {
+        "index.md": ("source changed", f"dropped dependency {docs / 'fig.png'}"),
+        "book": (),
+    }
+
+
+def test_render_missing_source(docs, tmp_path):
+    """Test that unreadable targets fail without stopping the others."""
+    targets = render.discover(docs, kinds=["markdown", "quarto"])
+    (docs / "index.md").unlink()
+    results = render.render_all(targets, cachedir=tmp_path / "cache")
+    assert [r.status for r in results] == ["failed", "ok"]
+    assert "index.md" in results[0].error
@@ -0,0 +1,126 @@
+"""Test run history."""
+
+import subprocess
+import sys
+
+import pytest
+
+from nbis import runhistory, wrappers
+from nbis.cli import cli
+from nbis.runhistory import RunHistory, RunRecord
+
+INSERT = """
+import sys
+from nbis.runhistory import RunHistory, RunRecord
+history = RunHistory(sys.argv[1])
+for i in range(25):
+    history.add(RunRecord("worker", ["worker", str(i)], seconds=i))
+"""
+
+
+@pytest.mark.parametrize(
+    "args,expected",
+    [
+        (["snakemake", "-s", "src/wf/smk-run.smk", "-j", "2"], "snakemake smk-run"),
+        (["/usr/bin/snakemake", "--snakefile=Snakefile"], "snakemake Snakefile"),
+        (["snakemake"], "snakemake"),
+        (["quarto", "render", "doc.qmd"], "quarto render"),
+        (["/opt/bin/pandoc", "doc.md", "-o", "doc.html"], "pandoc"),
+    ],
+)
+def test_command_name(args, expected):
+    """Test command names that runs are aggregated by."""
+    assert runhistory.command_name(args) == expected
+
+
+def test_run_options():
+    """Test extracting snakemake resources from arguments."""
+    args = ["snakemake", "-c4", "--jobs=8", "--profile", "local", "-t", "2"]
+    assert runhistory.run_options(args) == {
+        "profile": "local",
+        "cores": "4",
+        "jobs": "8",
+        "threads": "2",
+    }
+    assert runhistory.run_options(["pandoc", "-t", "html"])["threads"] is None
+
+
+def test_history_path(tmp_path, monkeypatch):
+    """Test locating the project run history."""
+    monkeypatch.delenv(runhistory.RUN_HISTORY_ENVVAR)
+    monkeypatch.setenv(runhistory.CACHE_DIR_ENVVAR, str(tmp_path / "cache"))
+    user = tmp_path / "cache" / "runs.sqlite"
+    home = tmp_path / "project_foo"
+    (home / "docs").mkdir(parents=True)
+    # pyproject.toml alone does not make a project home
+    (home / "docs" / "pyproject.toml").touch()
+    monkeypatch.chdir(home / "docs")
+    assert runhistory.history_path() == user
+    (home / "project_foo.yaml").touch()
+    assert runhistory.history_path() == home / ".nbis-admin" / "runs.sqlite"
+    (home / "docs" / ".nbis-admin").mkdir()
+    assert runhistory.history_path() == home / "docs" / ".nbis-admin" / "runs.sqlite"
+    monkeypatch.setenv(runhistory.RUN_HISTORY_ENVVAR, "")
+    assert runhistory.history_path() is None
+
+
+def test_record_run(run_history):
+    """Test that wrapped commands are recorded."""
+    wrappers.run([sys.executable, "-c", "print(1)"], callback=None)
+    with pytest.raises(subprocess.CalledProcessError):
+        wrappers.run([sys.executable, "-c", "raise SystemExit(3)"], callback=None)
+    runs = RunHistory(run_history).runs()
+    assert [r.returncode for r in runs] == [3, 0]
+    assert runs[1].args == [sys.executable, "-c", "print(1)"]
+    assert runs[1].finished >= runs[1].started
+    assert RunHistory(run_history).runs(failed=True)[0].id == runs[0].id
+
+
+def test_concurrent_inserts(tmp_path):
+    """Test inserting runs from concurrent processes."""
+    db = tmp_path / "runs.sqlite"
+    procs = [
+        subprocess.Popen([sys.executable, "-c", INSERT, str(db)]) for _ in range(4)
+    ]
+    assert [p.wait() for p in procs] == [0] * 4
+    history = RunHistory(db)
+    assert len(history.runs("worker")) == 100
+    assert history.summary()[0]["runs"] == 100
+
+
+def test_runs_command(runner, run_history):
+    """Test querying the run history."""
+    history = RunHistory(run_history)
+    for i, seconds in enumerate([1.0, 5.0, 3.0]):
+        history.add(
+            RunRecord(
+                "snakemake smk-run",
+                ["snakemake", "-s", "smk-run.smk"],
+                started=1.7e9 + i * 86400,
+                seconds=seconds,
+                returncode=int(i == 2),
+            )
+        )
+    history.add(RunRecord("pandoc", ["pandoc", "a.md"], started=1.7e9, seconds=0.5))
+    result = runner.invoke(cli, ["runs", "summary"])
+    assert not result.exception
+    lines = result.output.splitlines()
+    assert lines[1].split()[:8] == [
+        "snakemake",
+        "smk-run",
+        "3",
+        "1",
+        "3.00",
+        "5.00",
+        "9.00",
+        "-",
+    ]
+    assert lines[2].split()[0] == "pandoc"
+    result = runner.invoke(cli, ["runs", "slowest", "--limit", "1"])
+    assert result.output.splitlines()[1].split()[2] == "5.00"
+    result = runner.invoke(cli, ["runs", "list", "--failed"])
+    assert len(result.output.splitlines()) == 2
+    result = runner.invoke(cli, ["runs", "trend", "snakemake smk-run"])
+    assert len(result.output.splitlines()) == 4
+    result = runner.invoke(cli, ["runs", "trend", "foo"])
+    assert result.exit_code == 1
@@ -0,0 +1,254 @@
+"""Test sample sheet validation."""
+
+import random
+
+import jsonschema
+import pytest
+from ruamel.yaml import YAML
+
+from nbis.cli import cli
+from nbis.config import Schema
+from nbis.samples import (
+    CompiledSchema,
+    coerce,
+    column_types,
+    iter_chunks,
+    make_row,
+    validate_samples,
+)
+from nbis.templates import render_template
+
+_SCHEMA = r"""$schema: "http://json-schema.org/draft-07/schema#"
+
+description: an entry in the sample sheet
+properties:
+  SM:
+    type: string
+    description: sample name/identifier
+  depth:
+    type: integer
+    minimum: 0
+
+patternProperties:
+  '^[a-zA-Z0-9_\.]+$':
+    description: additional metadata column
+    type: [string, number]
+
+required:
+  - SM
+
+additionalProperties: false
+"""
+
+
+@pytest.fixture(name="schemafile")
+def fschemafile(tmp_path):
+    """Schema file fixture."""
+    p = tmp_path / "samples.schema.yaml"
+    p.write_text(_SCHEMA)
+    return p
+
+
+@pytest.fixture(name="schema")
+def fschema():
+    """Schema fixture."""
+    return Schema(YAML(typ="safe").load(_SCHEMA))
+
+
+def write_samples(path, nrows, bad=()):
+    """Write sample sheet with nrows rows; rows in bad have no SM."""
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write("SM\tdepth\tbatch\n")
+        for i in range(nrows):
+            sm = "" if i in bad else f"s{i}"
+            fh.write(f"{sm}\t{i}\tb{i % 3}\n")
+    return path
+
+
+def test_column_types(schema):
+    """Test column types."""
+    types = column_types(schema.asdict(), ["SM", "depth", "batch", "bad-col"])
+    assert types == {
+        "SM": {"string"},
+        "depth": {"integer"},
+        "batch": {"string", "number"},
+        "bad-col": None,
+    }
+    assert coerce("1", {"integer"}) == 1
+    assert coerce("1.5", {"number"}) == 1.5
+    assert coerce("x", {"integer"}) == "x"
+    assert coerce("1", {"string", "number"}) == "1"
+    assert coerce("True", {"boolean"}) is True
+
+
+def test_validate_samples(tmp_path, schemafile):
+    """Test validation reports failing rows with line numbers."""
+    p = write_samples(tmp_path / "samples.tsv", 100, bad=(3, 50))
+    report = validate_samples(p, schemafile)
+    assert report.rows == 100
+    assert [e.line for e in report.errors] == [5, 52]
+    assert "'SM' is a required property" in report.errors[0].message
+
+
+def test_validate_samples_types(tmp_path, schema):
+    """Test validation of coerced values."""
+    p = tmp_path / "samples.tsv"
+    p.write_text("SM\tdepth\ns1\t1\ns2\t-1\ns3\tx\n\ns4\t\n")
+    report = validate_samples(p, schema)
+    assert report.rows == 4
+    assert [e.line for e in report.errors] == [3, 4]
+    assert report.errors[0].message.startswith("depth: ")
+
+
+def test_validate_samples_max_errors(tmp_path, schema):
+    """Test that validation stops at max errors."""
+    p = write_samples(tmp_path / "samples.tsv", 100, bad=range(10, 20))
+    report = validate_samples(p, schema, max_errors=3)
+    assert report.truncated
+    assert [e.line for e in report.errors] == [12, 13, 14]
+    assert report.rows == 13
+
+
+@pytest.mark.parametrize("processes", [2, 3, 7])
+def test_validate_samples_parallel(tmp_path, schema, processes):
+    """Test that parallel validation matches serial validation."""
+    bad = (0, 17, 18, 511, 999)
+    p = write_samples(tmp_path / "samples.tsv", 1000, bad=bad)
+    serial = validate_samples(p, schema)
+    parallel = validate_samples(p, schema, processes=processes)
+    assert parallel.errors == serial.errors
+    assert parallel.rows == serial.rows == 1000
+    limited = validate_samples(p, schema, processes=processes, max_errors=2)
+    assert limited.errors == serial.errors[:2]
+
+
+def test_iter_chunks(tmp_path):
+    """Test chunked iteration."""
+    p = write_samples(tmp_path / "samples.tsv", 25)
+    chunks = list(iter_chunks(p, chunksize=10))
+    assert [len(rows) for _, rows in chunks] == [10, 10, 5]
+    header, rows = chunks[-1]
+    assert header == ["SM", "depth", "batch"]
+    assert rows[-1] == (26, ["s24", "24", "b0"])
+
+
+def test_samples_validate_command(runner, tmp_path, schemafile):
+    """Test samples validate command."""
+    p = write_samples(tmp_path / "samples.tsv", 10, bad=(4,))
+    result = runner.invoke(cli, ["samples", "validate", str(p), "--schema", schemafile])
+    assert result.exit_code == 1
+    assert f"{p}:line 6: 'SM' is a required property" in result.stdout
+    p = write_samples(tmp_path / "samples.tsv", 10)
+    result = runner.invoke(cli, ["samples", "validate", str(p), "--schema", schemafile])
+    assert not result.exception
+
+
+_CORPUS_SCHEMAS = {
+    "template": None,
+    "test": _SCHEMA,
+    "keywords": r"""
+properties:
+  SM: {type: string, pattern: '^s\d+$', minLength: 2, maxLength: 5}
+  depth: {type: integer, minimum: 0, maximum: 100}
+  score: {type: number, exclusiveMinimum: 0, exclusiveMaximum: 1.5}
+  flag: {type: boolean}
+  status: {enum: [ok, fail, 1, true]}
+  batch: {type: [integer, string], enum: ["a.b", 1, 0]}
+required: [SM, depth]
+additionalProperties: {type: string, maxLength: 3}
+""",
+    "subschema_fallback": r"""
+properties:
+  SM: {const: s1}
+  depth: {type: number, multipleOf: 2}
+  score: {not: {type: string}}
+patternProperties:
+  '^s': {type: string, minLength: 3}
+""",
+    "object_fallback": r"""
+type: object
+minProperties: 3
+properties:
+  depth: {type: integer}
+""",
+    "required_missing": r"""
+type: object
+required: [name]
+""",
+    "boolean_subschemas": r"""
+properties:
+  flag: false
+  SM: true
+additionalProperties: false
+""",
+}
+
+_HEADER = ["SM", "depth", "score", "flag", "status", "batch", "extra-col"]
+
+_VALUES = [
+    "",
+    "1",
+    "0",
+    "-1",
+    "1.0",
+    "1.5",
+    "0.5",
+    "1e3",
+    "-0",
+    "nan",
+    "inf",
+    "true",
+    "True",
+    "false",
+    "ok",
+    "abc",
+    " ",
+    "1_000",
+    "0x10",
+    "٣",
+    "99999999999999999999",
+    "a.b",
+    "s1",
+    "s123456",
+]
+
+
+@pytest.mark.parametrize("name", sorted(_CORPUS_SCHEMAS))
+def test_compiled_schema_corpus(name):
+    """Test that compiled schema verdicts match jsonschema verdicts."""
+    pytest.importorskip("pandas")
+    rng = random.Random(name)
+    text = _CORPUS_SCHEMAS[name]
+    if text is None:
+        tpl = "src/python_module/workflow/schemas/samples.schema.yaml.j2"
+        text = render_template(tpl)
+    schema = Schema(YAML(typ="safe").load(text))
+    rows = [[rng.choice(_VALUES) for _ in _HEADER] for _ in range(2000)]
+    rows += [[value] * len(_HEADER) for value in _VALUES]
+    rows += [["s1"], ["s1", "1", "0.5", "true", "ok", "1", "x", "extra"]]
+    compiled = CompiledSchema(schema)
+    assert compiled.compiled == (name != "object_fallback")
+    types = column_types(schema.asdict(), _HEADER)
+    expected = []
+    for values in rows:
+        try:
+            schema.validate(make_row(_HEADER, values, types))
+            expected.append(False)
+        except jsonschema.exceptions.ValidationError:
+            expected.append(True)
+    assert list(compiled.failing(_HEADER, rows)) == expected
+    assert any(expected)
+
+
+@pytest.mark.parametrize("engine", ["row", "column"])
+def test_validate_samples_engines(tmp_path, schema, engine):
+    """Test that engines report the same errors."""
+    if engine == "column":
+        pytest.importorskip("pandas")
+    p = write_samples(tmp_path / "samples.tsv", 1000, bad=(0, 17, 999))
+    expected = validate_samples(p, schema, engine="row")
+    report = validate_samples(p, schema, engine=engine, chunksize=100)
+    assert report == expected
+    report = validate_samples(p, schema, engine=engine, chunksize=7, max_errors=2)
+    assert report.errors == expected.errors[:2]
+    assert report.rows == 18
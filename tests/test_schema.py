@@ -4,15 +4,18 @@ import io
 import sys
 
 import jsonschema
-
-try:
-    import pkg_resources
-except ImportError:
-    from importlib import resources as pkg_resources
 import pytest
 from ruamel.yaml import YAML
 
-from nbis.config import Config, Schema, SchemaFiles
+from nbis import pkgdata
+from nbis.config import (
+    Config,
+    Schema,
+    SchemaFiles,
+    clear_schema_cache,
+    get_schema,
+    read_schema,
+)
 
 _SCHEMA = """$schema: "http://json-schema.org/draft/2020-12/schema#"
 
@@ -60,10 +63,7 @@ webexport:
 @pytest.fixture(scope="session", name="pkg_schemafile")
 def fpkg_schemafile():
     """Pkg schemafile fixture"""
-    try:
-        return pkg_resources.resource_filename("nbis", SchemaFiles.CONFIGURATION_SCHEMA)
-    except AttributeError:
-        return pkg_resources.files("nbis") / SchemaFiles.CONFIGURATION_SCHEMA
+    return pkgdata.path("nbis", SchemaFiles.CONFIGURATION_SCHEMA)
 
 
 @pytest.fixture(scope="session", name="pkg_schema")
@@ -116,3 +116,45 @@ def test_validation_error(schema):
     cfg = Config.from_schema(schema, project_name=123)
     with pytest.raises(jsonschema.exceptions.ValidationError):
         schema.validate(cfg)
+
+
+class TestSchemaCache:
+    """Test schema caching."""
+
+    @pytest.fixture(name="schemafile")
+    def fschemafile(self, tmp_path):
+        """Schema file fixture."""
+        p = tmp_path / "config.schema.yaml"
+        p.write_text(_SCHEMA)
+        return p
+
+    def test_process_cache(self, schemafile):
+        """Test that repeated reads return the cached schema."""
+        schema = read_schema(schemafile)
+        assert read_schema(schemafile) is schema
+        assert read_schema(schemafile, use_cache=False) is not schema
+
+    def test_disk_cache(self, schemafile, cache_dir):
+        """Test that parsed schema is read from disk cache."""
+        schema = read_schema(schemafile)
+        assert len(list(cache_dir.rglob("*.json"))) == 1
+        clear_schema_cache()
+        cached = read_schema(schemafile)
+        assert cached is not schema
+        assert repr(cached) == repr(schema)
+
+    def test_invalidation(self, schemafile):
+        """Test that modified schema files are reparsed."""
+        schema = read_schema(schemafile)
+        schemafile.write_text(_SCHEMA.replace("8080", "18080"))
+        clear_schema_cache()
+        modified = read_schema(schemafile)
+        assert (
+            modified.schema["properties"]["webexport"]["properties"]["port"]["default"]
+            == 18080
+        )
+        assert repr(modified) != repr(schema)
+
+    def test_get_schema(self):
+        """Test that get_schema uses the cache."""
+        assert get_schema() is get_schema()
@@ -14,6 +14,7 @@ expected_init = [
 
 
 expected_add = [
+    "project_foo/.nbis-admin/commandindex.json",
     "project_foo/pyproject.toml",
     "project_foo/src/nbis-admin/workflow/snakemake/commands/smk-run.smk",
     "project_foo/src/nbis-admin/commands/smk.py",
@@ -40,3 +41,34 @@ def test_smk_add(runner, pyproject):
     files = [str(p.relative_to(out.parent)) for p in out.rglob("*") if p.is_file()]
     assert not result.exception
     assert sorted(files) == sorted(expected_add)
+
+
+def test_smk_add_many(runner, pyproject):
+    """Test adding several snakemake commands at once."""
+    out = pyproject
+    config = out / "src" / "nbis-admin" / "snakemake" / "config.py"
+    config.parent.mkdir(parents=True)
+    config.touch()
+    spec = out / "commands.yaml"
+    spec.write_text("- align\n- command: report\n  group: docs\n  quarto: true\n")
+    args = ["smk", "add", "--command", "run", "--command", "qc", "--spec", str(spec)]
+    result = runner.invoke(cli, args)
+    assert not result.exception
+    commands = out / "src" / "nbis-admin" / "commands"
+    smk = (commands / "smk.py").read_text()
+    assert [smk.count(f"def {c}(") for c in ["run", "qc", "align"]] == [1, 1, 1]
+    assert smk.count("@cached_dry_run_option()") == 3
+    compile(smk.replace("nbis-admin", "nbis_admin"), "smk.py", "exec")
+    assert "def quarto(" in (commands / "docs.py").read_text()
+    snakefiles = out / "src" / "nbis-admin" / "workflow" / "snakemake" / "commands"
+    assert sorted(p.name for p in snakefiles.iterdir()) == [
+        "docs-quarto.smk",
+        "smk-align.smk",
+        "smk-qc.smk",
+        "smk-run.smk",
+    ]
+    result = runner.invoke(cli, ["smk", "add", "--command", "run", "--add-test"])
+    assert not result.exception
+    assert (commands / "smk.py").read_text() == smk
+    # Files of skipped commands are left alone
+    assert not (snakefiles / "test-smk-run-config.smk").exists()
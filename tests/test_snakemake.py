@@ -1,17 +1,42 @@
 """Test snakemake module."""
 
+import os
+
 import click
+import pytest
 
+from nbis import snakemake
+from nbis.allocation import Allocation
+from nbis.config import Config
+from nbis.env import Environment
+from nbis.runhistory import RunHistory, RunRecord
 from nbis.snakemake import (
+    ProfileError,
+    ProfileRegistry,
+    cores_option,
+    format_snakemake_help,
+    jobs_option,
     no_profile_option,
     profile_option,
     report_option,
     snakemake_argument_list,
     test_option,
+    threads_option,
 )
 
 
-def test_snakemake_args(runner):
+@pytest.fixture(name="local")
+def flocal(tmp_path, monkeypatch):
+    """Profiles local and test in the current directory."""
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "xdg"))
+    monkeypatch.chdir(tmp_path)
+    for name in ["local", "test"]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "config.yaml").write_text("cores: 1\n")
+    return tmp_path / "local"
+
+
+def test_snakemake_args(runner, local):
     """Test snakemake args."""
 
     @click.command(context_settings={"ignore_unknown_options": True})
@@ -21,15 +46,15 @@ def test_snakemake_args(runner):
         print(profile, list(snakemake_args))
 
     ret = runner.invoke(cmd, [])
-    assert ret.stdout == "['--profile', 'local'] []\n"
+    assert ret.stdout == f"['--profile', '{local}'] []\n"
     ret = runner.invoke(cmd, ["--dry-run", "--printshellcmds"])
-    assert ret.stdout == "['--profile', 'local'] ['--dry-run', '--printshellcmds']\n"
+    assert ret.stdout == f"['--profile', '{local}'] ['--dry-run', '--printshellcmds']\n"
 
 
 class TestProfileOption:
     """Test snakemake profile_option."""
 
-    def test_profile_option(self, runner):
+    def test_profile_option(self, runner, local):
         """Test profile_option."""
 
         @click.command()
@@ -38,11 +63,14 @@ class TestProfileOption:
             print(profile)
 
         ret = runner.invoke(cmd, [])
-        assert ret.stdout == "['--profile', 'local']\n"
+        assert ret.stdout == f"['--profile', '{local}']\n"
         ret = runner.invoke(cmd, ["--profile", "test"])
-        assert ret.stdout == "['--profile', 'test']\n"
+        assert ret.stdout == f"['--profile', '{local.parent / 'test'}']\n"
+        ret = runner.invoke(cmd, ["--profile", "missing"])
+        assert ret.exit_code == 2
+        assert "no such profile missing" in ret.stderr
 
-    def test_no_profile_option(self, runner):
+    def test_no_profile_option(self, runner, local):
         """Test no_profile_option."""
 
         @click.command()
@@ -52,11 +80,117 @@ class TestProfileOption:
             print(profile)
 
         ret = runner.invoke(cmd, [])
-        assert ret.stdout == "['--profile', 'local']\n"
+        assert ret.stdout == f"['--profile', '{local}']\n"
         ret = runner.invoke(cmd, ["--no-profile"])
         assert ret.stdout == "[]\n"
 
 
+class TestProfileRegistry:
+    """Test snakemake profile registry."""
+
+    @pytest.fixture(name="profiles")
+    def fprofiles(self, tmp_path, monkeypatch):
+        """Valid and invalid profiles."""
+        monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "xdg"))
+        good = tmp_path / "config" / "good"
+        good.mkdir(parents=True)
+        (good / "config.yaml").write_text("restart-times: 2\ncores: 4\n")
+        bad = tmp_path / "config" / "bad"
+        bad.mkdir()
+        (bad / "config.yaml").write_text("restart-times: many\n")
+        (tmp_path / "config" / "bare").mkdir()
+        return {
+            "good": "config/good",
+            "bad": "config/bad",
+            "gone": "config/gone",
+            "bare": "config/bare",
+        }
+
+    def test_registry(self, profiles, tmp_path, monkeypatch):
+        """Test resolving, validating and caching profiles."""
+        registry = ProfileRegistry(profiles, home=tmp_path)
+        profile = registry.get("good")
+        assert profile.path == tmp_path / "config" / "good"
+        assert profile.config == {"restart-times": 2, "cores": 4}
+        assert sorted(registry.errors()) == ["bad", "gone"]
+        with pytest.raises(ProfileError, match="restart-times"):
+            registry.get("bad")
+        with pytest.raises(ProfileError, match="no such profile"):
+            registry.get("gone")
+        assert registry.get("unknown") is None
+
+        def fail(*args, **kwargs):
+            raise AssertionError("profile validated again")
+
+        monkeypatch.setattr(snakemake, "get_schema", fail)
+        assert ProfileRegistry(profiles, home=tmp_path).get("good").config == {
+            "restart-times": 2,
+            "cores": 4,
+        }
+
+    def test_profile_option(self, runner, profiles, tmp_path):
+        """Test profile option resolves configured profiles."""
+
+        @click.command()
+        @profile_option()
+        def cmd(profile):
+            print(profile)
+
+        env = Environment()
+        env.home = tmp_path
+        env.config = Config(
+            data={"project_name": "foo", "snakemake_profiles": profiles}
+        )
+        ret = runner.invoke(cmd, ["--profile", "good"], obj=env)
+        assert ret.stdout == f"['--profile', '{tmp_path / 'config' / 'good'}']\n"
+        ret = runner.invoke(cmd, ["--profile", "bad"], obj=env)
+        assert ret.exit_code == 2
+        assert "Invalid value for '--profile'" in ret.stderr
+        # The default profile must exist too
+        ret = runner.invoke(cmd, [], obj=env)
+        assert ret.exit_code == 2
+        assert "no such profile local" in ret.stderr
+
+    def test_profile_option_errors(self, runner, profiles, tmp_path, caplog):
+        """Test that errors in other configured profiles are logged."""
+
+        @click.command()
+        @profile_option()
+        def cmd(profile):
+            print(profile)
+
+        env = Environment()
+        env.home = tmp_path
+        env.config = Config(
+            data={"project_name": "foo", "snakemake_profiles": profiles}
+        )
+        ret = runner.invoke(cmd, ["--profile", "good"], obj=env)
+        assert ret.exit_code == 0
+        assert "restart-times" in caplog.text
+        assert "no such profile directory config/gone" in caplog.text
+
+    def test_bare_profile_directory(self, runner, profiles, tmp_path, caplog):
+        """Test that a directory without config.yaml is accepted with a warning."""
+
+        @click.command()
+        @profile_option()
+        def cmd(profile):
+            print(profile)
+
+        env = Environment()
+        env.home = tmp_path
+        env.config = Config(
+            data={"project_name": "foo", "snakemake_profiles": profiles}
+        )
+        ret = runner.invoke(cmd, ["--profile", "bare"], obj=env)
+        assert ret.exit_code == 0
+        assert ret.stdout == f"['--profile', '{tmp_path / 'config' / 'bare'}']\n"
+        assert "no config.yaml" in caplog.text
+        (tmp_path / "local").mkdir()
+        ret = runner.invoke(cmd, ["--profile", "local"], obj=env)
+        assert ret.stdout == f"['--profile', '{tmp_path / 'local'}']\n"
+
+
 class TestReportOption:
     """Test snakemake report_option."""
 
@@ -73,7 +207,7 @@ class TestReportOption:
         ret = runner.invoke(cmd, ["--report"])
         assert ret.stdout == "['--report', 'report.html']\n"
 
-    def test_report_option_with_profile(self, runner):
+    def test_report_option_with_profile(self, runner, local):
         """Test report option with profile."""
 
         @click.command()
@@ -84,11 +218,69 @@ class TestReportOption:
             print(report, profile)
 
         ret = runner.invoke(cmd, [])
-        assert ret.stdout == "[] ['--profile', 'local']\n"
+        assert ret.stdout == f"[] ['--profile', '{local}']\n"
         ret = runner.invoke(cmd, ["--report"])
         assert ret.stdout == "['--report', 'test.html'] []\n"
 
 
+class TestAutoOptions:
+    """Test automatic cores, jobs and threads."""
+
+    @pytest.fixture(autouse=True)
+    def allocation(self, monkeypatch):
+        """Allocate 4 cpus and 8 GiB."""
+        monkeypatch.setattr(
+            snakemake.allocation,
+            "detect_allocation",
+            lambda: Allocation(4, 8 << 30, "test"),
+        )
+
+    @staticmethod
+    def group():
+        @click.group()
+        def smk():
+            pass
+
+        @smk.command()
+        @cores_option()
+        @jobs_option()
+        @threads_option()
+        def run(cores, jobs, threads):
+            print(cores, jobs, threads)
+
+        return smk
+
+    def test_auto_options(self, runner, caplog):
+        """Test auto values from the allocation."""
+        caplog.set_level("DEBUG", logger="nbis.allocation")
+        args = ["run", "-c", "auto", "-j", "auto", "-t", "auto"]
+        ret = runner.invoke(self.group(), args)
+        assert ret.stdout == "['--cores', '4'] ['--jobs', '4'] ['--threads', '4']\n"
+        assert "auto jobs: 4 from 4 cpus (test)" in caplog.text
+        ret = runner.invoke(self.group(), ["run", "-j", "2"])
+        assert ret.stdout == "[] ['--jobs', '2'] []\n"
+        ret = runner.invoke(self.group(), ["run", "-j", "many"])
+        assert ret.exit_code == 2
+
+    @pytest.mark.parametrize("option", ["-c", "-j", "-t"])
+    def test_zero(self, runner, option):
+        """Test that zero is a usage error."""
+        ret = runner.invoke(self.group(), ["run", option, "0"])
+        assert ret.exit_code == 2
+        assert "0 is smaller than the minimum 1" in ret.stderr
+
+    def test_auto_jobs_history(self, runner, run_history):
+        """Test jobs limited by peak memory of past runs."""
+        history = RunHistory(run_history)
+        for maxrss in [2 << 20, 3 << 20]:
+            history.add(RunRecord("snakemake smk-run", ["snakemake"], maxrss=maxrss))
+        history.add(
+            RunRecord("snakemake smk-run", ["snakemake"], maxrss=8 << 20, returncode=1)
+        )
+        ret = runner.invoke(self.group(), ["run", "-c", "auto", "-j", "auto"])
+        assert ret.stdout == "['--cores', '4'] ['--jobs', '2'] []\n"
+
+
 class TestTestOption:
     """Test snakemake test_option."""
 
@@ -126,3 +318,29 @@ class TestTestOption:
 
         ret = runner.invoke(cmd, ["--test"])
         assert ret.stdout == "['--foo', 'bar', '--config', '__test__=True']\n"
+
+
+def test_format_snakemake_help(tmp_path, monkeypatch):
+    """Test cached snakefile docstring extraction."""
+    smkfile = tmp_path / "run.smk"
+    smkfile.write_text('"""Run workflow\n\nLonger help.\n"""\nrule all:\n    """x"""\n')
+    assert format_snakemake_help(smkfile) == ("Run workflow", "\nLonger help.\n")
+    plain = tmp_path / "plain.smk"
+    plain.write_text("rule all:\n")
+    assert format_snakemake_help(plain) == (None, None)
+    assert format_snakemake_help(plain, default="a\nb") == ("a", "b")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("snakefile read")
+
+    cache_file = tmp_path / "help.json"
+    snakemake.format_snakemake_help(smkfile, cache_file=cache_file)
+    monkeypatch.setattr(snakemake, "read_docstring", fail)
+    monkeypatch.setattr(snakemake, "_DOCSTRINGS", {})
+    monkeypatch.setattr(snakemake, "_HELP_CACHES", {})
+    assert format_snakemake_help(smkfile, cache_file=cache_file)[0] == "Run workflow"
+    monkeypatch.undo()
+    smkfile.write_text('"""Changed\nhelp"""\n')
+    st = smkfile.stat()
+    os.utime(smkfile, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert format_snakemake_help(smkfile, cache_file=cache_file) == ("Changed", "help")
@@ -0,0 +1,50 @@
+"""Test startup profiling."""
+
+import json
+
+from nbis.cli import cli
+from nbis.startup import parse_importtime, profile_startup
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     encodings.aliases
+import time:       300 |        420 |   encodings
+Traceback (most recent call last):
+import time:        50 |        900 | nbis.cli
+"""
+
+
+def test_parse_importtime():
+    """Test parsing of -X importtime output."""
+    records = parse_importtime(IMPORTTIME)
+    assert [(r.module, r.depth) for r in records] == [
+        ("encodings.aliases", 2),
+        ("encodings", 1),
+        ("nbis.cli", 0),
+    ]
+    assert records[1].self_us == 300 and records[1].cumulative_us == 420
+
+
+def test_profile_startup():
+    """Test profiling a command."""
+    profile = profile_startup("nbis.cli:cli", ["config", "--help"])
+    assert profile.exit_code == 0
+    assert profile.first_command is None
+    assert 0 < profile.imported <= profile.finished <= profile.total
+    assert "nbis.cli" in {r.module for r in profile.imports}
+    assert [r.module for r in profile.sorted_imports("module", 2)] == sorted(
+        r.module for r in profile.imports
+    )[:2]
+
+
+def test_debug_startup(runner, tmp_path):
+    """Test debug startup command."""
+    result = runner.invoke(cli, ["debug", "startup", "--json", "--", "add", "--help"])
+    assert not result.exception
+    data = json.loads(result.stdout)
+    assert data["args"] == ["add", "--help"]
+    assert any(c["param"] == "config_file" for c in data["callbacks"])
+    output = tmp_path / "startup.txt"
+    args = ["debug", "startup", "--limit", "1", "-o", str(output)]
+    result = runner.invoke(cli, args)
+    assert not result.exception
+    assert "cumulative" in output.read_text()
@@ -2,13 +2,10 @@
 
 import os
 
-try:
-    import pkg_resources
-except ImportError:
-    from importlib import resources as pkg_resources
 import pytest
+from jinja2 import ModuleLoader
 
-from nbis import wrappers
+from nbis import pkgdata, templates, wrappers
 from nbis.templates import env
 
 if os.getenv("TOX_ENV_NAME") is not None:
@@ -27,15 +24,34 @@ def test_running_slides_template(tmp_path):
             subtitle="Awesome stuff",
             author="John Doe",
             filename=fn,
-            css=[pkg_resources.resource_filename("nbis", "resources/nbis.css")],
+            css=[pkgdata.path("nbis", "resources/nbis.css")],
             csl=(
                 "https://raw.githubusercontent.com/citation-style-language/"
                 "styles/master/apa.csl"
             ),
-            in_header=pkg_resources.resource_filename(
-                "nbis", "resources/nbisfooter.html"
-            ),
+            in_header=pkgdata.path("nbis", "resources/nbisfooter.html"),
             libraries=[],
         )
     )
     wrappers.rmarkdown(p)
+
+
+def test_bytecode_cache(cache_dir):
+    """Test that compiled templates are cached on disk."""
+    environment = templates.make_environment(bundle=None)
+    environment.get_template(".gitignore.j2")
+    assert len(list((cache_dir / "jinja").iterdir())) == 1
+
+
+def test_compile_bundle(tmp_path):
+    """Test that precompiled templates render like template sources."""
+    bundle = templates.compile_bundle(tmp_path / "_templates")
+    source = templates.make_environment(bundle=None, use_cache=False)
+    compiled = templates.make_environment(bundle=bundle, use_cache=False)
+    assert isinstance(compiled.loader.loaders[0], ModuleLoader)
+    names = source.list_templates(filter_func=templates.is_template)
+    assert len(names) == len(list(bundle.glob("*.py")))
+    for name in ["pyproject.toml.j2", "src/python_module/core/options.py.j2"]:
+        assert compiled.get_template(name).render(project_name="foo") == (
+            source.get_template(name).render(project_name="foo")
+        )
@@ -0,0 +1,209 @@
+"""Test webexport."""
+
+import os
+import shutil
+
+import pytest
+
+from nbis import webexport
+from nbis.cli import cli
+
+
+@pytest.fixture(name="builddir")
+def fbuilddir(tmp_path):
+    """Build directory fixture."""
+    p = tmp_path / "build"
+    (p / "figures").mkdir(parents=True)
+    (p / "index.html").write_text("<html>index</html>")
+    (p / "figures" / "fig1.png").write_bytes(b"png1")
+    (p / "figures" / "fig2.png").write_bytes(b"png2")
+    return p
+
+
+def contents(root):
+    """Return dict of relative path to file contents."""
+    return {rel: (root / rel).read_bytes() for rel, _ in webexport.walk(root)}
+
+
+def test_sync_full(builddir, tmp_path):
+    """Test full sync with local backend."""
+    remote = tmp_path / "remote"
+    result = webexport.sync(builddir, str(remote), backend="local")
+    assert contents(remote) == contents(builddir)
+    assert result.target == str(remote)
+    assert (result.files, result.nbytes) == (3, 26)
+
+
+def test_sync_full_index(builddir, tmp_path, monkeypatch):
+    """Test that a full sync counts files from the index scan."""
+    remote = tmp_path / "remote"
+    index = tmp_path / "index.json"
+    walk = webexport.walk
+    walks = []
+    monkeypatch.setattr(
+        webexport, "walk", lambda root: walks.append(root) or walk(root)
+    )
+    # Record walks of sync only, not of the backend
+    monkeypatch.setattr(webexport.LocalBackend, "push", lambda *args, **kw: None)
+    result = webexport.sync(builddir, str(remote), backend="local", index=index)
+    assert (result.files, result.nbytes) == (3, 26)
+    assert walks == [builddir]
+    # The index records the pushed state
+    assert not webexport.SyncIndex(index).delta(builddir)
+
+
+def test_sync_incremental(builddir, tmp_path):
+    """Test incremental sync only transfers changed files."""
+    remote = tmp_path / "remote"
+    index = tmp_path / "index.json"
+    result = webexport.sync(
+        builddir, str(remote), backend="local", incremental=True, index=index
+    )
+    assert result.files == 3
+    assert contents(remote) == contents(builddir)
+
+    # Touch without modification, modify, add and delete files
+    st = (builddir / "index.html").stat()
+    os.utime(builddir / "index.html", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    (builddir / "figures" / "fig1.png").write_bytes(b"png1 modified")
+    (builddir / "figures" / "fig3.png").write_bytes(b"png3")
+    (builddir / "figures" / "fig2.png").unlink()
+    delta = webexport.SyncIndex(index).delta(builddir)
+    assert delta.changed == ["figures/fig1.png", "figures/fig3.png"]
+    assert delta.deleted == ["figures/fig2.png"]
+    assert delta.nbytes == len(b"png1 modified") + len(b"png3")
+
+    # Files changed on the remote are not detected, since the remote
+    # is not scanned
+    (remote / "index.html").write_text("remote change")
+    result = webexport.sync(
+        builddir, str(remote), backend="local", incremental=True, index=index
+    )
+    assert (result.files, result.deleted) == (2, 1)
+    assert (remote / "index.html").read_text() == "remote change"
+    (remote / "index.html").write_text("<html>index</html>")
+    assert contents(remote) == contents(builddir)
+    assert not webexport.SyncIndex(index).delta(builddir)
+
+
+def test_sync_incremental_dry_run(builddir, tmp_path):
+    """Test that dry run neither transfers files nor updates index."""
+    remote = tmp_path / "remote"
+    index = tmp_path / "index.json"
+    webexport.sync(
+        builddir,
+        str(remote),
+        backend="local",
+        incremental=True,
+        index=index,
+        dry_run=True,
+    )
+    assert not remote.exists()
+    assert not index.exists()
+
+
+def test_webexport_sync_command(runner, project_foo, builddir, tmp_path):
+    """Test webexport sync command."""
+    remote = tmp_path / "remote"
+    (project_foo / "project_foo.yaml").write_text(
+        f"project_name: project_foo\nwebexport:\n  url: {remote}\n"
+        f"  builddir: {builddir}\n"
+    )
+    args = ["webexport", "sync", "--backend", "local", "--incremental"]
+    result = runner.invoke(cli, args)
+    assert not result.exception
+    assert contents(remote) == contents(builddir)
+    assert len(list((project_foo / ".nbis-admin" / "webexport").iterdir())) == 1
+
+
+@pytest.mark.skipif(shutil.which("rsync") is None, reason="rsync not installed")
+def test_sync_incremental_rsync(builddir, tmp_path):
+    """Test incremental sync with rsync to local directory."""
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    index = tmp_path / "index.json"
+    webexport.sync(builddir, str(remote), incremental=True, index=index)
+    assert contents(remote) == contents(builddir)
+    (builddir / "figures" / "fig2.png").unlink()
+    (builddir / "figures" / "fig3.png").write_bytes(b"png3")
+    webexport.sync(builddir, str(remote), incremental=True, index=index)
+    assert contents(remote) == contents(builddir)
+
+
+def test_sync_many(builddir, tmp_path):
+    """Test concurrent push to several targets, one job per shard."""
+    (builddir / "other").mkdir()
+    (builddir / "other" / "page.html").write_text("<html>page</html>")
+    urls = [str(tmp_path / "remote1"), str(tmp_path / "remote2")]
+    jobs = webexport.plan(tmp_path, builddir, urls, include=["figures", "other/"])
+    assert [job.target for job in jobs] == [
+        f"{urls[0]}/figures",
+        f"{urls[0]}/other",
+        f"{urls[1]}/figures",
+        f"{urls[1]}/other",
+    ]
+    assert len({job.index for job in jobs}) == 4
+    results = webexport.sync_many(jobs, workers=2, backend="local", incremental=True)
+    assert all(r.ok for r in results)
+    assert [r.files for r in results] == [2, 1, 2, 1]
+    for url in urls:
+        remote = tmp_path / url
+        assert contents(remote) == {
+            k: v for k, v in contents(builddir).items() if k != "index.html"
+        }
+
+
+class FlakyBackend(webexport.LocalBackend):
+    """Local backend that fails a number of times before succeeding."""
+
+    failures = 0
+
+    def push(self, src, dest, files=None, deleted=(), dry_run=False):
+        if FlakyBackend.failures > 0:
+            FlakyBackend.failures -= 1
+            raise OSError("connection reset")
+        super().push(src, dest, files=files, deleted=deleted, dry_run=dry_run)
+
+
+@pytest.fixture(name="flaky")
+def fflaky(monkeypatch):
+    """Register flaky backend.
+
+    The backend replaces the local backend, since the command backend
+    choices are fixed once the command module is imported.
+    """
+    monkeypatch.setitem(webexport.BACKENDS, "local", FlakyBackend)
+    monkeypatch.setattr(FlakyBackend, "failures", 0)
+    return FlakyBackend
+
+
+def test_sync_retry(builddir, tmp_path, flaky):
+    """Test that failed pushes are retried and failures are reported."""
+    job = webexport.plan(tmp_path, builddir, [str(tmp_path / "remote")])[0]
+    flaky.failures = 2
+    result = webexport.sync_retry(job, retries=2, backoff=0, backend="local")
+    assert result.ok
+    assert result.attempts == 3
+    assert contents(tmp_path / "remote") == contents(builddir)
+    flaky.failures = 3
+    result = webexport.sync_retry(job, retries=2, backoff=0, backend="local")
+    assert not result.ok
+    assert result.attempts == 3
+    assert result.error == "connection reset"
+
+
+def test_webexport_sync_command_many(runner, project_foo, builddir, tmp_path, flaky):
+    """Test webexport sync command with several targets and a failure."""
+    (project_foo / "project_foo.yaml").write_text(
+        f"project_name: project_foo\nwebexport:\n  builddir: {builddir}\n"
+    )
+    urls = [str(tmp_path / "remote1"), str(tmp_path / "remote2")]
+    args = ["webexport", "sync", "--backend", "local", "--backoff", "0"]
+    args += ["--url", urls[0], "--url", urls[1]]
+    result = runner.invoke(cli, args)
+    assert not result.exception
+    assert urls[0] in result.output and urls[1] in result.output
+    flaky.failures = 10
+    result = runner.invoke(cli, args + ["--retries", "1"])
+    assert result.exit_code == 1
+    assert "2 of 2 pushes failed" in result.stderr
@@ -0,0 +1,179 @@
+"""Test command wrappers."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from nbis import wrappers
+
+SCRIPT = """
+import sys
+print("out 1", flush=True)
+print("err 1", file=sys.stderr, flush=True)
+print("out 2", flush=True)
+sys.exit(int(sys.argv[1]))
+"""
+
+
+def test_run_stream(tmp_path):
+    """Test that output is streamed to callback and teed to log."""
+    lines = []
+    logfile = tmp_path / "logs" / "run.log"
+    result = wrappers.run(
+        [sys.executable, "-c", SCRIPT, "0"],
+        callback=lambda stream, line: lines.append((stream, line)),
+        logfile=logfile,
+    )
+    assert result.ok
+    assert result.seconds > 0
+    assert result.maxrss > 0
+    assert [x for x in lines if x[0] == "stdout"] == [
+        ("stdout", "out 1\n"),
+        ("stdout", "out 2\n"),
+    ]
+    assert ("stderr", "err 1\n") in lines
+    log = logfile.read_text()
+    assert "stdout out 2" in log
+    assert "stderr err 1" in log
+
+
+def test_run_fail():
+    """Test non-zero exit code."""
+    args = [sys.executable, "-c", SCRIPT, "3"]
+    with pytest.raises(subprocess.CalledProcessError):
+        wrappers.run(args, callback=None)
+    result = wrappers.run(args, callback=None, check=False)
+    assert result.returncode == 3
+
+
+def test_process_iter():
+    """Test iterating over process output."""
+    proc = wrappers.Process([sys.executable, "-c", SCRIPT, "0"])
+    assert sorted(line for _, line in proc) == ["err 1\n", "out 1\n", "out 2\n"]
+    assert proc.result.ok
+
+
+def test_process_invalid_utf8():
+    """Test that output that is not valid UTF-8 does not hang."""
+    script = "import sys; sys.stdout.buffer.write(b'ok \\xff\\xfe\\n')"
+    proc = wrappers.Process([sys.executable, "-c", script])
+    assert list(proc) == [("stdout", "ok \ufffd\ufffd\n")]
+    assert proc.result.ok
+
+
+@pytest.mark.parametrize(
+    "args,expected",
+    [
+        (None, []),
+        ("-j 2 --profile 'my profile'", ["-j", "2", "--profile", "my profile"]),
+        (["-j", 2], ["-j", "2"]),
+    ],
+)
+def test_split_args(args, expected):
+    """Test splitting of argument strings."""
+    assert wrappers.split_args(args) == expected
+
+
+def test_pandoc_keywords(monkeypatch):
+    """Test that pypandoc keyword arguments map onto pandoc arguments."""
+    calls = []
+    monkeypatch.setattr(wrappers.pypandoc, "get_pandoc_path", lambda: "pandoc")
+    monkeypatch.setattr(wrappers, "run", lambda args, **kw: calls.append((args, kw)))
+    wrappers.pandoc(
+        "doc.md",
+        "doc.html",
+        to="html5",
+        format="gfm",
+        extra_args=["--toc"],
+        filters=["pandoc-crossref", "fix.lua"],
+        cworkdir="docs",
+        verify_format=False,
+    )
+    assert calls == [
+        (
+            [
+                "pandoc",
+                "doc.md",
+                "-o",
+                "doc.html",
+                "-t",
+                "html5",
+                "-f",
+                "gfm",
+                "--toc",
+                "--filter=pandoc-crossref",
+                "--lua-filter=fix.lua",
+            ],
+            {"cwd": "docs"},
+        )
+    ]
+
+
+def test_snakemake(monkeypatch):
+    """Test snakemake argument list."""
+    calls = []
+    monkeypatch.setattr(wrappers.shutil, "which", lambda cmd: cmd)
+    monkeypatch.setattr(wrappers, "run", lambda args, **kw: calls.append(args))
+    wrappers.snakemake(options="-j 2 --config 'a=b c'", snakefile="Snakefile")
+    assert calls == [["snakemake", "-s", "Snakefile", "-j", "2", "--config", "a=b c"]]
+
+
+def test_snakemake_api(tmp_path, monkeypatch):
+    """Test in-process snakemake reuses parsed dry run workflows."""
+    pytest.importorskip("snakemake.api")
+    smkfile = tmp_path / "Snakefile"
+    smkfile.write_text('rule a:\n    output: "a.txt"\n    shell: "touch {output}"\n')
+    monkeypatch.setattr(wrappers, "_SESSION", None)
+    session = wrappers.snakemake_session()
+    workflows = []
+    workflow = session.workflow
+    monkeypatch.setattr(
+        session,
+        "workflow",
+        lambda **kw: workflows.append(workflow(**kw)) or workflows[-1],
+    )
+    cwd = os.getcwd()
+    options = ["-n", "-c1", "-d", str(tmp_path)]
+    try:
+        for _ in range(2):
+            result = wrappers.snakemake(
+                engine="api", options=options, targets="a.txt", snakefile=smkfile
+            )
+            assert result.ok
+            assert os.getcwd() == cwd
+        assert workflows[0] is workflows[1]
+        assert len(session._workflows) == 1
+        smkfile.write_text(smkfile.read_text() + "\nrule b:\n    output: 'b.txt'\n")
+        os.utime(smkfile, ns=(0, 0))
+        wrappers.snakemake(engine="api", options=options, snakefile=smkfile)
+        assert workflows[2] is not workflows[1]
+        with pytest.raises(subprocess.CalledProcessError):
+            wrappers.snakemake(
+                engine="api", options=options, targets="c.txt", snakefile=smkfile
+            )
+    finally:
+        session.close()
+    assert not session._workflows
+
+
+def test_snakemake_engine():
+    """Test unknown snakemake engine."""
+    with pytest.raises(ValueError):
+        wrappers.snakemake(engine="foo")
+    with pytest.raises(TypeError, match="callback, logfile"):
+        wrappers.snakemake(engine="api", callback=None, logfile="run.log")
+
+
+def test_snakemake_api_unsupported(monkeypatch):
+    """Test fallback to the snakemake executable for unsupported versions."""
+    snakemake = pytest.importorskip("snakemake")
+    assert wrappers.snakemake_api_supported()
+    monkeypatch.setattr(snakemake, "__version__", "10.0.0")
+    assert not wrappers.snakemake_api_supported()
+    calls = []
+    monkeypatch.setattr(wrappers.shutil, "which", lambda cmd: cmd)
+    monkeypatch.setattr(wrappers, "run", lambda args, **kw: calls.append(args))
+    wrappers.snakemake(engine="api", options="-n", snakefile="Snakefile")
+    assert calls == [["snakemake", "-s", "Snakefile", "-n"]]